@@ -0,0 +1,194 @@
+import glob
+import json
+import os
+from PySide2.QtWidgets import QWidget
+from PySide2.QtCore import QObject, QThread, QTimer, Signal
+from PySide2.QtWebEngineCore import QWebEngineUrlRequestInterceptor, QWebEngineUrlRequestInfo
+from filter_index import FilterIndex, compile_filters
+from settings import settings
+from storage import data_path
+
+# Qt 的资源类型对应的过滤规则类型
+RESOURCE_TYPES = {
+    QWebEngineUrlRequestInfo.ResourceTypeMainFrame: "document",
+    QWebEngineUrlRequestInfo.ResourceTypeSubFrame: "subdocument",
+    QWebEngineUrlRequestInfo.ResourceTypeStylesheet: "stylesheet",
+    QWebEngineUrlRequestInfo.ResourceTypeScript: "script",
+    QWebEngineUrlRequestInfo.ResourceTypeImage: "image",
+    QWebEngineUrlRequestInfo.ResourceTypeFavicon: "image",
+    QWebEngineUrlRequestInfo.ResourceTypeFontResource: "font",
+    QWebEngineUrlRequestInfo.ResourceTypeObject: "object",
+    QWebEngineUrlRequestInfo.ResourceTypePluginResource: "object",
+    QWebEngineUrlRequestInfo.ResourceTypeMedia: "media",
+    QWebEngineUrlRequestInfo.ResourceTypeXhr: "xmlhttprequest",
+    QWebEngineUrlRequestInfo.ResourceTypePing: "ping",
+    QWebEngineUrlRequestInfo.ResourceTypeCspReport: "ping",
+}
+
+
+class FilterCompiler(QThread):
+    """在后台线程中编译过滤列表"""
+
+    compiled = Signal(bool)
+
+    def __init__(self, sources, path, meta, parent=None):
+        super().__init__(parent)
+        self.sources = sources
+        self.path = path
+        self.meta = meta
+
+    def run(self):
+        try:
+            compile_filters(self.sources, self.path, self.meta)
+        except OSError:
+            self.compiled.emit(False)
+            return
+        self.compiled.emit(True)
+
+
+class PageFilter(QWebEngineUrlRequestInterceptor):
+    """单个标签页的请求拦截器，统计该页面拦截的请求数"""
+
+    def __init__(self, content_filter, browser):
+        super().__init__(browser)
+        self.content_filter = content_filter
+        self.browser = browser
+        # 当前页面和整个标签页生命周期内拦截的请求数
+        self.blocked = 0
+        self.total_blocked = 0
+
+    def interceptRequest(self, info):
+        resource_type = RESOURCE_TYPES.get(info.resourceType(), "other")
+        if resource_type == "document" and self.blocked:
+            # 打开新页面，重新计数
+            self.blocked = 0
+            self.content_filter.blocked_changed.emit(self.browser)
+
+        index = self.content_filter.index
+        if index is None or not self.content_filter.enabled:
+            return
+        if index.should_block(info.requestUrl().toString(), info.firstPartyUrl().toString(), resource_type):
+            info.block(True)
+            self.blocked += 1
+            self.total_blocked += 1
+            self.content_filter.blocked_changed.emit(self.browser)
+
+
+class ContentFilter(QObject):
+    """广告和跟踪器拦截
+
+    过滤列表(EasyList 或 hosts 格式)放在数据目录的 adblock 文件夹中，
+    或在设置 adblock/lists 中指定。列表有变化时在后台编译为索引文件，
+    之后每次启动只需内存映射该文件。
+    """
+
+    # 某个标签页的拦截计数发生了变化
+    blocked_changed = Signal(QWidget)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.enabled = settings.bool_value("adblock/enabled", True)
+        self.index = None
+        self.compiler = None
+        self.list_dir = data_path("adblock")
+        # 索引文件名带有代数 adblock-<代数>.idx。Windows 上已内存映射的文件不能被替换，
+        # 所以每次编译写入下一代的新文件，编译完成后再换过去
+        self.index_path = None
+
+        # 打开索引不在启动的关键路径上
+        QTimer.singleShot(0, self.load)
+
+    def sources(self):
+        """全部过滤列表文件"""
+        lists = settings.list_value("adblock/lists")
+        files = sorted(glob.glob(os.path.join(self.list_dir, "*.txt")))
+        return files + [path for path in lists if os.path.isfile(path)]
+
+    def signature(self, sources):
+        """过滤列表的路径、大小和修改时间，用于判断索引是否过期"""
+        stats = [(path, os.path.getsize(path), int(os.path.getmtime(path))) for path in sources]
+        return json.dumps(stats)
+
+    def index_files(self):
+        """数据目录中的全部索引文件 [(代数, 路径)]，从旧到新排列"""
+        files = []
+        for path in glob.glob(data_path("adblock-*.idx")):
+            generation = os.path.basename(path)[len("adblock-"):-len(".idx")]
+            if generation.isdigit():
+                files.append((int(generation), path))
+        return sorted(files)
+
+    def open_index(self, path):
+        """打开索引文件，文件损坏或无法读取时返回 None"""
+        try:
+            return FilterIndex(path)
+        except (OSError, ValueError):
+            return None
+
+    def remove_old_indexes(self):
+        """删除当前索引之外的索引文件
+
+        仍被映射的旧文件在 Windows 上删不掉，留到下次启动再删。
+        """
+        for path in [path for _, path in self.index_files()] + [data_path("adblock.idx")]:
+            if path != self.index_path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def load(self):
+        """打开索引，过滤列表有变化时在后台重新编译"""
+        os.makedirs(self.list_dir, exist_ok=True)
+        sources = self.sources()
+        signature = self.signature(sources)
+        files = self.index_files()
+
+        if self.index is None and files:
+            self.index_path = files[-1][1]
+            self.index = self.open_index(self.index_path)
+            self.remove_old_indexes()
+
+        if not sources:
+            self.set_index(None)
+        elif (self.index is None or self.index.meta != signature) and self.compiler is None:
+            # 编译期间继续使用旧索引；新索引写到下一代的文件中
+            generation = files[-1][0] + 1 if files else 1
+            path = data_path(f"adblock-{generation}.idx")
+            self.compiler = FilterCompiler(sources, path, signature, self)
+            self.compiler.compiled.connect(self.compiled)
+            self.compiler.start()
+
+    def compiled(self, ok):
+        path = self.compiler.path
+        self.compiler = None
+        index = self.open_index(path) if ok else None
+        if index is None:
+            # 编译失败或新文件打不开时继续使用旧索引
+            return
+        self.index_path = path
+        self.set_index(index)
+        self.remove_old_indexes()
+
+    def set_index(self, index):
+        """换上新的索引
+
+        IO 线程中的拦截器可能正在查询旧索引，不能在这里关闭；拦截器只持有
+        局部引用，最后一个引用释放时内存映射随之解除。
+        """
+        self.index = index
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        settings.set_value("adblock/enabled", enabled)
+
+    def install(self, browser):
+        """为标签页的页面安装请求拦截器"""
+        page_filter = PageFilter(self, browser)
+        browser.page().setUrlRequestInterceptor(page_filter)
+        browser.request_filter = page_filter
+
+    def blocked_count(self, browser):
+        """标签页当前页面拦截的请求数"""
+        page_filter = getattr(browser, "request_filter", None)
+        return page_filter.blocked if page_filter else 0
@@ -0,0 +1,144 @@
+"""过滤规则索引的性能测试
+
+生成 10 万条规则的过滤列表和一组 URL，测量编译、加载和逐条匹配的耗时。
+用法: python benchmarks/bench_adblock.py [--rules 100000] [--urls 20000]
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from harness import benchmark, median, percentile
+from filter_index import FilterIndex, compile_filters
+
+TLDS = ["com", "net", "org", "cn", "io", "co.uk", "de"]
+TYPES = ["script", "image", "stylesheet", "xmlhttprequest", "subdocument", "media", "other"]
+WORDS = ["ads", "banner", "track", "pixel", "analytics", "beacon", "promo", "sponsor",
+         "static", "cdn", "img", "assets", "api", "media", "video", "news", "user", "login"]
+
+
+def random_word(rng, low=4, high=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def random_host(rng):
+    return f"{random_word(rng)}.{rng.choice(TLDS)}"
+
+
+def generate_rules(rng, count):
+    """大致按 EasyList 的构成生成规则: 大部分为域名规则，其余为子串规则和例外"""
+    hosts = []
+    lines = ["[Adblock Plus 2.0]", "! 合成的测试规则"]
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.55:
+            host = random_host(rng)
+            hosts.append(host)
+            option = rng.choice(["", "", "$third-party", "$script,image", "$~xmlhttprequest"])
+            lines.append(f"||{host}^{option}")
+        elif kind < 0.65:
+            host = random_host(rng)
+            hosts.append(host)
+            lines.append(f"0.0.0.0 {host}")
+        elif kind < 0.92:
+            path = "/".join(rng.choice(WORDS) + random_word(rng, 2, 5) for _ in range(rng.randint(1, 3)))
+            suffix = rng.choice(["", ".js", ".gif", "^", "*.php"])
+            option = rng.choice(["", "", f"${rng.choice(TYPES)}", "$third-party",
+                                 f"$domain={random_host(rng)}|~{random_host(rng)}"])
+            lines.append(f"/{path}{suffix}{option}")
+        elif kind < 0.97:
+            lines.append(f"@@||{random_host(rng)}/{rng.choice(WORDS)}$script")
+        else:
+            lines.append(f"example.com##.{random_word(rng)}")
+    return lines, hosts
+
+
+def generate_urls(rng, count, hosts):
+    """URL 语料: 约两成请求指向规则中的域名"""
+    urls = []
+    for _ in range(count):
+        if hosts and rng.random() < 0.2:
+            host = rng.choice(hosts)
+            if rng.random() < 0.5:
+                host = f"{rng.choice(WORDS)}.{host}"
+        else:
+            host = f"{rng.choice(WORDS)}.{random_host(rng)}"
+        path = "/".join(rng.choice(WORDS) + random_word(rng, 0, 6) for _ in range(rng.randint(1, 5)))
+        query = f"?id={rng.randint(1, 10 ** 6)}&ref={random_word(rng)}" if rng.random() < 0.5 else ""
+        page = f"https://{random_host(rng)}/"
+        urls.append((f"https://{host}/{path}{query}", page, rng.choice(TYPES)))
+    return urls
+
+
+def run(rule_count, url_count, seed=1):
+    """编译并加载规则，逐条匹配 URL，返回各项结果"""
+    rng = random.Random(seed)
+    lines, hosts = generate_rules(rng, rule_count)
+    urls = generate_urls(rng, url_count, hosts)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, "filters.txt")
+        index_path = os.path.join(temp_dir, "filters.idx")
+        with open(source, "w") as f:
+            f.write("\n".join(lines))
+
+        start = time.perf_counter()
+        stats = compile_filters([source], index_path)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = FilterIndex(index_path)
+        load_time = time.perf_counter() - start
+
+        timings = []
+        blocked = 0
+        for url, page, resource_type in urls:
+            start = time.perf_counter()
+            if index.should_block(url, page, resource_type):
+                blocked += 1
+            timings.append(time.perf_counter() - start)
+        state_count = index.state_count
+        index.close()
+
+        return {
+            "stats": stats,
+            "compile_s": compile_time,
+            "index_mb": os.path.getsize(index_path) / 1024 / 1024,
+            "states": state_count,
+            "load_ms": load_time * 1000,
+            "match_us": [t * 1e6 for t in timings],
+            "blocked": blocked,
+        }
+
+
+@benchmark("adblock", qt=False)
+def bench_adblock(context):
+    result = run(100000, 5000 if context.quick else 20000)
+    context.record("adblock.compile_s", result["compile_s"], "s")
+    context.record("adblock.load_ms", result["load_ms"])
+    context.record("adblock.match.median_us", median(result["match_us"]), "us")
+    context.record("adblock.match.p99_us", percentile(result["match_us"], 0.99), "us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, default=100000)
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    result = run(args.rules, args.urls, args.seed)
+    stats = result["stats"]
+    timings = result["match_us"]
+    print(f"规则: {stats['rules']} 条 (域名 {stats['domains']}, 子串 {stats['patterns']}, "
+          f"无关键字 {stats['generic']}, 不支持 {stats['unsupported']})")
+    print(f"编译: {result['compile_s']:.2f} s, 索引 {result['index_mb']:.1f} MB, 自动机 {result['states']} 个状态")
+    print(f"加载: {result['load_ms']:.2f} ms")
+    print(f"匹配 {len(timings)} 个 URL: 平均 {sum(timings) / len(timings):.1f} us, "
+          f"p50 {median(timings):.1f} us, p99 {percentile(timings, 0.99):.1f} us, 拦截 {result['blocked']} 个")
+
+
+if __name__ == "__main__":
+    main()
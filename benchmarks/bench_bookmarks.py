@@ -0,0 +1,47 @@
+"""书签: 测量添加、修改、记录访问和删除在界面线程上的耗时，以及后台写入的提交耗时"""
+import time
+from harness import benchmark, elapsed_ms, process_events
+from bookmarks import BookmarkManager
+
+
+@benchmark("bookmarks")
+def bench_bookmarks(context):
+    manager = BookmarkManager()
+    store = manager.store
+    total = 200 if context.quick else 1000
+    existing = list(store.bookmarks)
+
+    start = time.perf_counter()
+    added = [manager.add_bookmark(f"书签 {i}", f"https://bookmark{i}.example.com/") for i in range(total)]
+    context.record("bookmarks.add_bookmark.per_op_us", elapsed_ms(start) * 1000 / total, "us")
+
+    start = time.perf_counter()
+    for i, bookmark in enumerate(added):
+        store.update(bookmark, title=f"修改后的书签 {i}")
+    context.record("bookmarks.update.per_op_us", elapsed_ms(start) * 1000 / total, "us")
+
+    start = time.perf_counter()
+    for bookmark in added:
+        manager.record_visit(bookmark.url)
+    context.record("bookmarks.record_visit.per_op_us", elapsed_ms(start) * 1000 / total, "us")
+
+    # 通过界面删除: 选中第一条新书签再删除
+    model = manager.bookmark_model
+    while model.canFetchMore():
+        model.fetchMore()
+    start = time.perf_counter()
+    for _ in range(total):
+        manager.bookmark_view.setCurrentIndex(model.index(len(existing), 0))
+        manager.remove_bookmark()
+    context.record("bookmarks.remove_bookmark.per_op_us", elapsed_ms(start) * 1000 / total, "us")
+
+    start = time.perf_counter()
+    store.flush(timeout=None)
+    context.record("bookmarks.flush_ms", elapsed_ms(start))
+    stats = store.writer.stats()
+    context.record("bookmarks.writer.max_queue_depth", stats["max_queue_depth"], "条")
+    context.record("bookmarks.writer.avg_flush_ms", stats["avg_flush_ms"])
+
+    store.close()
+    manager.deleteLater()
+    process_events()
@@ -0,0 +1,68 @@
+"""HTTP 下载: 分段下载、暂停后继续、服务器忽略 Range 时退回单段下载"""
+import os
+import shutil
+import tempfile
+import time
+from harness import benchmark, elapsed_ms, wait_for
+from server import file_body
+
+
+def download(manager, context, path, size, directory, segments=4, limit=0, pause_at=None):
+    """下载一个文件并核对内容，返回 (任务, 耗时毫秒)"""
+    from PySide2.QtCore import QUrl
+    from downloads import FINISHED, PAUSED
+
+    target = os.path.join(directory, f"{os.path.basename(path)}-{time.perf_counter_ns()}")
+    start = time.perf_counter()
+    job = manager.add_url(QUrl(context.url(f"{path}/{size}")), target, segments)
+    manager.set_job_limit(job, limit)
+    if pause_at is not None:
+        if not wait_for(lambda: job.received() >= pause_at or job.is_done()):
+            raise RuntimeError("下载没有开始")
+        manager.pause(job)
+        if job.state != PAUSED:
+            raise RuntimeError(f"暂停失败: {job.state}")
+        manager.set_job_limit(job, 0)
+        manager.resume(job)
+    if not wait_for(job.is_done, timeout=120000):
+        raise RuntimeError(f"{path} 没有在超时之前完成")
+    elapsed = elapsed_ms(start)
+    if job.state != FINISHED:
+        raise RuntimeError(f"{path} 下载失败: {job.error}")
+    with open(target, "rb") as f:
+        if f.read() != file_body(size):
+            raise RuntimeError(f"{path} 的内容与服务器不一致")
+    return job, elapsed
+
+
+@benchmark("downloads")
+def bench_downloads(context):
+    from downloads import DownloadManager, MIN_SEGMENT
+
+    size = (4 if context.quick else 16) * MIN_SEGMENT
+    directory = tempfile.mkdtemp(prefix="safan-downloads-")
+    manager = DownloadManager()
+    try:
+        for segments in (1, 4):
+            job, elapsed = download(manager, context, "/files", size, directory, segments)
+            if len(job.segments) != segments:
+                raise RuntimeError(f"应分为 {segments} 段，实际 {len(job.segments)} 段")
+            context.record(f"downloads.segments_{segments}.mb_per_second",
+                           size / MIN_SEGMENT / (elapsed / 1000), "MB/秒", lower_is_better=False)
+
+        # 限速让暂停时各段都只下载了一部分，继续时从各段的当前位置发起 Range 请求
+        _, elapsed = download(manager, context, "/files", size, directory, limit=size * 2, pause_at=size // 3)
+        context.record("downloads.pause_resume_ms", elapsed)
+
+        # HEAD 声称支持 Range，GET 却返回整个文件，应丢弃分段改为从头单段下载
+        job, elapsed = download(manager, context, "/files-norange", size, directory)
+        if job.ranges or len(job.segments) != 1:
+            raise RuntimeError("服务器忽略 Range 时没有退回单段下载")
+        context.record("downloads.norange_fallback_ms", elapsed)
+
+        _, elapsed = download(manager, context, "/files-norange", size, directory, limit=size * 2,
+                              pause_at=size // 3)
+        context.record("downloads.norange_pause_resume_ms", elapsed)
+    finally:
+        manager.deleteLater()
+        shutil.rmtree(directory, ignore_errors=True)
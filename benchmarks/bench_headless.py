@@ -0,0 +1,48 @@
+"""批量渲染: 不同渲染池大小下的吞吐量"""
+import os
+import shutil
+import tempfile
+from harness import benchmark, median, wait_for
+from headless import RenderPool
+
+
+def render_all(urls, concurrency, output_dir):
+    """渲染一组网址，返回 (渲染池的统计, 结果列表)"""
+    results = []
+    pool = RenderPool(urls, concurrency, output_dir)
+    pool.result_ready.connect(results.append)
+    done = []
+    pool.finished.connect(lambda: done.append(True))
+    pool.start()
+    if not wait_for(lambda: done, timeout=300000):
+        raise RuntimeError(f"渲染池 {concurrency} 没有在超时之前完成")
+    pool.deleteLater()
+    return pool.summary(), results
+
+
+@benchmark("headless")
+def bench_headless(context):
+    count = 8 if context.quick else 32
+    output_dir = tempfile.mkdtemp(prefix="safan-headless-")
+    try:
+        # /slow/ 的页面有固定的响应延迟，渲染池越大越能重叠等待的时间
+        baseline = None
+        for concurrency in (1, 4) if context.quick else (1, 2, 4, 8):
+            urls = [context.url(f"/slow/{concurrency}/{i}") for i in range(count)]
+            summary, results = render_all(urls, concurrency, output_dir)
+            failed = [result for result in results if result.status != "ok"]
+            if failed:
+                raise RuntimeError(f"{len(failed)} 个页面渲染失败: {failed[0].url} {failed[0].error}")
+            if not all(os.path.getsize(result.png) for result in results):
+                raise RuntimeError("截图为空")
+
+            pages_per_second = summary["pages_per_second"]
+            baseline = baseline or pages_per_second
+            context.record(f"headless.pool_{concurrency}.pages_per_second", pages_per_second, "页/秒",
+                           lower_is_better=False)
+            context.record(f"headless.pool_{concurrency}.load_median_ms",
+                           median([result.load_ms for result in results]))
+            context.record(f"headless.pool_{concurrency}.speedup", pages_per_second / baseline, "倍",
+                           lower_is_better=False)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
@@ -0,0 +1,39 @@
+"""历史记录: add_history_entry 的写入速度和 load_history 的加载时间"""
+import time
+from harness import benchmark, elapsed_ms, process_events
+from history import HistoryManager
+
+
+@benchmark("history")
+def bench_history(context):
+    manager = HistoryManager()
+    model = manager.history_model
+
+    for total in (1000, 10000) if context.quick else (1000, 100000):
+        manager.store.clear()
+
+        start = time.perf_counter()
+        for i in range(total):
+            manager.add_history_entry(f"https://site{i % 500}.example.com/page/{i}", f"页面 {i}")
+        manager.store.flush(timeout=None)
+        context.record(f"history.add_history_entry.{total}.per_entry_us", elapsed_ms(start) * 1000 / total, "us")
+        stats = manager.store.writer.stats()
+        context.record(f"history.writer.{total}.max_queue_depth", stats["max_queue_depth"], "条")
+        context.record(f"history.writer.{total}.avg_flush_ms", stats["avg_flush_ms"])
+
+        # 打开历史记录窗口时: 重置模型并取回第一页
+        start = time.perf_counter()
+        manager.load_history()
+        model.fetchMore()
+        context.record(f"history.load_history.{total}.first_page_ms", elapsed_ms(start))
+
+        # 一直滚动到底
+        start = time.perf_counter()
+        while model.canFetchMore():
+            model.fetchMore()
+        context.record(f"history.load_history.{total}.all_pages_ms", elapsed_ms(start))
+
+    manager.store.clear()
+    manager.store.close()
+    manager.deleteLater()
+    process_events()
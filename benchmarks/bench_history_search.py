@@ -0,0 +1,49 @@
+"""历史记录全文搜索: 建立索引的速度和查询延迟"""
+import os
+import random
+import shutil
+import tempfile
+import time
+from harness import benchmark, elapsed_ms, median, percentile
+from search_index import SearchIndex
+
+WORDS = ["python", "qt", "browser", "download", "news", "weather", "map", "music", "video", "tutorial",
+         "浏览器", "测试", "文档", "新闻", "天气", "地图", "音乐", "视频", "教程", "编程", "数据库", "搜索"]
+QUERIES = ["python", "浏览器", "测试 教程", "qt 地图 编程", "site42", "页面12345", "数", "weath"]
+
+
+@benchmark("history_search", qt=False)
+def bench_history_search(context):
+    rng = random.Random(1)
+    temp_dir = tempfile.mkdtemp(prefix="safan-search-")
+    index = SearchIndex(os.path.join(temp_dir, "history-search.db"))
+
+    total = 10000 if context.quick else 100000
+    start = time.perf_counter()
+    for i in range(total):
+        url = f"https://site{i % 500}.example.com/page/{i}"
+        index.add_visit(url, " ".join(rng.choice(WORDS) for _ in range(4)) + f" 页面{i}", 1e9 + i)
+        # 一成的页面带有正文
+        if i % 10 == 0:
+            index.set_text(url, " ".join(rng.choice(WORDS) for _ in range(300)))
+        if i % 1000 == 999:
+            index.commit()
+    index.commit()
+    context.record(f"history_search.index.{total}.per_page_us", elapsed_ms(start) * 1000 / total, "us")
+
+    timings = []
+    for _ in range(5):
+        for query in QUERIES:
+            start = time.perf_counter()
+            index.search(query, 0, 50)
+            timings.append(elapsed_ms(start))
+    context.record(f"history_search.query.{total}.median_ms", median(timings))
+    context.record(f"history_search.query.{total}.p95_ms", percentile(timings, 0.95))
+
+    # 翻到第 10 页
+    start = time.perf_counter()
+    index.search("python", 450, 50)
+    context.record(f"history_search.query.{total}.page_10_ms", elapsed_ms(start))
+
+    index.close()
+    shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,107 @@
+"""导入书签和历史记录: 大文件的解析和写入耗时，以及解析时的内存峰值"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from harness import benchmark, elapsed_ms
+from bookmark_store import Bookmark, BookmarkStore
+from history_store import HistoryStore
+from import_formats import (read_chrome_bookmarks, read_firefox_history, read_netscape_bookmarks,
+                            write_chrome_bookmarks, write_netscape_bookmarks)
+
+BATCH = 1000
+
+
+def import_in_batches(entries, consume):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH:
+            consume(batch)
+            batch = []
+    if batch:
+        consume(batch)
+
+
+def measure_parse(reader, path):
+    """只解析不写入，返回 (条数, 耗时, 内存峰值)；tracemalloc 会拖慢解析，内存单独再解析一遍测量"""
+    start = time.perf_counter()
+    count = sum(1 for _ in reader(path))
+    elapsed = elapsed_ms(start)
+
+    tracemalloc.start()
+    sum(1 for _ in reader(path))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+@benchmark("import", qt=False)
+def bench_import(context):
+    temp_dir = tempfile.mkdtemp(prefix="safan-import-")
+    total = 10000 if context.quick else 100000
+    bookmarks = [Bookmark(i, f"书签 {i}", f"https://site{i % 5000}.example.com/page/{i}", f"文件夹 {i % 50}/子文件夹 {i % 7}",
+                          1.6e9 + i) for i in range(total)]
+    sources = {
+        "netscape": (write_netscape_bookmarks, read_netscape_bookmarks, os.path.join(temp_dir, "bookmarks.html")),
+        "chrome": (write_chrome_bookmarks, read_chrome_bookmarks, os.path.join(temp_dir, "Bookmarks")),
+    }
+
+    for name, (writer, reader, path) in sources.items():
+        start = time.perf_counter()
+        writer(path, bookmarks)
+        context.record(f"import.{name}.export_{total}_ms", elapsed_ms(start))
+
+        count, parse_ms, peak = measure_parse(reader, path)
+        context.record(f"import.{name}.parse_{total}_ms", parse_ms)
+        context.record(f"import.{name}.parse_peak_mb", peak / 1024 / 1024, "MB")
+
+        # 写入空的书签库，再导入一次同一文件时全部按重复跳过
+        store = BookmarkStore(os.path.join(temp_dir, f"{name}.db"))
+        seen = store.normalized_urls()
+        start = time.perf_counter()
+        import_in_batches(reader(path), lambda batch: store.import_bookmarks(batch, seen))
+        store.flush(timeout=None)
+        context.record(f"import.{name}.import_{total}_ms", elapsed_ms(start))
+        assert len(store) == count
+
+        seen = store.normalized_urls()
+        start = time.perf_counter()
+        import_in_batches(reader(path), lambda batch: store.import_bookmarks(batch, seen))
+        context.record(f"import.{name}.reimport_{total}_ms", elapsed_ms(start))
+        assert len(store) == count
+        store.close()
+
+    # Firefox 的 places.sqlite 中的访问记录
+    places = os.path.join(temp_dir, "places.sqlite")
+    conn = sqlite3.connect(places)
+    conn.executescript("""
+        CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url TEXT, title TEXT);
+        CREATE TABLE moz_bookmarks (id INTEGER PRIMARY KEY, type INTEGER, fk INTEGER, parent INTEGER,
+                                    position INTEGER, title TEXT, dateAdded INTEGER, guid TEXT);
+        CREATE TABLE moz_historyvisits (id INTEGER PRIMARY KEY, place_id INTEGER, visit_date INTEGER);
+    """)
+    conn.executemany("INSERT INTO moz_places VALUES (?, ?, ?)",
+                     ((i, f"https://site{i}.example.com/", f"页面 {i}") for i in range(total // 10)))
+    conn.executemany("INSERT INTO moz_historyvisits VALUES (?, ?, ?)",
+                     ((i, i % (total // 10), int((1.6e9 + i) * 1e6)) for i in range(total)))
+    conn.commit()
+    conn.close()
+
+    history = HistoryStore(os.path.join(temp_dir, "history.db"))
+    start = time.perf_counter()
+    import_in_batches(read_firefox_history(places), history.import_visits)
+    history.flush(timeout=None)
+    context.record(f"import.firefox_history.import_{total}_ms", elapsed_ms(start))
+    assert history.count() == total
+
+    # 重复导入时全部跳过，只有实际导入的记录才交给全文索引
+    added = []
+    import_in_batches(read_firefox_history(places), lambda batch: added.extend(history.import_visits(batch)))
+    history.flush(timeout=None)
+    assert not added and history.count() == total
+    history.close()
+
+    shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,58 @@
+"""设置: 内存读取、合并写入和迁移的耗时"""
+import os
+import shutil
+import tempfile
+import time
+from harness import benchmark, elapsed_ms
+from settings_store import SettingsStore, to_bool, to_number
+
+KEYS = [f"group{i % 20}/key{i}" for i in range(200)]
+
+
+def legacy_values(values, history_count):
+    """模拟旧版 QSettings 中以字符串保存的设置和历史记录列表"""
+    for i, key in enumerate(KEYS):
+        values[key] = "true" if i % 2 else str(i)
+    values["history"] = [["2024-01-01T00:00:00", f"https://example.com/{i}", f"页面 {i}"]
+                         for i in range(history_count)]
+
+
+@benchmark("settings", qt=False)
+def bench_settings(context):
+    reads = 100000 if context.quick else 1000000
+    history_count = 1000 if context.quick else 10000
+    directory = tempfile.mkdtemp(prefix="safan-settings-")
+    path = os.path.join(directory, "settings.json")
+    try:
+        start = time.perf_counter()
+        store = SettingsStore(path, [lambda values: legacy_values(values, history_count)], delay=0.2)
+        context.record("settings.migrate_ms", elapsed_ms(start))
+
+        start = time.perf_counter()
+        for i in range(reads):
+            key = KEYS[i % len(KEYS)]
+            if i % 2:
+                to_bool(store.get(key), False)
+            else:
+                to_number(store.get(key), int, 0)
+        context.record("settings.read_us", elapsed_ms(start) * 1000 / reads, "us")
+
+        # 短时间内的大量修改只写入一次
+        writes = store.write_count
+        start = time.perf_counter()
+        for i in range(10000):
+            store.set(KEYS[i % len(KEYS)], i)
+        context.record("settings.set_us", elapsed_ms(start) * 1000 / 10000, "us")
+        time.sleep(0.5)
+        context.record("settings.file_writes", store.write_count - writes, "次")
+
+        store.remove("history")
+        start = time.perf_counter()
+        store.close()
+        context.record("settings.close_ms", elapsed_ms(start))
+
+        start = time.perf_counter()
+        SettingsStore(path).close()
+        context.record("settings.load_ms", elapsed_ms(start))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
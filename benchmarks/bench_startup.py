@@ -0,0 +1,38 @@
+"""冷启动: 在全新的数据目录中启动 main.main()，直到首次绘制之后退出"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from harness import benchmark, isolate_environment, median, peak_rss
+
+DRIVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_driver.py")
+
+
+def launch():
+    """启动一次，返回 (进程内启动耗时, 含解释器启动的总耗时)，单位毫秒"""
+    with tempfile.TemporaryDirectory(prefix="safan-startup-") as base:
+        env = isolate_environment(base, dict(os.environ))
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, DRIVER], env=env, capture_output=True, text=True, timeout=120)
+        wall_ms = (time.perf_counter() - start) * 1000
+    if process.returncode:
+        raise RuntimeError(f"启动失败(退出码 {process.returncode}):\n{process.stderr[-2000:]}")
+
+    for line in process.stdout.splitlines():
+        if line.startswith("{"):
+            return json.loads(line)["startup_ms"], wall_ms
+    raise RuntimeError(f"启动程序没有输出耗时: {process.stdout!r}")
+
+
+@benchmark("startup", qt=False)
+def bench_startup(context):
+    runs = 3 if context.quick else 5
+    results = [launch() for _ in range(runs)]
+    context.record("startup.cold_main_ms", results[0][0])
+    context.record("startup.main_ms.median", median([main_ms for main_ms, _ in results]))
+    context.record("startup.process_ms.median", median([wall_ms for _, wall_ms in results]))
+    rss = peak_rss(children=True)
+    if rss:
+        context.record("startup.peak_rss_mb", rss / 1024 / 1024, "MB")
@@ -0,0 +1,74 @@
+"""标签页: add_new_tab/close_tab 的吞吐量和 tab_changed 的切换延迟"""
+import time
+from PySide2.QtCore import QUrl
+from harness import benchmark, elapsed_ms, median, process_events, wait_for
+from browser_window import BrowserWindow
+
+
+def open_tabs(tab_widget, urls):
+    """打开一组标签页，返回 (添加耗时, 全部加载完成的耗时)"""
+    loaded = set()
+    start = time.perf_counter()
+    for url in urls:
+        browser = tab_widget.add_new_tab(QUrl(url), url)
+        browser.loadFinished.connect(lambda ok, browser=browser: loaded.add(browser))
+    add_ms = elapsed_ms(start)
+    if not wait_for(lambda: len(loaded) == len(urls), timeout=120000):
+        raise RuntimeError(f"{len(urls)} 个标签页没有在超时之前加载完成")
+    return add_ms, elapsed_ms(start)
+
+
+def switch_latency(tab_widget):
+    """依次切换到每个标签页，返回每次切换(含处理事件)的耗时"""
+    timings = []
+    for index in range(tab_widget.count()):
+        start = time.perf_counter()
+        tab_widget.setCurrentIndex(index)
+        process_events()
+        timings.append(elapsed_ms(start))
+    return timings
+
+
+def close_tabs(tab_widget):
+    """关闭除第一个以外的全部标签页，返回耗时"""
+    start = time.perf_counter()
+    while tab_widget.count() > 1:
+        tab_widget.close_tab(tab_widget.count() - 1)
+    process_events()
+    return elapsed_ms(start)
+
+
+@benchmark("tabs")
+def bench_tabs(context):
+    window = BrowserWindow(open_home=False)
+    window.show()
+    tab_widget = window.tab_widget
+    tab_widget.add_new_tab(QUrl("about:blank"), "空白页")
+    process_events(100)
+
+    for count in (1, 10) if context.quick else (1, 10, 100):
+        urls = [context.url(f"/tabs/{count}/{i}") for i in range(count)]
+
+        refreshes = window.ui_refresher.refresh_count
+        add_ms, loaded_ms = open_tabs(tab_widget, urls)
+        context.record(f"tabs.add_new_tab.{count}.per_tab_ms", add_ms / count)
+        context.record(f"tabs.loaded.{count}.total_ms", loaded_ms)
+        context.record(f"tabs.ui_refreshes.{count}", window.ui_refresher.refresh_count - refreshes, "次")
+
+        timings = switch_latency(tab_widget)
+        context.record(f"tabs.tab_changed.{count}.median_ms", median(timings))
+        context.record(f"tabs.tab_changed.{count}.max_ms", max(timings))
+
+        context.record(f"tabs.close_tab.{count}.per_tab_ms", close_tabs(tab_widget) / count)
+
+    # 切换到占位标签页时才创建浏览器部件
+    count = 10 if context.quick else 50
+    for i in range(count):
+        tab_widget.add_new_tab(QUrl(context.url(f"/lazy/{i}")), f"lazy {i}", lazy=True)
+    timings = switch_latency(tab_widget)[1:]
+    context.record(f"tabs.tab_changed.lazy.{count}.median_ms", median(timings))
+    close_tabs(tab_widget)
+
+    window.close()
+    window.deleteLater()
+    process_events(100)
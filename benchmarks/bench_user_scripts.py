@@ -0,0 +1,62 @@
+"""用户脚本: 按主机索引的脚本查找和元素隐藏规则"""
+import os
+import shutil
+import tempfile
+import time
+from harness import benchmark, elapsed_ms
+from script_index import load_scripts
+
+SCRIPT = """// ==UserScript==
+// @name        站点 {i}
+// @match       https://*.site{i}.corp/*
+// @exclude-match https://*.site{i}.corp/admin/*
+// @run-at      document-end
+// ==/UserScript==
+document.querySelectorAll(".heavy").forEach(function (node) {{ node.remove(); }});
+"""
+
+
+def write_scripts(directory, count, rules):
+    for i in range(count):
+        with open(os.path.join(directory, f"site{i}.user.js"), "w", encoding="utf-8") as f:
+            f.write(SCRIPT.format(i=i))
+    with open(os.path.join(directory, "hide.txt"), "w", encoding="utf-8") as f:
+        for i in range(rules):
+            f.write(f"site{i % count}.corp##.widget-{i}\n" if i % 10 else f"##.banner-{i}\n")
+
+
+@benchmark("user_scripts", qt=False)
+def bench_user_scripts(context):
+    count = 200 if context.quick else 2000
+    rules = 2000 if context.quick else 20000
+    lookups = 10000 if context.quick else 50000
+    directory = tempfile.mkdtemp(prefix="safan-userscripts-")
+    try:
+        write_scripts(directory, count, rules)
+        start = time.perf_counter()
+        index = load_scripts(directory)
+        context.record(f"user_scripts.load_{count}_scripts_{rules}_rules_ms", elapsed_ms(start))
+        if index.errors or len(index.scripts) != count:
+            raise RuntimeError(f"读取脚本失败: {index.errors[:1]}")
+
+        urls = [f"https://www.site{i % count}.corp/page/{i}" for i in range(lookups)]
+        start = time.perf_counter()
+        matched = sum(len(index.match(url)) for url in urls)
+        context.record("user_scripts.match_us", elapsed_ms(start) * 1000 / lookups, "us")
+        if matched != lookups:
+            raise RuntimeError(f"匹配的脚本数不对: {matched}")
+
+        # 对照: 逐个检查全部脚本
+        sample = urls[:1000]
+        start = time.perf_counter()
+        for url in sample:
+            [script for script in index.scripts if script.applies(url)]
+        context.record("user_scripts.linear_scan_us", elapsed_ms(start) * 1000 / len(sample), "us")
+
+        hosts = [f"www.site{i % count}.corp" for i in range(count)]
+        start = time.perf_counter()
+        selectors = sum(len(index.selectors(host)) for host in hosts)
+        context.record("user_scripts.selectors_us", elapsed_ms(start) * 1000 / len(hosts), "us")
+        context.record("user_scripts.selectors_per_host", selectors / len(hosts), "条")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
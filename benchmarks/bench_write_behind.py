@@ -0,0 +1,114 @@
+"""后台写入: 写入进程在提交之前被杀掉后，重新打开时重放日志"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from harness import ROOT, benchmark, elapsed_ms
+from write_behind import WriteBehind
+
+# 子进程中的写入者: 每放入一条语句输出一行序号；quit 模式放入全部语句后不提交直接退出，
+# stream 模式不断写入直到被杀掉，wait 模式放入一条语句后等待被杀掉
+WRITER = """
+import os, sys
+sys.path.insert(0, {root!r})
+from write_behind import WriteBehind
+mode, path, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+interval = 5 if mode == "stream" else 600000
+writer = WriteBehind(path, interval_ms=interval, batch_size=50 if mode == "stream" else 10 ** 9)
+if mode == "quit":
+    half = count // 2
+    for i in range(half):
+        writer.execute("INSERT INTO items (n) VALUES (?)", (i,))
+    writer.executemany("INSERT INTO items (n) VALUES (?)", [(i,) for i in range(half, count)])
+    print(count - 1, flush=True)
+    os._exit(1)
+for i in range(count):
+    writer.execute("INSERT INTO items (n) VALUES (?)", (i,))
+    print(i, flush=True)
+sys.stdin.readline()
+"""
+
+
+def create_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (n INTEGER NOT NULL)")
+    conn.commit()
+    conn.close()
+
+
+def start_writer(mode, path, count):
+    return subprocess.Popen([sys.executable, "-c", WRITER.format(root=ROOT), mode, path, str(count)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+
+def reopen(path):
+    """打开数据库的写入者(重放日志)，返回 (重放耗时, 表中的全部数字)"""
+    start = time.perf_counter()
+    writer = WriteBehind(path)
+    elapsed = elapsed_ms(start)
+    writer.close()
+    conn = sqlite3.connect(path)
+    numbers = [row[0] for row in conn.execute("SELECT n FROM items")]
+    conn.close()
+    return elapsed, numbers
+
+
+def check(numbers, expected, name):
+    if len(numbers) != len(set(numbers)):
+        raise RuntimeError(f"{name}: 重放后有重复的行")
+    missing = set(expected) - set(numbers)
+    if missing:
+        raise RuntimeError(f"{name}: 重放后缺少 {len(missing)} 行，例如 {min(missing)}")
+
+
+@benchmark("write_behind", qt=False)
+def bench_write_behind(context):
+    count = 2000 if context.quick else 20000
+    directory = tempfile.mkdtemp(prefix="safan-write-behind-")
+    try:
+        # 全部语句只写进了日志，进程就退出了
+        path = os.path.join(directory, "quit.db")
+        create_database(path)
+        writer = start_writer("quit", path, count)
+        writer.communicate()
+        elapsed, numbers = reopen(path)
+        check(numbers, range(count), "提交前退出")
+        if len(numbers) != count:
+            raise RuntimeError(f"提交前退出: 应有 {count} 行，实际 {len(numbers)} 行")
+        context.record(f"write_behind.replay_{count}_ms", elapsed)
+
+        # 一边提交一边被杀掉: 已经放入队列的语句都要重放，已提交的不能重复
+        path = os.path.join(directory, "stream.db")
+        create_database(path)
+        writer = start_writer("stream", path, count * 10)
+        last = -1
+        while last < count:
+            last = int(writer.stdout.readline())
+        writer.kill()
+        writer.wait()
+        writer.stdout.close()
+        writer.stdin.close()
+        _, numbers = reopen(path)
+        check(numbers, range(last + 1), "提交中被杀掉")
+
+        # 两个进程写入同一数据库，一个提交时不能清掉另一个还没提交的语句
+        path = os.path.join(directory, "shared.db")
+        create_database(path)
+        first = WriteBehind(path)
+        writer = start_writer("wait", path, 1)
+        writer.stdout.readline()
+        first.execute("INSERT INTO items (n) VALUES (?)", (100,))
+        if not first.flush(timeout=None):
+            raise RuntimeError("第一个写入者提交失败")
+        writer.kill()
+        writer.wait()
+        writer.stdout.close()
+        writer.stdin.close()
+        first.close()
+        _, numbers = reopen(path)
+        check(numbers, [0, 100], "两个进程")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
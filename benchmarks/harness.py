@@ -0,0 +1,117 @@
+"""基准测试的公共部分: 注册、计时、隔离的数据目录和与基线的比较"""
+import math
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 已注册的基准测试: (名称, 函数, 是否需要 QApplication)
+BENCHMARKS = []
+
+
+def benchmark(name, qt=True):
+    """注册一个基准测试，函数接收 Context 参数"""
+    def register(func):
+        BENCHMARKS.append((name, func, qt))
+        return func
+    return register
+
+
+class Context:
+    """传给每个基准测试的运行环境"""
+
+    def __init__(self, server_url="", quick=False):
+        self.server_url = server_url
+        self.quick = quick
+        # 指标名称 -> {"value": 数值, "unit": 单位, "lower_is_better": 是否越小越好}
+        self.metrics = {}
+
+    def url(self, path):
+        return self.server_url + path
+
+    def record(self, name, value, unit="ms", lower_is_better=True):
+        self.metrics[name] = {"value": round(value, 4), "unit": unit, "lower_is_better": lower_is_better}
+        print(f"  {name:<48} {value:12.3f} {unit}", flush=True)
+
+
+def isolate_environment(base, env=None):
+    """让浏览器的数据、配置和缓存都写到临时目录，并使用无窗口的平台插件
+
+    env 默认为当前进程的环境变量，此时必须在导入 PySide2 之前调用。
+    """
+    env = os.environ if env is None else env
+    for name in ("XDG_DATA_HOME", "XDG_CONFIG_HOME", "XDG_CACHE_HOME"):
+        path = os.path.join(base, name.lower())
+        os.makedirs(path, exist_ok=True)
+        env[name] = path
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env.setdefault("QTWEBENGINE_CHROMIUM_FLAGS", "--disable-gpu")
+    return env
+
+
+def peak_rss(children=False):
+    """进程(或已结束的子进程)的内存峰值，单位字节；不支持时返回 None"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux 上以 KB 为单位，macOS 上以字节为单位
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def process_events(ms=0):
+    """处理事件循环，ms 大于 0 时至少等待这么久"""
+    from PySide2.QtCore import QEventLoop, QTimer
+    loop = QEventLoop()
+    QTimer.singleShot(ms, loop.quit)
+    loop.exec_()
+
+
+def wait_for(predicate, timeout=30000):
+    """处理事件直到 predicate() 为真，超时返回 False"""
+    deadline = time.perf_counter() + timeout / 1000
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        process_events(5)
+    return True
+
+
+def percentile(values, fraction):
+    """最近秩法计算百分位数"""
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def compare(metrics, baseline, tolerance):
+    """与基线比较，返回 [(指标, 当前值, 基线值, 变化比例)]，只包含退化超过 tolerance 的指标"""
+    regressions = []
+    for name, metric in metrics.items():
+        base = baseline.get(name)
+        if not base or not base["value"]:
+            continue
+        change = (metric["value"] - base["value"]) / base["value"]
+        if not metric["lower_is_better"]:
+            change = -change
+        if change > tolerance:
+            regressions.append((name, metric["value"], base["value"], change))
+    return regressions
@@ -0,0 +1,129 @@
+"""运行基准测试并与基线比较
+
+在无窗口的 Qt 平台(QT_QPA_PLATFORM=offscreen)和临时数据目录中运行，
+页面来自本地 HTTP 服务器。结果写入 JSON 文件；有指标比基线差超过
+容差时以非零状态退出。
+
+用法:
+    python benchmarks/run.py                       运行全部测试并与 benchmarks/baseline.json 比较
+    python benchmarks/run.py --only tabs history   只运行部分测试
+    python benchmarks/run.py --update-baseline     把本次结果保存为基线
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="SaFan 基准测试")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="只运行这些测试")
+    parser.add_argument("--quick", action="store_true", help="使用较小的数据量")
+    parser.add_argument("--output", default="benchmark-results.json", help="结果文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许比基线差的比例")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    # 必须在导入任何 Qt 模块之前设置
+    from harness import BENCHMARKS, Context, compare, isolate_environment, peak_rss
+    temp_dir = tempfile.mkdtemp(prefix="safan-bench-")
+    isolate_environment(temp_dir)
+
+    # 每个测试模块为 bench_<名称>.py，只导入选中的模块
+    failures = []
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, "bench_*.py"))):
+        module = os.path.splitext(os.path.basename(path))[0]
+        if args.only and module[len("bench_"):] not in args.only:
+            continue
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            traceback.print_exc()
+            failures.append(module[len("bench_"):])
+    selected = [(name, func, qt) for name, func, qt in BENCHMARKS if not args.only or name in args.only]
+
+    from server import start_server
+    server, server_url = start_server()
+    context = Context(server_url, args.quick)
+
+    app = None
+    if any(qt for _, _, qt in selected):
+        from PySide2.QtWidgets import QApplication
+        app = QApplication(sys.argv[:1])
+        app.setOrganizationName("SaFan")
+        app.setApplicationName("SaFan Browser")
+
+    for name, func, qt in selected:
+        print(f"[{name}]", flush=True)
+        try:
+            func(context)
+        except Exception:
+            traceback.print_exc()
+            failures.append(name)
+
+    rss = peak_rss()
+    if rss:
+        context.record("process.peak_rss_mb", rss / 1024 / 1024, "MB")
+
+    server.shutdown()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "failed": failures,
+        "metrics": context.metrics,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+        return 1 if failures else 0
+
+    status = 0
+    if failures:
+        print(f"失败的测试: {', '.join(failures)}")
+        status = 1
+
+    if not os.path.exists(args.baseline):
+        print(f"没有基线文件 {args.baseline}，跳过比较(使用 --update-baseline 创建)")
+        return status
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("quick") != args.quick:
+        print("警告: 基线与本次运行的数据量不同(--quick)")
+    regressions = compare(context.metrics, baseline["metrics"], args.tolerance)
+    if regressions:
+        print(f"性能退化(容差 {args.tolerance:.0%}):")
+        for name, value, base, change in regressions:
+            print(f"  {name:<48} {value:12.3f}  基线 {base:12.3f}  差 {change:+.0%}")
+        status = 1
+    else:
+        print("没有超过容差的性能退化")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""基准测试用的本地 HTTP 服务器，生成带图片和脚本的测试页面"""
+import base64
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 1x1 的透明 PNG
+PIXEL = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==")
+
+# /slow/ 下的页面模拟远程服务器的响应延迟(秒)
+SLOW_DELAY = 0.2
+
+RANGE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+SCRIPT = b"""
+(function () {
+    var list = document.createElement("ul");
+    for (var i = 0; i < 200; i++) {
+        var item = document.createElement("li");
+        item.textContent = "item " + i;
+        list.appendChild(item);
+    }
+    document.body.appendChild(list);
+})();
+"""
+
+
+def page_html(name):
+    paragraphs = "\n".join(f"<p>{name} 第 {i} 段: " + "测试文本 " * 40 + "</p>" for i in range(20))
+    images = "\n".join(f'<img src="/img/{name}-{i}.png" width="64" height="64">' for i in range(5))
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>测试页面 {name}</title>"
+            f"<link rel=\"stylesheet\" href=\"/static/style.css\"></head>"
+            f"<body><h1>{name}</h1>{images}{paragraphs}"
+            f"<script src=\"/static/app.js\"></script></body></html>").encode()
+
+
+@lru_cache(maxsize=8)
+def file_body(size):
+    """/files/<字节数> 的内容，同样的大小每次都相同"""
+    return random.Random(size).getrandbits(size * 8).to_bytes(size, "little")
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/files/<字节数> 支持 Range；/files-norange/<字节数> 的 HEAD 声称支持 Range，
+    GET 却总是返回整个文件，模拟忽略 Range 的服务器"""
+
+    def do_HEAD(self):
+        path = self.path.split("?")[0]
+        if path.startswith(("/files/", "/files-norange/")):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", path.rsplit("/", 1)[1])
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith(("/files/", "/files-norange/")):
+            self.send_file(file_body(int(path.rsplit("/", 1)[1])), path.startswith("/files/"))
+        elif path.startswith("/img/"):
+            self.send(PIXEL, "image/png")
+        elif path == "/static/app.js":
+            self.send(SCRIPT, "application/javascript")
+        elif path == "/static/style.css":
+            self.send(b"body { font-family: sans-serif; } p { line-height: 1.5; }", "text/css")
+        else:
+            if path.startswith("/slow/"):
+                time.sleep(SLOW_DELAY)
+            self.send(page_html(path.strip("/").replace("/", "-") or "index"), "text/html; charset=utf-8")
+
+    def send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "max-age=3600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, body, ranges):
+        match = RANGE.match(self.headers.get("Range", "")) if ranges else None
+        start, end = 0, len(body) - 1
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            if start > end:
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end + 1 - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        try:
+            self.wfile.write(body[start:end + 1])
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端暂停或取消时会断开连接
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    """在后台线程中启动服务器，返回 (服务器, 根地址)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
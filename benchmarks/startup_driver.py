@@ -0,0 +1,23 @@
+"""在子进程中运行 main.main()，启动完成后输出耗时(JSON)并退出"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from startup_profile import startup  # noqa: E402
+import main as browser_main  # noqa: E402
+
+finish_startup = browser_main.finish_startup
+
+
+def finish_and_quit(app):
+    finish_startup(app)
+    print(json.dumps({"startup_ms": startup.total_ms()}), flush=True)
+    app.quit()
+
+
+# main() 在首次绘制之后通过模块全局名调用 finish_startup
+browser_main.finish_startup = finish_and_quit
+sys.argv = sys.argv[:1]
+browser_main.main()
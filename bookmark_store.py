@@ -0,0 +1,168 @@
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from history_store import normalize_url
+from write_behind import FLUSH_TIMEOUT, WriteBehind
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookmarks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    folder TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    visit_count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+COLUMNS = ("title", "url", "folder", "created", "visit_count")
+
+INSERT_SQL = "INSERT INTO bookmarks (id, title, url, folder, created, visit_count) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+@dataclass(eq=False)
+class Bookmark:
+    id: int
+    title: str
+    url: str
+    folder: str = ""
+    created: float = field(default_factory=time.time)
+    visit_count: int = 0
+
+
+class BookmarkStore:
+    """书签存储
+
+    启动时把全部书签读入内存，按 id 和 URL 建立字典索引；
+    每次修改只更新内存，发生变化的那一条记录交给后台线程写入数据库。
+    新书签的 id 在内存中分配，不需要等待插入完成。
+    """
+
+    def __init__(self, path, interval_ms=500, batch_size=200):
+        self.path = path
+        self.bookmarks = []
+        self.by_id = {}
+        self.by_url = {}
+
+        conn = sqlite3.connect(path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+        # 先重放上次崩溃前没有写入的修改，再读取书签
+        self.writer = WriteBehind(path, interval_ms, batch_size)
+
+        rows = conn.execute(
+            "SELECT id, title, url, folder, created, visit_count FROM bookmarks ORDER BY id")
+        for row in rows:
+            self._index(Bookmark(*row))
+
+        # 与 AUTOINCREMENT 一致，已删除书签的 id 不再使用
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'bookmarks'").fetchone()
+        self.last_id = max(row[0] if row else 0, max(self.by_id, default=0))
+        conn.close()
+
+    def _index(self, bookmark):
+        self.bookmarks.append(bookmark)
+        self.by_id[bookmark.id] = bookmark
+        self.by_url.setdefault(bookmark.url, bookmark)
+
+    def _unindex_url(self, bookmark):
+        if self.by_url.get(bookmark.url) is not bookmark:
+            return
+        del self.by_url[bookmark.url]
+        # 同一URL可能被收藏了多次，改由剩下的那条记录占用索引
+        for other in self.bookmarks:
+            if other is not bookmark and other.url == bookmark.url:
+                self.by_url[other.url] = other
+                break
+
+    def __len__(self):
+        return len(self.bookmarks)
+
+    def get(self, bookmark_id):
+        """按 id 查找书签"""
+        return self.by_id.get(bookmark_id)
+
+    def find_by_url(self, url):
+        """按 URL 查找书签，不存在时返回 None"""
+        return self.by_url.get(url)
+
+    def _new(self, title, url, folder="", created=None):
+        self.last_id += 1
+        bookmark = Bookmark(self.last_id, title, url, folder)
+        if created is not None:
+            bookmark.created = created
+        self._index(bookmark)
+        return bookmark
+
+    def _row(self, bookmark):
+        return (bookmark.id, bookmark.title, bookmark.url, bookmark.folder, bookmark.created, bookmark.visit_count)
+
+    def add(self, title, url, folder=""):
+        """新增一条书签"""
+        bookmark = self._new(title, url, folder)
+        self.writer.execute(INSERT_SQL, self._row(bookmark))
+        return bookmark
+
+    def update(self, bookmark, **changes):
+        """修改书签的部分字段"""
+        unknown = set(changes) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的书签字段: {', '.join(sorted(unknown))}")
+        if not changes:
+            return bookmark
+
+        if "url" in changes:
+            self._unindex_url(bookmark)
+        for name, value in changes.items():
+            setattr(bookmark, name, value)
+        if "url" in changes:
+            self.by_url.setdefault(bookmark.url, bookmark)
+
+        assignments = ", ".join(f"{name} = ?" for name in changes)
+        self.writer.execute(f"UPDATE bookmarks SET {assignments} WHERE id = ?",
+                            (*changes.values(), bookmark.id))
+        return bookmark
+
+    def remove(self, bookmark):
+        """删除书签"""
+        self.writer.execute("DELETE FROM bookmarks WHERE id = ?", (bookmark.id,))
+
+        self._unindex_url(bookmark)
+        del self.by_id[bookmark.id]
+        self.bookmarks.remove(bookmark)
+
+    def record_visit(self, bookmark):
+        """访问次数加一"""
+        return self.update(bookmark, visit_count=bookmark.visit_count + 1)
+
+    def normalized_urls(self):
+        """所有书签网址的规范形式，用于导入时去重"""
+        return {normalize_url(bookmark.url) for bookmark in self.bookmarks}
+
+    def import_bookmarks(self, entries, seen=None):
+        """批量导入 (title, url[, folder[, created]]) 书签，在一个事务中写入，返回导入的条数
+
+        seen 为规范网址的集合时跳过其中已有的网址，并把导入的网址加入集合。
+        """
+        added = []
+        for entry in entries:
+            if seen is not None:
+                key = normalize_url(entry[1])
+                if key in seen:
+                    continue
+                seen.add(key)
+            added.append(self._new(*entry))
+        self.writer.executemany(INSERT_SQL, (self._row(bookmark) for bookmark in added))
+        return len(added)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """提交尚未写入磁盘的修改并等待完成，返回是否在超时之前提交成功"""
+        return self.writer.flush(timeout)
+
+    def close(self):
+        """提交剩余的修改并结束写入线程"""
+        self.writer.close()
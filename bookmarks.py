@@ -1,19 +1,99 @@
-from PySide2.QtWidgets import QWidget, QVBoxLayout, QListWidget, QHBoxLayout, QPushButton, QInputDialog, QMessageBox
-from PySide2.QtCore import Qt, QSettings
+import sqlite3
+from PySide2.QtWidgets import (QWidget, QVBoxLayout, QTableView, QHBoxLayout, QPushButton, QInputDialog,
+                               QAbstractItemView, QHeaderView, QApplication, QFileDialog, QMessageBox)
+from PySide2.QtCore import Qt, QUrl, QModelIndex, Signal
+from bookmark_store import BookmarkStore
+from favicons import favicon_service
+from history_store import url_host
+from import_formats import BOOKMARK_READERS, BOOKMARK_WRITERS, detect_format
+from importer import ImportProgress
+from lazy_model import LazyTableModel
+from settings import settings
+from storage import data_path
+
+
+class BookmarkTableModel(LazyTableModel):
+    """书签表格模型，从书签存储中按批次取出行"""
+
+    headers = ["标题", "网址", "文件夹"]
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        favicon_service().icon_ready.connect(self.favicon_ready)
+
+    def fetch_rows(self, offset, limit):
+        return self.store.bookmarks[offset:offset + limit]
+
+    def display(self, bookmark, column):
+        if column == 0:
+            return bookmark.title
+        if column == 1:
+            return bookmark.url
+        return bookmark.folder
+
+    def decoration(self, bookmark, column):
+        if column == 0:
+            return favicon_service().icon(bookmark.url)
+        return None
+
+    def favicon_ready(self, host):
+        self.rows_changed(lambda bookmark: url_host(bookmark.url) == host)
+
+    def row_changed(self, row):
+        """某一行的书签已被修改"""
+        if row < len(self.rows):
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+
+    def remove_row(self, row):
+        """从已加载的行中移除一行，需在书签存储删除之前调用"""
+        if row < len(self.rows):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.rows[row]
+            self.endRemoveRows()
 
 
 class BookmarkManager(QWidget):
+    open_url = Signal(QUrl)
+    # 鼠标悬停在某个书签上
+    url_hovered = Signal(str)
+    bookmark_added = Signal(str, str)
+    # 某个网址不再有书签
+    bookmark_removed = Signal(str)
+    bookmarks_imported = Signal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("书签管理器")
         self.resize(600, 400)
 
+        # 书签存储，写入在后台线程中合并提交
+        self.store = BookmarkStore(data_path("bookmarks.db"),
+                                   settings.int_value("storage/write_interval_ms", 500),
+                                   settings.int_value("storage/write_batch", 200))
+        self.migrate_legacy_bookmarks()
+        app = QApplication.instance()
+        if app:
+            app.aboutToQuit.connect(self.store.close)
+
         # 创建布局
         layout = QVBoxLayout()
 
         # 书签列表
-        self.bookmark_list = QListWidget()
-        layout.addWidget(self.bookmark_list)
+        self.bookmark_model = BookmarkTableModel(self.store, self)
+        self.bookmark_view = QTableView()
+        self.bookmark_view.setModel(self.bookmark_model)
+        self.bookmark_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.bookmark_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.bookmark_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.bookmark_view.verticalHeader().hide()
+        self.bookmark_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.bookmark_view.horizontalHeader().setStretchLastSection(True)
+        self.bookmark_view.setColumnWidth(0, 220)
+        self.bookmark_view.doubleClicked.connect(self.open_bookmark)
+        self.bookmark_view.setMouseTracking(True)
+        self.bookmark_view.entered.connect(lambda index: self.url_hovered.emit(self.bookmark_model.row_at(index.row()).url))
+        layout.addWidget(self.bookmark_view)
 
         # 按钮布局
         button_layout = QHBoxLayout()
@@ -34,33 +114,51 @@ class BookmarkManager(QWidget):
         self.open_btn.clicked.connect(self.open_bookmark)
         button_layout.addWidget(self.open_btn)
 
+        self.import_btn = QPushButton("导入")
+        self.import_btn.clicked.connect(self.import_bookmarks)
+        button_layout.addWidget(self.import_btn)
+
+        self.export_btn = QPushButton("导出")
+        self.export_btn.clicked.connect(self.export_bookmarks)
+        button_layout.addWidget(self.export_btn)
+
         layout.addLayout(button_layout)
         self.setLayout(layout)
 
         # 加载书签
         self.load_bookmarks()
 
+    def migrate_legacy_bookmarks(self):
+        """把旧版保存在设置中的书签迁移到数据库"""
+        bookmarks = settings.list_value("bookmarks")
+        if not bookmarks:
+            return
+
+        self.store.import_bookmarks((title, url) for title, url in bookmarks)
+        settings.remove("bookmarks")
+
     def load_bookmarks(self):
-        """从设置加载书签"""
-        settings = QSettings("SaFan", "Browser")
-        bookmarks = settings.value("bookmarks", [])
+        """重新加载书签列表"""
+        self.bookmark_model.reload()
 
-        self.bookmark_list.clear()
-        for title, url in bookmarks:
-            self.bookmark_list.addItem(f"{title} - {url}")
+    def current_row(self):
+        """当前选中的行号，没有选中时返回 -1"""
+        index = self.bookmark_view.currentIndex()
+        return index.row() if index.isValid() else -1
 
-    def save_bookmarks(self):
-        """保存书签到设置"""
-        settings = QSettings("SaFan", "Browser")
-        bookmarks = []
+    def current_bookmark(self):
+        """当前选中的书签"""
+        return self.bookmark_model.row_at(self.current_row())
 
-        for i in range(self.bookmark_list.count()):
-            text = self.bookmark_list.item(i).text()
-            parts = text.split(" - ")
-            if len(parts) >= 2:
-                bookmarks.append((parts[0], parts[1]))
+    def find_bookmark(self, url):
+        """按 URL 查找书签"""
+        return self.store.find_by_url(url)
 
-        settings.setValue("bookmarks", bookmarks)
+    def record_visit(self, url):
+        """访问了某个已收藏的页面时增加其访问次数"""
+        bookmark = self.store.find_by_url(url)
+        if bookmark:
+            self.store.record_visit(bookmark)
 
     def add_bookmark(self, title="", url=""):
         """添加书签"""
@@ -73,47 +171,93 @@ class BookmarkManager(QWidget):
             if not ok or not url:
                 return
 
-        self.bookmark_list.addItem(f"{title} - {url}")
-        self.save_bookmarks()
+        bookmark = self.store.add(title, url)
+        self.bookmark_model.notify_appended()
+        self.bookmark_added.emit(url, title)
+        return bookmark
 
     def edit_bookmark(self):
         """编辑书签"""
-        current_item = self.bookmark_list.currentItem()
-        if not current_item:
-            return
-
-        text = current_item.text()
-        parts = text.split(" - ")
-        if len(parts) < 2:
+        bookmark = self.current_bookmark()
+        if not bookmark:
             return
 
-        title, url = parts[0], " - ".join(parts[1:])
-
-        new_title, ok1 = QInputDialog.getText(self, "编辑书签", "标题:", text=title)
-        new_url, ok2 = QInputDialog.getText(self, "编辑书签", "URL:", text=url)
+        new_title, ok1 = QInputDialog.getText(self, "编辑书签", "标题:", text=bookmark.title)
+        new_url, ok2 = QInputDialog.getText(self, "编辑书签", "URL:", text=bookmark.url)
 
         if ok1 and ok2 and new_title and new_url:
-            current_item.setText(f"{new_title} - {new_url}")
-            self.save_bookmarks()
+            old_url = bookmark.url
+            self.store.update(bookmark, title=new_title, url=new_url)
+            self.bookmark_model.row_changed(self.current_row())
+            if new_url != old_url:
+                self.url_unbookmarked(old_url)
+                self.bookmark_added.emit(new_url, new_title)
 
     def remove_bookmark(self):
         """删除书签"""
-        current_row = self.bookmark_list.currentRow()
-        if current_row >= 0:
-            self.bookmark_list.takeItem(current_row)
-            self.save_bookmarks()
+        row = self.current_row()
+        bookmark = self.bookmark_model.row_at(row)
+        if bookmark:
+            self.bookmark_model.remove_row(row)
+            self.store.remove(bookmark)
+            self.url_unbookmarked(bookmark.url)
 
-    def open_bookmark(self):
-        """打开书签"""
-        current_item = self.bookmark_list.currentItem()
-        if not current_item:
+    def url_unbookmarked(self, url):
+        """同一网址没有其他书签时发出 bookmark_removed"""
+        if self.store.find_by_url(url) is None:
+            self.bookmark_removed.emit(url)
+
+    def import_bookmarks(self):
+        """从其他浏览器导出的书签文件、Chrome 的 Bookmarks 或 Firefox 的 places.sqlite 导入"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "导入书签", "", "书签文件 (*.html *.htm *.json Bookmarks places.sqlite);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            reader = BOOKMARK_READERS.get(detect_format(path))
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.warning(self, "导入书签", f"无法读取文件: {e}")
+            return
+        if reader is None:
+            QMessageBox.warning(self, "导入书签", "无法识别的书签文件格式")
             return
 
-        text = current_item.text()
-        parts = text.split(" - ")
-        if len(parts) < 2:
+        # 按规范化的网址去重，已有的书签和同一文件中重复的网址都跳过
+        seen = self.store.normalized_urls()
+
+        def consume(batch):
+            added = self.store.import_bookmarks(batch, seen)
+            self.bookmark_model.notify_appended()
+            return added
+
+        progress = ImportProgress("导入书签", reader, path, consume, self)
+        progress.completed.connect(self.bookmarks_import_completed)
+
+    def bookmarks_import_completed(self, read, imported):
+        self.bookmarks_imported.emit()
+        QMessageBox.information(self, "导入书签",
+                                f"已导入 {imported} 个书签，跳过 {read - imported} 个重复的网址。")
+
+    def export_bookmarks(self):
+        """导出为 HTML 书签文件或 Chrome 书签格式"""
+        path, selected = QFileDialog.getSaveFileName(
+            self, "导出书签", "bookmarks.html", "HTML 书签文件 (*.html);;Chrome 书签 (*.json)")
+        if not path:
+            return
+        writer = BOOKMARK_WRITERS["chrome" if selected.startswith("Chrome") else "netscape"]
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            writer(path, self.store.bookmarks)
+        except OSError as e:
+            QMessageBox.warning(self, "导出书签", f"导出失败: {e}")
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def open_bookmark(self):
+        """打开书签"""
+        bookmark = self.current_bookmark()
+        if not bookmark:
             return
 
-        url = " - ".join(parts[1:])
-        self.parent().tab_widget.add_new_tab(QUrl(url))
-        self.close()
\ No newline at end of file
+        self.open_url.emit(QUrl(bookmark.url))
+        self.close()
@@ -0,0 +1,14 @@
+from PySide2.QtCore import QUrl, Signal
+from PySide2.QtWebEngineWidgets import QWebEnginePage
+
+
+class BrowserPage(QWebEnginePage):
+    """标签页使用的页面，在导航开始之前发出通知"""
+
+    # 主框架请求导航(地址, 导航类型)
+    navigation_requested = Signal(QUrl, int)
+
+    def acceptNavigationRequest(self, url, navigation_type, is_main_frame):
+        if is_main_frame:
+            self.navigation_requested.emit(url, int(navigation_type))
+        return super().acceptNavigationRequest(url, navigation_type, is_main_frame)
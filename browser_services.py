@@ -0,0 +1,319 @@
+from PySide2.QtCore import QObject, QTimer, QUrl, Signal
+from PySide2.QtWidgets import QApplication, QFileDialog
+from PySide2.QtWebEngineWidgets import QWebEngineDownloadItem, QWebEngineView
+from bookmarks import BookmarkManager
+from downloads import DownloadManager, unique_path
+from history import HistoryManager
+from omnibox import OmniboxIndex
+from profile_manager import ProfileManager, CacheSettings
+from speculation import Speculator
+from task_manager import TaskManager, TaskManagerWindow
+from storage import data_path
+from tab_widget import PlaceholderTab
+
+# 第一次访问页面之后空闲多久再创建历史记录和书签管理器(毫秒)
+MANAGER_IDLE_MS = 3000
+
+
+class BrowserServices(QObject):
+    """进程内所有窗口共用的对象
+
+    包括 profile、历史记录、书签、下载管理器和地址栏补全索引，管理器在
+    第一次使用时才创建。同时记录打开的窗口，处理其他进程通过本地套接字
+    发来的命令。
+    """
+
+    # 所有未完成下载的 (已接收字节, 总字节)
+    download_progress = Signal(int, int)
+
+    def __init__(self, session=None, profile_manager=None, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.profile_manager = profile_manager or ProfileManager(self)
+        self.profile = self.profile_manager.profile()
+        self.profile.downloadRequested.connect(self.handle_download_request)
+
+        # 打开的窗口，最后一个是最近激活的
+        self.windows = []
+
+        self.omnibox_index = OmniboxIndex(data_path("history.db"),
+                                          lambda: self.bookmark_manager.store.bookmarks, self)
+        self.speculator = Speculator(self.profile, self.omnibox_index, self.tab_pids, self)
+        self.task_manager = TaskManager(self, self)
+
+        self._bookmark_manager = None
+        self._history_manager = None
+        self._download_manager = None
+        self._cache_settings = None
+        self._task_manager_window = None
+
+        # 管理器创建之前的访问记录和页面正文，启动期间先排队
+        self.pending_visits = []
+        self.pending_texts = []
+        self.manager_timer = QTimer(self)
+        self.manager_timer.setSingleShot(True)
+        self.manager_timer.setInterval(MANAGER_IDLE_MS)
+        self.manager_timer.timeout.connect(self.flush_visits)
+        app = QApplication.instance()
+        if app:
+            app.aboutToQuit.connect(self.save_pending_visits)
+
+    @property
+    def bookmark_manager(self):
+        """书签管理器，第一次访问时创建"""
+        if self._bookmark_manager is None:
+            self._bookmark_manager = BookmarkManager()
+            self._bookmark_manager.open_url.connect(self.open_url)
+            self._bookmark_manager.url_hovered.connect(self.speculator.url_hovered)
+            self._bookmark_manager.bookmark_added.connect(self.omnibox_index.add_bookmark)
+            self._bookmark_manager.bookmark_removed.connect(self.omnibox_index.remove_bookmark)
+            self._bookmark_manager.bookmarks_imported.connect(self.omnibox_index.reset)
+            self.flush_visits()
+        return self._bookmark_manager
+
+    @property
+    def history_manager(self):
+        """历史记录管理器，第一次访问时创建"""
+        if self._history_manager is None:
+            self._history_manager = HistoryManager()
+            self._history_manager.open_url.connect(self.open_url)
+            self._history_manager.url_hovered.connect(self.speculator.url_hovered)
+            self._history_manager.visit_added.connect(self.omnibox_index.add_visit)
+            self._history_manager.history_cleared.connect(self.omnibox_index.reset)
+            self._history_manager.history_imported.connect(self.omnibox_index.reset)
+            self.flush_visits()
+        return self._history_manager
+
+    @property
+    def download_manager(self):
+        """下载管理器，第一次访问时创建"""
+        if self._download_manager is None:
+            self._download_manager = DownloadManager()
+            self._download_manager.progress_updated.connect(self.download_progress)
+        return self._download_manager
+
+    @property
+    def cache_settings(self):
+        """缓存设置窗口，第一次访问时创建"""
+        if self._cache_settings is None:
+            self._cache_settings = CacheSettings(self.profile_manager)
+        return self._cache_settings
+
+    @property
+    def task_manager_window(self):
+        """任务管理器窗口，第一次访问时创建"""
+        if self._task_manager_window is None:
+            self._task_manager_window = TaskManagerWindow(self.task_manager)
+        return self._task_manager_window
+
+    def add_window(self, window):
+        self.windows.append(window)
+        if self.session:
+            self.session.add_window(window)
+
+    def window_activated(self, window):
+        if window in self.windows:
+            self.windows.remove(window)
+            self.windows.append(window)
+
+    def window_closed(self, window):
+        if window in self.windows:
+            self.windows.remove(window)
+        prerender = self.speculator.prerender
+        if prerender and prerender.tab_widget is window.tab_widget:
+            self.speculator.discard()
+        if self.session:
+            self.session.window_closed(window)
+
+    def current_window(self):
+        """最近激活的窗口，没有窗口时返回 None"""
+        return self.windows[-1] if self.windows else None
+
+    def new_window(self, open_home=True):
+        from browser_window import BrowserWindow
+        window = BrowserWindow(self, open_home=open_home)
+        window.show()
+        return window
+
+    def open_url(self, qurl):
+        """在最近激活的窗口中打开网址"""
+        window = self.current_window() or self.new_window(open_home=False)
+        window.tab_widget.add_new_tab(qurl)
+
+    def record_visit(self, url, title):
+        """记录一次页面访问
+
+        启动时加载的第一个页面不应触发管理器的创建，管理器创建之前先排队，
+        空闲一段时间后再创建。
+        """
+        if self._history_manager is None or self._bookmark_manager is None:
+            self.pending_visits.append((url.toString(), title))
+            if not self.manager_timer.isActive():
+                self.manager_timer.start()
+            return
+        self.history_manager.add_history_entry(url.toString(), title)
+        self.bookmark_manager.record_visit(url.toString())
+
+    def index_page_text(self, browser):
+        """取出加载完成的页面的正文，交给历史记录的全文索引"""
+        url = browser.url()
+        if url.scheme() not in ("http", "https"):
+            return
+        if self._history_manager is not None and not self._history_manager.index_page_text:
+            return
+        browser.page().toPlainText(lambda text, url=url.toString(): self.add_page_text(url, text))
+
+    def add_page_text(self, url, text):
+        if self._history_manager is None:
+            self.pending_texts.append((url, text))
+            if not self.manager_timer.isActive():
+                self.manager_timer.start()
+            return
+        self.history_manager.add_page_text(url, text)
+
+    def flush_visits(self):
+        """创建管理器并写入排队的访问记录和页面正文"""
+        self.manager_timer.stop()
+        visits, self.pending_visits = self.pending_visits, []
+        texts, self.pending_texts = self.pending_texts, []
+        if not visits and not texts:
+            return
+        history_manager = self.history_manager
+        bookmark_manager = self.bookmark_manager
+        for url, title in visits:
+            history_manager.add_history_entry(url, title)
+            bookmark_manager.record_visit(url)
+        for url, text in texts:
+            history_manager.add_page_text(url, text)
+
+    def save_pending_visits(self):
+        """退出时写入还在排队的访问记录
+
+        这时才创建的管理器收不到正在发出的 aboutToQuit，需要在这里关闭它们的存储。
+        """
+        if not self.pending_visits and not self.pending_texts:
+            return
+        new_history = self._history_manager is None
+        new_bookmarks = self._bookmark_manager is None
+        self.flush_visits()
+        if new_history:
+            self._history_manager.store.close()
+            self._history_manager.search_indexer.stop()
+        if new_bookmarks:
+            self._bookmark_manager.store.close()
+
+    def handle_download_request(self, download: QWebEngineDownloadItem):
+        """处理下载请求"""
+        if download.state() != QWebEngineDownloadItem.DownloadRequested:
+            return
+
+        # 构建默认保存路径
+        download_dir = self.download_manager.download_directory()
+        default_path = unique_path(download_dir, download.suggestedFileName())
+
+        if self.download_manager.ask_where:
+            # 弹出保存对话框
+            path, _ = QFileDialog.getSaveFileName(self.current_window(), "保存文件", default_path)
+        else:
+            path = default_path
+
+        if path:
+            download.setPath(path)
+            download.accept()
+            self.download_manager.add_download(download)
+
+    # 本地套接字命令
+    def handle_command(self, command):
+        """执行一条命令，返回回复的字典"""
+        name = command.get("command")
+        if name == "open":
+            return self.command_open(command.get("urls", []), command.get("new_window", False))
+        if name == "list":
+            return {"ok": True, "tabs": self.list_tabs()}
+        if name == "close":
+            return self.command_close(command.get("tab_id"))
+        if name == "stats":
+            return {"ok": True, "stats": self.stats()}
+        if name == "tasks":
+            # 只有第二次采样之后才有 CPU 使用率
+            self.task_manager.sample(wait=True)
+            return {"ok": True, "tasks": self.task_manager.tasks()}
+        return {"ok": False, "error": f"未知命令: {name}"}
+
+    def command_open(self, urls, new_window=False):
+        """打开网址并把窗口提到前台，没有网址时只激活窗口"""
+        window = self.current_window()
+        if window is None or new_window:
+            window = self.new_window(open_home=not urls)
+
+        tab_ids = []
+        for i, url in enumerate(urls):
+            qurl = QUrl.fromUserInput(url)
+            # 第一个网址切换过去，其余在后台以占位标签页打开
+            widget = window.tab_widget.add_new_tab(qurl, url, lazy=i > 0)
+            tab_ids.append(widget.tab_id)
+
+        if window.isMinimized():
+            window.showNormal()
+        else:
+            window.show()
+        window.raise_()
+        window.activateWindow()
+        return {"ok": True, "tab_ids": tab_ids}
+
+    def tab_pids(self):
+        """所有窗口中已创建的标签页的渲染进程"""
+        pids = set()
+        for window in self.windows:
+            tab_widget = window.tab_widget
+            for index in range(tab_widget.count()):
+                widget = tab_widget.widget(index)
+                if isinstance(widget, QWebEngineView):
+                    pids.add(widget.page().renderProcessPid())
+        return pids
+
+    def list_tabs(self):
+        """所有窗口的标签页"""
+        tabs = []
+        for window_index, window in enumerate(self.windows):
+            tab_widget = window.tab_widget
+            for index in range(tab_widget.count()):
+                widget = tab_widget.widget(index)
+                if isinstance(widget, PlaceholderTab):
+                    url, title = widget.url, widget.title
+                else:
+                    url, title = widget.url(), widget.title()
+                tabs.append({
+                    "window": window_index,
+                    "index": index,
+                    "tab_id": widget.tab_id,
+                    "url": url.toString(),
+                    "title": title,
+                    "current": index == tab_widget.currentIndex(),
+                    "loaded": not isinstance(widget, PlaceholderTab),
+                })
+        return tabs
+
+    def stats(self):
+        """预测导航、后台写入和用户脚本的计数"""
+        stats = {"speculation": dict(self.speculator.stats),
+                 "user_scripts": self.profile_manager.user_scripts.stats()}
+        if self._history_manager is not None:
+            stats["history_writer"] = self._history_manager.store.writer.stats()
+        if self._bookmark_manager is not None:
+            stats["bookmark_writer"] = self._bookmark_manager.store.writer.stats()
+        return stats
+
+    def command_close(self, tab_id):
+        """关闭指定的标签页，窗口中只剩这一个标签页时关闭窗口"""
+        for window in self.windows:
+            tab_widget = window.tab_widget
+            for index in range(tab_widget.count()):
+                if tab_widget.widget(index).tab_id != tab_id:
+                    continue
+                if tab_widget.count() > 1:
+                    tab_widget.close_tab(index)
+                else:
+                    window.close()
+                return {"ok": True}
+        return {"ok": False, "error": f"没有这个标签页: {tab_id}"}
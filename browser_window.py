@@ -1,57 +1,116 @@
 from PySide2.QtWidgets import (QMainWindow, QToolBar, QLineEdit, QAction, QMenu, QStatusBar,
                                QFileDialog, QMessageBox, QLabel)
-from PySide2.QtGui import QIcon, QKeySequence
-from PySide2.QtCore import QUrl, QSize
-from PySide2.QtWebEngineWidgets import QWebEnginePage, QWebEngineProfile, QWebEngineDownloadItem
+from PySide2.QtGui import QKeySequence
+from PySide2.QtCore import QEvent, QUrl, QSize, QTimer, Signal
+from PySide2.QtWebEngineWidgets import QWebEnginePage
 from tab_widget import TabWidget
-from bookmarks import BookmarkManager
-from SaFan.history import HistoryManager
-import os
+from tab_state import UiRefresher
+from tab_lifecycle import TabLifecycleManager
+from browser_services import BrowserServices
+from downloads import format_size
+from icons import icon
+from omnibox import OmniboxCompleter
+from settings import settings
+from startup_profile import startup
 
 
 class BrowserWindow(QMainWindow):
-    def __init__(self, parent=None):
+    # 窗口第一次绘制完成
+    first_painted = Signal()
+
+    def __init__(self, services=None, open_home=True, parent=None):
         super().__init__(parent)
+        # 没有传入时单独使用一套(测试和基准测试)
+        self.services = services or BrowserServices(parent=self)
+        self.profile_manager = self.services.profile_manager
+        self.profile = self.services.profile
         self.setWindowTitle("SaFan Browser")
         self.resize(1280, 800)
 
         # 创建主部件
-        self.tab_widget = TabWidget()
+        self.tab_widget = TabWidget(self.profile, self.profile_manager.content_filter,
+                                    self.profile_manager.page_metrics, self.profile_manager.user_scripts)
         self.setCentralWidget(self.tab_widget)
 
-        # 连接信号
-        self.tab_widget.url_changed.connect(self.update_url_bar)
-        self.tab_widget.title_changed.connect(self.update_title)
-        self.tab_widget.load_progress.connect(self.update_progress)
+        # 只有当前标签页的状态会刷新到界面，每帧最多一次
+        self.ui_refresher = UiRefresher(self.tab_widget, self.apply_tab_state, self)
+        self.profile_manager.content_filter.blocked_changed.connect(self.ui_refresher.mark_dirty)
+        self.profile_manager.page_metrics.recorded.connect(self.show_load_time)
 
-        # 初始化管理器
-        self.bookmark_manager = BookmarkManager()
-        self.history_manager = HistoryManager()
+        self.tab_widget.page_loaded.connect(self.services.record_visit)
+        self.tab_widget.browser_loaded.connect(self.services.index_page_text)
+        self.services.download_progress.connect(self.update_download_progress)
+        self.tab_widget.browser_loaded.connect(self.profile_manager.collect_cache_stats)
+        startup.mark("创建标签页部件")
 
-        # 创建UI
+        # 创建UI，图标在首次绘制之后再加载
+        self.icon_actions = []
         self.create_actions()
         self.create_toolbar()
         self.create_status_bar()
+        self.painted = False
+        startup.mark("创建菜单和工具栏")
+
+        # 后台标签页冻结/丢弃
+        self.lifecycle_manager = TabLifecycleManager(
+            self.tab_widget,
+            freeze_after=settings.int_value("tabs/freeze_after", 5 * 60),
+            discard_after=settings.int_value("tabs/discard_after", 30 * 60),
+            memory_budget=settings.int_value("tabs/memory_budget_mb", 0) * 1024 * 1024,
+            parent=self)
+        self.lifecycle_manager.memory_reclaimed.connect(self.update_reclaimed_memory)
+        self.tab_widget.set_preload_limit(settings.int_value("tabs/preload_limit", 0))
+        self.tab_widget.reload_crashed = settings.bool_value("tabs/reload_crashed", True)
+        self.tab_widget.tab_crashed.connect(self.show_crash)
 
         # 添加初始标签页 - 必须在创建工具栏之后
-        self.tab_widget.add_new_tab(QUrl("https://www.baidu.com"), "主页")
-
-        # 设置下载处理器
-        profile = QWebEngineProfile.defaultProfile()
-        profile.downloadRequested.connect(self.handle_download_request)
+        if open_home:
+            self.tab_widget.add_new_tab(QUrl("https://www.baidu.com"), "主页")
+        startup.mark("创建初始标签页")
+
+        # 记录到会话中
+        self.services.add_window(self)
+
+    @property
+    def bookmark_manager(self):
+        """所有窗口共用的书签管理器"""
+        return self.services.bookmark_manager
+
+    @property
+    def history_manager(self):
+        """所有窗口共用的历史记录管理器"""
+        return self.services.history_manager
+
+    @property
+    def download_manager(self):
+        """所有窗口共用的下载管理器"""
+        return self.services.download_manager
+
+    def make_action(self, icon_name, text):
+        """创建动作，图标留到 load_icons() 再设置"""
+        action = QAction(text, self)
+        self.icon_actions.append((action, icon_name))
+        return action
+
+    def load_icons(self):
+        """首次绘制之后再从图标缓存加载所有动作的图标"""
+        for action, icon_name in self.icon_actions:
+            action.setIcon(icon(icon_name))
+        self.icon_actions = []
+        startup.mark("加载图标")
 
     def create_actions(self):
         """创建菜单动作"""
         # 文件菜单
-        self.new_tab_action = QAction(QIcon("resources/icons/new_tab.png"), "新建标签页", self)
+        self.new_tab_action = self.make_action("new_tab", "新建标签页")
         self.new_tab_action.setShortcut(QKeySequence.AddTab)
         self.new_tab_action.triggered.connect(self.tab_widget.add_new_tab)
 
-        self.new_window_action = QAction(QIcon("resources/icons/new_window.png"), "新建窗口", self)
+        self.new_window_action = self.make_action("new_window", "新建窗口")
         self.new_window_action.setShortcut("Ctrl+N")
         self.new_window_action.triggered.connect(self.new_window)
 
-        self.private_mode_action = QAction(QIcon("resources/icons/private.png"), "隐私浏览", self)
+        self.private_mode_action = self.make_action("private", "隐私浏览")
         self.private_mode_action.setShortcut("Ctrl+Shift+P")
         self.private_mode_action.triggered.connect(self.toggle_private_mode)
 
@@ -60,21 +119,21 @@ class BrowserWindow(QMainWindow):
         self.close_action.triggered.connect(self.close)
 
         # 编辑菜单
-        self.cut_action = QAction(QIcon("resources/icons/cut.png"), "剪切", self)
+        self.cut_action = self.make_action("cut", "剪切")
         self.cut_action.setShortcut(QKeySequence.Cut)
 
-        self.copy_action = QAction(QIcon("resources/icons/copy.png"), "复制", self)
+        self.copy_action = self.make_action("copy", "复制")
         self.copy_action.setShortcut(QKeySequence.Copy)
 
-        self.paste_action = QAction(QIcon("resources/icons/paste.png"), "粘贴", self)
+        self.paste_action = self.make_action("paste", "粘贴")
         self.paste_action.setShortcut(QKeySequence.Paste)
 
         # 视图菜单
-        self.zoom_in_action = QAction(QIcon("resources/icons/zoom_in.png"), "放大", self)
+        self.zoom_in_action = self.make_action("zoom_in", "放大")
         self.zoom_in_action.setShortcut(QKeySequence.ZoomIn)
         self.zoom_in_action.triggered.connect(self.zoom_in)
 
-        self.zoom_out_action = QAction(QIcon("resources/icons/zoom_out.png"), "缩小", self)
+        self.zoom_out_action = self.make_action("zoom_out", "缩小")
         self.zoom_out_action.setShortcut(QKeySequence.ZoomOut)
         self.zoom_out_action.triggered.connect(self.zoom_out)
 
@@ -83,24 +142,44 @@ class BrowserWindow(QMainWindow):
         self.reset_zoom_action.triggered.connect(self.reset_zoom)
 
         # 书签菜单
-        self.bookmark_page_action = QAction(QIcon("resources/icons/bookmark.png"), "添加书签", self)
+        self.bookmark_page_action = self.make_action("bookmark", "添加书签")
         self.bookmark_page_action.setShortcut("Ctrl+D")
         self.bookmark_page_action.triggered.connect(self.bookmark_current_page)
 
-        self.show_bookmarks_action = QAction(QIcon("resources/icons/bookmarks.png"), "书签管理器", self)
+        self.show_bookmarks_action = self.make_action("bookmarks", "书签管理器")
         self.show_bookmarks_action.setShortcut("Ctrl+Shift+B")
         self.show_bookmarks_action.triggered.connect(self.show_bookmarks_manager)
 
         # 工具菜单
-        self.downloads_action = QAction(QIcon("resources/icons/downloads.png"), "下载内容", self)
+        self.downloads_action = self.make_action("downloads", "下载内容")
         self.downloads_action.setShortcut("Ctrl+J")
         self.downloads_action.triggered.connect(self.show_downloads_manager)
 
-        self.history_action = QAction(QIcon("resources/icons/history.png"), "历史记录", self)
+        self.history_action = self.make_action("history", "历史记录")
         self.history_action.setShortcut("Ctrl+H")
         self.history_action.triggered.connect(self.show_history_manager)
 
-        self.developer_tools_action = QAction(QIcon("resources/icons/dev_tools.png"), "开发者工具", self)
+        self.cache_settings_action = QAction("缓存设置", self)
+        self.cache_settings_action.triggered.connect(self.show_cache_settings)
+
+        self.export_metrics_action = QAction("导出页面加载数据", self)
+        self.export_metrics_action.triggered.connect(self.export_page_metrics)
+
+        self.adblock_action = QAction("拦截广告和跟踪器", self)
+        self.adblock_action.setCheckable(True)
+        self.adblock_action.setChecked(self.profile_manager.content_filter.enabled)
+        self.adblock_action.toggled.connect(self.profile_manager.content_filter.set_enabled)
+
+        self.user_scripts_action = QAction("用户脚本和样式", self)
+        self.user_scripts_action.setCheckable(True)
+        self.user_scripts_action.setChecked(self.profile_manager.user_scripts.enabled)
+        self.user_scripts_action.toggled.connect(self.profile_manager.user_scripts.set_enabled)
+
+        self.task_manager_action = QAction("任务管理器", self)
+        self.task_manager_action.setShortcut("Shift+Esc")
+        self.task_manager_action.triggered.connect(self.show_task_manager)
+
+        self.developer_tools_action = self.make_action("dev_tools", "开发者工具")
         self.developer_tools_action.setShortcut("F12")
         self.developer_tools_action.triggered.connect(self.toggle_developer_tools)
 
@@ -112,30 +191,30 @@ class BrowserWindow(QMainWindow):
         self.addToolBar(nav_toolbar)
 
         # 后退按钮
-        self.back_btn = QAction(QIcon("resources/icons/back.png"), "后退", self)
+        self.back_btn = self.make_action("back", "后退")
         self.back_btn.setShortcut(QKeySequence.Back)
         self.back_btn.triggered.connect(self.back)
         nav_toolbar.addAction(self.back_btn)
 
         # 前进按钮
-        self.forward_btn = QAction(QIcon("resources/icons/forward.png"), "前进", self)
+        self.forward_btn = self.make_action("forward", "前进")
         self.forward_btn.setShortcut(QKeySequence.Forward)
         self.forward_btn.triggered.connect(self.forward)
         nav_toolbar.addAction(self.forward_btn)
 
         # 刷新按钮
-        self.refresh_btn = QAction(QIcon("resources/icons/refresh.png"), "刷新", self)
+        self.refresh_btn = self.make_action("refresh", "刷新")
         self.refresh_btn.setShortcut(QKeySequence.Refresh)
         self.refresh_btn.triggered.connect(self.reload)
         nav_toolbar.addAction(self.refresh_btn)
 
         # 停止按钮
-        self.stop_btn = QAction(QIcon("resources/icons/stop.png"), "停止", self)
+        self.stop_btn = self.make_action("stop", "停止")
         self.stop_btn.triggered.connect(self.stop)
         nav_toolbar.addAction(self.stop_btn)
 
         # 主页按钮
-        self.home_btn = QAction(QIcon("resources/icons/home.png"), "主页", self)
+        self.home_btn = self.make_action("home", "主页")
         self.home_btn.triggered.connect(self.navigate_home)
         nav_toolbar.addAction(self.home_btn)
 
@@ -146,22 +225,27 @@ class BrowserWindow(QMainWindow):
         self.url_bar.setPlaceholderText("输入网址或搜索内容")
         self.url_bar.setMinimumWidth(400)
         self.url_bar.returnPressed.connect(self.navigate_to_url)
+        self.url_bar.textEdited.connect(lambda text: self.services.speculator.text_edited(text, self.tab_widget))
         nav_toolbar.addWidget(self.url_bar)
 
+        # 地址栏补全，索引由所有窗口共用
+        self.omnibox = OmniboxCompleter(self.url_bar, self.services.omnibox_index, self)
+        self.omnibox.activated.connect(self.navigate_to_url)
+
         nav_toolbar.addSeparator()
 
         # 书签按钮
-        self.bookmark_btn = QAction(QIcon("resources/icons/bookmark.png"), "书签", self)
+        self.bookmark_btn = self.make_action("bookmark", "书签")
         self.bookmark_btn.triggered.connect(self.bookmark_current_page)
         nav_toolbar.addAction(self.bookmark_btn)
 
         # 下载按钮
-        self.downloads_btn = QAction(QIcon("resources/icons/downloads.png"), "下载", self)
+        self.downloads_btn = self.make_action("downloads", "下载")
         self.downloads_btn.triggered.connect(self.show_downloads_manager)
         nav_toolbar.addAction(self.downloads_btn)
 
         # 菜单按钮
-        self.menu_btn = QAction(QIcon("resources/icons/menu.png"), "菜单", self)
+        self.menu_btn = self.make_action("menu", "菜单")
         self.menu_btn.triggered.connect(self.show_app_menu)
         nav_toolbar.addAction(self.menu_btn)
 
@@ -173,6 +257,15 @@ class BrowserWindow(QMainWindow):
         self.progress_label = QLabel("就绪")
         status_bar.addWidget(self.progress_label)
 
+        self.download_label = QLabel()
+        status_bar.addPermanentWidget(self.download_label)
+
+        self.memory_label = QLabel()
+        status_bar.addPermanentWidget(self.memory_label)
+
+        self.blocked_label = QLabel()
+        status_bar.addPermanentWidget(self.blocked_label)
+
         self.secure_label = QLabel()
         status_bar.addPermanentWidget(self.secure_label)
 
@@ -211,16 +304,30 @@ class BrowserWindow(QMainWindow):
         browser = self.tab_widget.current_browser()
         if not browser:
             return
+        # 之后地址栏跟随页面的地址更新
+        self.url_bar.setModified(False)
 
         # 尝试处理为URL
         if "." in url_text and " " not in url_text:
             if not url_text.startswith(("http://", "https://")):
                 url_text = "https://" + url_text
-            browser.setUrl(QUrl(url_text))
+            url = QUrl(url_text)
         else:
             # 作为搜索查询
-            search_url = f"https://www.baidu.com/baidu?ie=utf-8&wd={url_text.replace(' ', '+')}"
-            browser.setUrl(QUrl(search_url))
+            url = QUrl(f"https://www.baidu.com/baidu?ie=utf-8&wd={url_text.replace(' ', '+')}")
+
+        # 新标签页没有后退记录，可以直接换成预渲染好的页面
+        prerender = self.services.speculator.take(url, self.tab_widget, not browser.history().canGoBack())
+        if prerender:
+            index = self.tab_widget.indexOf(browser)
+            self.tab_widget.adopt_browser(index, prerender.browser, prerender.loaded and prerender.ok)
+        else:
+            browser.setUrl(url)
+
+    def open_urls(self, urls):
+        """批量打开网址，除第一个外都在后台以占位标签页打开"""
+        for i, url in enumerate(urls):
+            self.tab_widget.add_new_tab(QUrl(url), url, lazy=i > 0)
 
     def navigate_home(self):
         """导航到主页"""
@@ -228,29 +335,54 @@ class BrowserWindow(QMainWindow):
         if browser:
             browser.setUrl(QUrl("https://www.baidu.com"))
 
-    def update_url_bar(self, url):
-        """更新地址栏"""
-        if self.tab_widget.current_browser() == self.sender():
-            self.url_bar.setText(url.toString())
+    def apply_tab_state(self, browser, state, switched):
+        """把当前标签页的状态显示到地址栏、标题和状态栏"""
+        # 用户正在地址栏中输入时不覆盖，切换标签页时除外
+        url = state.url.toString()
+        if self.url_bar.text() != url and (switched or not self.url_bar.isModified()):
+            self.url_bar.setText(url)
             self.url_bar.setCursorPosition(0)
 
-            # 更新安全状态
-            if url.scheme() == "https":
-                self.secure_label.setText("安全连接 🔒")
-            else:
-                self.secure_label.setText("不安全连接")
+        title = f"{state.title} - SaFan Browser" if state.title else "SaFan Browser"
+        if self.windowTitle() != title:
+            self.setWindowTitle(title)
 
-    def update_title(self, title):
-        """更新窗口标题"""
-        if self.tab_widget.current_browser() == self.sender():
-            self.setWindowTitle(f"{title} - SaFan Browser")
+        if state.crashed:
+            progress = "页面已崩溃"
+        elif state.loading:
+            progress = f"加载中... {state.progress}%"
+        elif state.load_time_ms is not None:
+            progress = f"就绪 ({state.load_time_ms / 1000:.2f} 秒)"
+        else:
+            progress = "就绪"
+        self.progress_label.setText(progress)
+        self.secure_label.setText("安全连接 🔒" if state.secure else "不安全连接")
 
-    def update_progress(self, progress):
-        """更新加载进度"""
-        if progress < 100:
-            self.progress_label.setText(f"加载中... {progress}%")
+        count = self.profile_manager.content_filter.blocked_count(browser)
+        self.blocked_label.setText(f"已拦截 {count}" if count else "")
+
+    def show_load_time(self, record):
+        """记录标签页的加载耗时，是当前标签页时显示在状态栏"""
+        if not record.ok:
+            return
+        for index in range(self.tab_widget.count()):
+            browser = self.tab_widget.widget(index)
+            if getattr(browser, "tab_id", None) == record.tab_id and hasattr(browser, "tab_state"):
+                browser.tab_state.load_time_ms = record.load_finished_ms
+                self.ui_refresher.mark_dirty(browser)
+                break
+
+    def show_crash(self, browser, reload):
+        """在状态栏提示标签页崩溃"""
+        title = browser.tab_state.title or browser.tab_state.url.toString()
+        if reload:
+            self.statusBar().showMessage(f"“{title}”的渲染进程已崩溃，正在重新加载", 5000)
         else:
-            self.progress_label.setText("就绪")
+            self.statusBar().showMessage(f"“{title}”反复崩溃，已停止自动重新加载", 10000)
+
+    def update_reclaimed_memory(self, reclaimed):
+        """显示后台标签页回收的内存"""
+        self.memory_label.setText(f"已回收 {reclaimed / (1024 * 1024):.0f} MB")
 
     def bookmark_current_page(self):
         """添加当前页面到书签"""
@@ -261,6 +393,10 @@ class BrowserWindow(QMainWindow):
         current_url = browser.url().toString()
         current_title = browser.title()
 
+        if self.bookmark_manager.find_bookmark(current_url):
+            QMessageBox.information(self, "书签", f"'{current_title}' 已在书签中")
+            return
+
         self.bookmark_manager.add_bookmark(current_title, current_url)
         QMessageBox.information(self, "书签已添加", f"已添加 '{current_title}' 到书签")
 
@@ -276,6 +412,30 @@ class BrowserWindow(QMainWindow):
         """显示下载管理器"""
         self.download_manager.show()
 
+    def show_cache_settings(self):
+        """显示缓存设置"""
+        self.services.cache_settings.show()
+
+    def show_task_manager(self):
+        """显示任务管理器"""
+        self.services.task_manager_window.show()
+
+    def export_page_metrics(self):
+        """把页面加载记录导出为 JSON 或 CSV"""
+        path, selected = QFileDialog.getSaveFileName(self, "导出页面加载数据", "page-metrics.json",
+                                                     "JSON (*.json);;CSV (*.csv)")
+        if not path:
+            return
+
+        metrics = self.profile_manager.page_metrics
+        try:
+            if path.endswith(".csv") or selected.startswith("CSV"):
+                metrics.export_csv(path)
+            else:
+                metrics.export_json(path)
+        except OSError as e:
+            QMessageBox.warning(self, "导出失败", str(e))
+
     def toggle_developer_tools(self):
         """切换开发者工具"""
         browser = self.tab_widget.current_browser()
@@ -287,42 +447,35 @@ class BrowserWindow(QMainWindow):
         else:
             browser.page().setDevToolsPage(QWebEnginePage())
 
-    def handle_download_request(self, download: QWebEngineDownloadItem):
-        """处理下载请求"""
-        # 获取下载目录
-        download_dir = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
-
-        # 构建默认保存路径
-        default_path = os.path.join(download_dir, download.suggestedFileName())
-
-        # 弹出保存对话框
-        path, _ = QFileDialog.getSaveFileName(
-            self, "保存文件",
-            default_path
-        )
-
-        if path:
-            download.setPath(path)
-            download.accept()
-            self.download_manager.add_download(download)
+    def update_download_progress(self, received, total):
+        """在状态栏显示下载进度"""
+        if not total and not received:
+            self.download_label.setText("")
+        elif total:
+            self.download_label.setText(f"下载 {received * 100 // total}%")
+        else:
+            self.download_label.setText(f"下载 {format_size(received)}")
 
     def zoom_in(self):
         """放大页面"""
         browser = self.tab_widget.current_browser()
         if browser:
             browser.setZoomFactor(browser.zoomFactor() + 0.1)
+            self.tab_widget.tab_updated.emit(browser)
 
     def zoom_out(self):
         """缩小页面"""
         browser = self.tab_widget.current_browser()
         if browser:
             browser.setZoomFactor(max(0.1, browser.zoomFactor() - 0.1))
+            self.tab_widget.tab_updated.emit(browser)
 
     def reset_zoom(self):
         """重置缩放"""
         browser = self.tab_widget.current_browser()
         if browser:
             browser.setZoomFactor(1.0)
+            self.tab_widget.tab_updated.emit(browser)
 
     def toggle_private_mode(self):
         """切换隐私浏览模式"""
@@ -331,8 +484,27 @@ class BrowserWindow(QMainWindow):
 
     def new_window(self):
         """创建新窗口"""
-        new_browser = BrowserWindow()
-        new_browser.show()
+        self.services.new_window()
+
+    def changeEvent(self, event):
+        """记录最近激活的窗口，其他进程打开的网址显示在这个窗口中"""
+        if event.type() == QEvent.ActivationChange and self.isActiveWindow():
+            self.services.window_activated(self)
+        super().changeEvent(event)
+
+    def paintEvent(self, event):
+        """第一次绘制之后再加载图标"""
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            startup.mark("首次绘制")
+            QTimer.singleShot(0, self.load_icons)
+            self.first_painted.emit()
+
+    def closeEvent(self, event):
+        """关闭窗口时通知会话"""
+        self.services.window_closed(self)
+        super().closeEvent(event)
 
     def show_app_menu(self):
         """显示应用菜单"""
@@ -367,6 +539,11 @@ class BrowserWindow(QMainWindow):
         tools_menu = menu.addMenu("工具")
         tools_menu.addAction(self.downloads_action)
         tools_menu.addAction(self.history_action)
+        tools_menu.addAction(self.task_manager_action)
+        tools_menu.addAction(self.cache_settings_action)
+        tools_menu.addAction(self.adblock_action)
+        tools_menu.addAction(self.user_scripts_action)
+        tools_menu.addAction(self.export_metrics_action)
         tools_menu.addAction(self.developer_tools_action)
 
         # 显示菜单
@@ -0,0 +1,634 @@
+import os
+import re
+import time
+from collections import deque
+from PySide2.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton,
+                               QCheckBox, QInputDialog, QAbstractItemView, QHeaderView)
+from PySide2.QtCore import QObject, QTimer, QUrl, QFile, QIODevice, QStandardPaths, Signal
+from PySide2.QtGui import QDesktopServices
+from PySide2.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
+from PySide2.QtWebEngineWidgets import QWebEngineDownloadItem
+from settings import settings
+
+# 界面刷新间隔(毫秒)，进度按这个频率汇总，而不是每收到一块数据就刷新
+UI_REFRESH_MS = 250
+
+# 读取/限速的节拍(毫秒)
+PUMP_MS = 50
+
+# 分段下载时每段的最小字节数
+MIN_SEGMENT = 1024 * 1024
+
+# 每个连接的读缓冲区，限速时超出部分留在内核里形成背压
+READ_BUFFER = 256 * 1024
+
+CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)", re.I)
+
+QUEUED = "排队中"
+RUNNING = "下载中"
+PAUSED = "已暂停"
+FINISHED = "已完成"
+FAILED = "失败"
+CANCELLED = "已取消"
+
+
+def unique_path(directory, file_name):
+    """在目录中为文件名找一个不冲突的路径: name.ext, name (1).ext, ..."""
+    base, ext = os.path.splitext(file_name or "download")
+    path = os.path.join(directory, base + ext)
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{base} ({n}){ext}")
+        n += 1
+    return path
+
+
+def format_size(size):
+    """把字节数格式化为便于阅读的文本"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class TokenBucket:
+    """令牌桶限速，rate 为每秒字节数，0 表示不限速
+
+    允许透支: 消耗超过现有令牌时余额变为负数，需要等令牌补回来。
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.tokens = min(self.tokens, rate)
+
+    def available(self):
+        """当前可用的字节数"""
+        if not self.rate:
+            return float("inf")
+        now = time.monotonic()
+        # 最多积攒一秒的令牌
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def consume(self, amount):
+        if self.rate:
+            self.available()
+            self.tokens -= amount
+
+
+class DownloadJob(QObject):
+    """下载任务基类"""
+
+    state_changed = Signal()
+    # 有新数据可以读取
+    data_ready = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.state = QUEUED
+        self.error = ""
+        self.bucket = TokenBucket()
+        # 因限速而暂停
+        self.throttled = False
+
+    def set_state(self, state, error=""):
+        self.state = state
+        self.error = error
+        self.state_changed.emit()
+
+    def is_done(self):
+        return self.state in (FINISHED, FAILED, CANCELLED)
+
+    def file_name(self):
+        return os.path.basename(self.path())
+
+    def path(self):
+        raise NotImplementedError
+
+    def received(self):
+        raise NotImplementedError
+
+    def total(self):
+        """总字节数，未知时返回 0"""
+        raise NotImplementedError
+
+    def start(self):
+        raise NotImplementedError
+
+    def pause(self):
+        raise NotImplementedError
+
+    def cancel(self):
+        raise NotImplementedError
+
+    def pump(self, budget):
+        """在限速额度内处理数据，返回本次处理的字节数"""
+        return 0
+
+
+class WebEngineDownloadJob(DownloadJob):
+    """网页触发的下载，由 Chromium 负责传输
+
+    Chromium 不支持限速，超出额度时暂停，额度恢复后再继续。
+    """
+
+    def __init__(self, item, parent=None):
+        super().__init__(parent)
+        self.item = item
+        self.last_received = 0
+        item.finished.connect(self.item_finished)
+
+    def path(self):
+        return self.item.path()
+
+    def received(self):
+        return self.item.receivedBytes()
+
+    def total(self):
+        return max(self.item.totalBytes(), 0)
+
+    def start(self):
+        self.throttled = False
+        self.item.resume()
+        self.set_state(RUNNING)
+
+    def pause(self):
+        self.item.pause()
+        self.set_state(PAUSED)
+
+    def cancel(self):
+        self.item.cancel()
+
+    def pump(self, budget):
+        received = self.received()
+        delta = received - self.last_received
+        self.last_received = received
+        return delta
+
+    def item_finished(self):
+        state = self.item.state()
+        if state == QWebEngineDownloadItem.DownloadCompleted:
+            self.set_state(FINISHED)
+        elif state == QWebEngineDownloadItem.DownloadCancelled:
+            self.set_state(CANCELLED)
+        else:
+            self.set_state(FAILED, self.item.interruptReasonString())
+
+
+class Segment:
+    """分段下载中的一段: [pos, end]，end 为 None 表示直到文件结尾"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.pos = start
+        self.end = end
+        self.reply = None
+        self.network_done = False
+        # 已确认响应的内容从 pos 开始
+        self.checked = False
+
+    def is_complete(self):
+        return self.network_done and (self.reply is None or self.reply.bytesAvailable() == 0)
+
+
+class HttpDownloadJob(DownloadJob):
+    """直接通过 HTTP 下载的任务
+
+    服务器支持 Range 时把文件分成多段并行下载，写入预先分配好的文件的
+    对应位置；暂停时断开连接，继续时从各段当前位置发起新的 Range 请求。
+    """
+
+    def __init__(self, network, url, path, segments=4, parent=None):
+        super().__init__(parent)
+        self.network = network
+        self.url = url
+        self.target_path = path
+        self.max_segments = segments
+        self.segments = []
+        self.size = 0
+        self.ranges = False
+        self.probed = False
+        self.file = None
+        self.bytes_received = 0
+
+    def path(self):
+        return self.target_path
+
+    def received(self):
+        return self.bytes_received
+
+    def total(self):
+        return self.size
+
+    def start(self):
+        self.throttled = False
+        self.set_state(RUNNING)
+        if not self.probed:
+            self.probe()
+        else:
+            self.start_segments()
+
+    def probe(self):
+        """先发送 HEAD 请求获取文件大小以及是否支持 Range"""
+        reply = self.network.head(self.make_request())
+        reply.finished.connect(lambda: self.probe_finished(reply))
+
+    def make_request(self, start=None, end=None):
+        request = QNetworkRequest(self.url)
+        request.setAttribute(QNetworkRequest.RedirectPolicyAttribute, QNetworkRequest.NoLessSafeRedirectPolicy)
+        if start is not None:
+            end_text = "" if end is None else str(end)
+            request.setRawHeader(b"Range", f"bytes={start}-{end_text}".encode())
+        return request
+
+    def probe_finished(self, reply):
+        reply.deleteLater()
+        if self.state != RUNNING:
+            return
+
+        # 不支持 HEAD 的服务器按大小未知、不支持 Range 处理
+        if reply.error() == QNetworkReply.NoError:
+            self.size = int(reply.header(QNetworkRequest.ContentLengthHeader) or 0)
+            self.ranges = bytes(reply.rawHeader(b"Accept-Ranges")).strip().lower() == b"bytes"
+
+        count = 1
+        if self.ranges and self.size:
+            count = max(1, min(self.max_segments, self.size // MIN_SEGMENT))
+        if count == 1:
+            self.segments = [Segment(0, self.size - 1 if self.size else None)]
+        else:
+            step = self.size // count
+            self.segments = [Segment(i * step, self.size - 1 if i == count - 1 else (i + 1) * step - 1)
+                             for i in range(count)]
+
+        self.file = QFile(self.target_path)
+        if not self.file.open(QIODevice.ReadWrite | QIODevice.Truncate):
+            self.fail(self.file.errorString())
+            return
+        if self.size:
+            self.file.resize(self.size)
+
+        self.probed = True
+        self.start_segments()
+
+    def start_segments(self):
+        for segment in self.segments:
+            if segment.is_complete() and segment.reply is None:
+                continue
+            if not self.ranges and segment.pos:
+                # 不支持 Range，只能从头开始
+                self.bytes_received -= segment.pos
+                segment.pos = 0
+
+            ranged = self.ranges and len(self.segments) > 1 or segment.pos > 0
+            request = self.make_request(segment.pos, segment.end) if ranged else self.make_request()
+            segment.network_done = False
+            segment.checked = False
+            segment.reply = self.network.get(request)
+            segment.reply.setReadBufferSize(READ_BUFFER)
+            segment.reply.readyRead.connect(self.data_ready)
+            segment.reply.finished.connect(lambda segment=segment: self.segment_finished(segment))
+
+    def pump(self, budget):
+        consumed = 0
+        for segment in self.segments:
+            reply = segment.reply
+            if reply is None:
+                continue
+            # 收到第一块数据时响应头已经完整
+            if not segment.checked and (reply.bytesAvailable() > 0 or segment.network_done):
+                if not self.check_reply(segment):
+                    return consumed
+            while budget > 0 and reply.bytesAvailable() > 0:
+                data = reply.read(int(min(budget, reply.bytesAvailable())))
+                if not data:
+                    break
+                self.file.seek(segment.pos)
+                self.file.write(data)
+                size = len(data)
+                segment.pos += size
+                self.bytes_received += size
+                consumed += size
+                budget -= size
+            if segment.is_complete():
+                segment.reply.deleteLater()
+                segment.reply = None
+                if segment.end is not None and segment.pos != segment.end + 1:
+                    self.fail(f"下载不完整: 第 {segment.start} 字节起的一段"
+                              f"收到 {segment.pos - segment.start} 字节，应为 {segment.end + 1 - segment.start} 字节")
+                    return consumed
+
+        if self.state == RUNNING and self.probed and all(segment.is_complete() for segment in self.segments):
+            self.file.close()
+            self.set_state(FINISHED)
+        return consumed
+
+    def check_reply(self, segment):
+        """确认响应的内容从 segment.pos 开始，否则改为单段下载或失败，返回是否可以写入
+
+        Range 请求只接受 206 和与请求一致的 Content-Range；服务器忽略 Range
+        返回 200 时内容是整个文件，丢弃已下载的部分，从头单段下载。
+        """
+        reply = segment.reply
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        ranged = reply.request().hasRawHeader(b"Range")
+        if status is not None and not 200 <= status < 300:
+            self.fail(f"服务器返回 HTTP {status}")
+            return False
+        if status == 206:
+            match = CONTENT_RANGE.match(bytes(reply.rawHeader(b"Content-Range")).decode("latin-1").strip())
+            if (not ranged or not match or int(match.group(1)) != segment.pos
+                    or segment.end is not None and int(match.group(2)) != segment.end):
+                self.fail("服务器返回的范围与请求不一致")
+                return False
+        elif ranged:
+            self.restart_without_ranges()
+            return False
+        segment.checked = True
+        return True
+
+    def restart_without_ranges(self):
+        self.stop_segments()
+        self.ranges = False
+        self.bytes_received = 0
+        self.segments = [Segment(0, self.size - 1 if self.size else None)]
+        self.start_segments()
+
+    def segment_finished(self, segment):
+        reply = segment.reply
+        if reply is None or self.state != RUNNING:
+            return
+        if reply.error() != QNetworkReply.NoError:
+            self.fail(reply.errorString())
+            return
+        segment.network_done = True
+        self.data_ready.emit()
+
+    def stop_segments(self):
+        for segment in self.segments:
+            if segment.reply is not None:
+                reply = segment.reply
+                segment.reply = None
+                segment.network_done = segment.end is not None and segment.pos > segment.end
+                reply.abort()
+                reply.deleteLater()
+
+    def pause(self):
+        self.set_state(PAUSED)
+        self.stop_segments()
+
+    def cancel(self):
+        self.set_state(CANCELLED)
+        self.stop_segments()
+        if self.file is not None:
+            self.file.remove()
+
+    def fail(self, error):
+        self.set_state(FAILED, error)
+        self.stop_segments()
+        if self.file is not None:
+            self.file.close()
+
+
+class DownloadManager(QWidget):
+    """下载管理器
+
+    排队执行下载任务，同时进行的任务数不超过 max_active；
+    支持全局和单个任务的限速、暂停和继续。进度每 UI_REFRESH_MS 毫秒
+    汇总刷新一次。
+    """
+
+    # 所有未完成任务的 (已接收字节, 总字节)
+    progress_updated = Signal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("下载内容")
+        self.resize(700, 400)
+
+        self.max_active = settings.int_value("downloads/max_active", 3)
+        self.ask_where = settings.bool_value("downloads/ask_where", True)
+        self.global_bucket = TokenBucket(settings.int_value("downloads/global_limit_kbps", 0) * 1024)
+
+        self.network = QNetworkAccessManager(self)
+        self.jobs = []
+        self.queue = deque()
+        # 上一次刷新时每个任务已接收的字节数，用于计算速度
+        self.last_received = {}
+
+        self.pump_timer = QTimer(self)
+        self.pump_timer.setInterval(PUMP_MS)
+        self.pump_timer.timeout.connect(self.pump)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(UI_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+        # 创建布局
+        layout = QVBoxLayout()
+
+        self.download_table = QTableWidget(0, 4)
+        self.download_table.setHorizontalHeaderLabels(["文件", "进度", "速度", "状态"])
+        self.download_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.download_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.download_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.download_table.verticalHeader().hide()
+        self.download_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(self.download_table)
+
+        self.ask_where_check = QCheckBox("每次下载前询问保存位置")
+        self.ask_where_check.setChecked(self.ask_where)
+        self.ask_where_check.toggled.connect(self.set_ask_where)
+        layout.addWidget(self.ask_where_check)
+
+        # 按钮布局
+        button_layout = QHBoxLayout()
+
+        self.add_btn = QPushButton("添加链接")
+        self.add_btn.clicked.connect(self.prompt_url)
+        button_layout.addWidget(self.add_btn)
+
+        self.pause_btn = QPushButton("暂停")
+        self.pause_btn.clicked.connect(lambda: self.pause(self.current_job()))
+        button_layout.addWidget(self.pause_btn)
+
+        self.resume_btn = QPushButton("继续")
+        self.resume_btn.clicked.connect(lambda: self.resume(self.current_job()))
+        button_layout.addWidget(self.resume_btn)
+
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(lambda: self.cancel(self.current_job()))
+        button_layout.addWidget(self.cancel_btn)
+
+        self.open_folder_btn = QPushButton("打开文件夹")
+        self.open_folder_btn.clicked.connect(self.open_folder)
+        button_layout.addWidget(self.open_folder_btn)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def download_directory(self):
+        """默认下载目录"""
+        return QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
+
+    def set_ask_where(self, ask):
+        self.ask_where = ask
+        settings.set_value("downloads/ask_where", ask)
+
+    def set_max_active(self, count):
+        """设置同时进行的下载数"""
+        self.max_active = max(1, count)
+        self.start_next()
+
+    def set_global_limit(self, bytes_per_second):
+        """设置全局限速，0 表示不限速"""
+        self.global_bucket.set_rate(bytes_per_second)
+
+    def set_job_limit(self, job, bytes_per_second):
+        """设置单个任务的限速，0 表示不限速"""
+        job.bucket.set_rate(bytes_per_second)
+
+    def add_download(self, item):
+        """添加网页触发的下载，调用前 item 必须已经 accept()"""
+        job = WebEngineDownloadJob(item, self)
+        # 超出并发数时先暂停，轮到它时再继续
+        item.pause()
+        return self.add_job(job)
+
+    def add_url(self, url, path=None, segments=4):
+        """直接下载某个 URL"""
+        if path is None:
+            path = unique_path(self.download_directory(), os.path.basename(url.path()))
+        return self.add_job(HttpDownloadJob(self.network, url, path, segments, self))
+
+    def add_job(self, job):
+        self.jobs.append(job)
+        self.queue.append(job)
+        self.last_received[job] = 0
+        job.state_changed.connect(self.job_state_changed)
+        job.data_ready.connect(lambda: self.pump_job(job))
+        self.add_row(job)
+        self.start_next()
+        return job
+
+    def prompt_url(self):
+        url, ok = QInputDialog.getText(self, "添加链接", "URL:")
+        if ok and url:
+            self.add_url(QUrl.fromUserInput(url))
+
+    def active_jobs(self):
+        return [job for job in self.jobs if job.state == RUNNING or job.throttled]
+
+    def start_next(self):
+        """在并发数限制内开始排队的任务"""
+        while self.queue and len(self.active_jobs()) < self.max_active:
+            job = self.queue.popleft()
+            if job.state == QUEUED:
+                job.start()
+        if self.active_jobs():
+            self.pump_timer.start()
+            self.refresh_timer.start()
+
+    def pause(self, job):
+        if job and job.state == RUNNING or job and job.throttled:
+            job.throttled = False
+            job.pause()
+            self.start_next()
+
+    def resume(self, job):
+        if job and job.state == PAUSED and not job.throttled:
+            job.set_state(QUEUED)
+            self.queue.appendleft(job)
+            self.start_next()
+
+    def cancel(self, job):
+        if job and not job.is_done():
+            if job in self.queue:
+                self.queue.remove(job)
+            job.cancel()
+
+    def job_state_changed(self):
+        job = self.sender()
+        if job.is_done():
+            self.start_next()
+            self.refresh()
+
+    def pump(self):
+        """定时处理所有进行中的任务"""
+        for job in self.active_jobs():
+            self.pump_job(job)
+
+        if not self.active_jobs():
+            self.pump_timer.stop()
+
+    def pump_job(self, job):
+        """按限速额度读取数据，超出额度的网页下载暂时挂起"""
+        if job.state != RUNNING and not job.throttled:
+            return
+
+        budget = min(self.global_bucket.available(), job.bucket.available())
+        if job.throttled:
+            if budget > 0:
+                job.start()
+            return
+        if budget <= 0:
+            if isinstance(job, WebEngineDownloadJob):
+                job.throttled = True
+                job.item.pause()
+            return
+
+        consumed = job.pump(budget if budget != float("inf") else 1 << 62)
+        self.global_bucket.consume(consumed)
+        job.bucket.consume(consumed)
+
+    def refresh(self):
+        """按固定频率刷新界面并汇总进度"""
+        received = total = 0
+        for row, job in enumerate(self.jobs):
+            done = job.received()
+            speed = (done - self.last_received.get(job, 0)) * 1000 / UI_REFRESH_MS
+            self.last_received[job] = done
+            if not job.is_done():
+                received += done
+                total += job.total()
+            self.update_row(row, job, speed)
+
+        self.progress_updated.emit(received, total)
+        if not self.active_jobs():
+            self.refresh_timer.stop()
+
+    def add_row(self, job):
+        row = self.download_table.rowCount()
+        self.download_table.insertRow(row)
+        for column in range(4):
+            self.download_table.setItem(row, column, QTableWidgetItem())
+        self.update_row(row, job, 0)
+
+    def update_row(self, row, job, speed):
+        total = job.total()
+        if total:
+            progress = f"{format_size(job.received())} / {format_size(total)}"
+        else:
+            progress = format_size(job.received())
+        state = "已限速" if job.throttled else job.state
+        self.download_table.item(row, 0).setText(job.file_name())
+        self.download_table.item(row, 1).setText(progress)
+        self.download_table.item(row, 2).setText(f"{format_size(speed)}/s" if job.state == RUNNING else "")
+        self.download_table.item(row, 3).setText(f"{state}: {job.error}" if job.error else state)
+
+    def current_job(self):
+        row = self.download_table.currentRow()
+        if 0 <= row < len(self.jobs):
+            return self.jobs[row]
+        return None
+
+    def open_folder(self):
+        job = self.current_job()
+        directory = os.path.dirname(job.path()) if job else self.download_directory()
+        QDesktopServices.openUrl(QUrl.fromLocalFile(directory))
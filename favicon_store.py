@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS favicons (
+    host TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class FaviconStore:
+    """按主机名保存网站图标(PNG)的 SQLite 存储
+
+    每个线程使用自己的 FaviconStore 实例。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def get(self, host):
+        """返回图标数据，没有时返回 None"""
+        row = self.conn.execute("SELECT data FROM favicons WHERE host = ?", (host,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, host, data):
+        """保存或替换某个主机的图标"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO favicons (host, data, updated_at) VALUES (?, ?, ?)",
+            (host, sqlite3.Binary(data), time.time()))
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM favicons").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
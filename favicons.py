@@ -0,0 +1,163 @@
+import threading
+from collections import OrderedDict
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, QBuffer, QByteArray, QIODevice, QUrl, Signal
+from PySide2.QtGui import QIcon, QImage, QPixmap
+from PySide2.QtWidgets import QApplication
+from favicon_store import FaviconStore
+from history_store import url_host
+from settings import settings
+from storage import data_path
+
+# 保存和显示的图标尺寸
+ICON_SIZE = 32
+
+# 每个工作线程一个数据库连接
+_local = threading.local()
+
+
+def _store(path):
+    store = getattr(_local, "store", None)
+    if store is None or store.path != path:
+        store = _local.store = FaviconStore(path)
+    return store
+
+
+def _host(url):
+    if isinstance(url, QUrl):
+        return url.host().lower()
+    return url_host(url)
+
+
+class TaskSignals(QObject):
+    # 主机名, 解码后的图标(没有保存过时为空)
+    loaded = Signal(str, QImage)
+
+
+class LoadTask(QRunnable):
+    """在线程池中从磁盘存储读取并解码图标"""
+
+    def __init__(self, path, host, signals):
+        super().__init__()
+        self.path = path
+        self.host = host
+        self.signals = signals
+
+    def run(self):
+        data = _store(self.path).get(self.host)
+        image = QImage.fromData(data) if data else QImage()
+        self.signals.loaded.emit(self.host, image)
+
+
+class SaveTask(QRunnable):
+    """在线程池中把页面提供的图标编码为 PNG 并保存"""
+
+    def __init__(self, path, host, image):
+        super().__init__()
+        self.path = path
+        self.host = host
+        self.image = image
+
+    def run(self):
+        _store(self.path).put(self.host, encode_png(self.image))
+
+
+def encode_png(image):
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(data)
+
+
+class FaviconService(QObject):
+    """按主机名共享的网站图标
+
+    内存中保留最近使用的 QIcon(LRU)，磁盘上所有图标存放在同一个
+    数据库中。读取和解码在线程池中进行，同一主机的并发请求只处理一次。
+    图标只来自页面加载时的 iconChanged，不会为了显示图标而访问网站；
+    没有保存过的主机显示空图标。图标就绪时发出 icon_ready。
+    """
+
+    icon_ready = Signal(str)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.capacity = settings.int_value("favicons/memory_cache", 256)
+
+        self.cache = OrderedDict()
+        # 正在读取的主机，以及确认没有保存图标的主机
+        self.pending = set()
+        self.missing = set()
+        # 已经在本次运行中保存过页面图标的主机
+        self.saved = set()
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.signals = TaskSignals(self)
+        self.signals.loaded.connect(self.loaded)
+
+    def icon(self, url):
+        """返回网站图标，尚未加载时返回空图标并在后台加载"""
+        host = _host(url)
+        if not host:
+            return QIcon()
+
+        icon = self.cache.get(host)
+        if icon is not None:
+            self.cache.move_to_end(host)
+            return icon
+
+        if host not in self.pending and host not in self.missing:
+            self.pending.add(host)
+            self.pool.start(LoadTask(self.path, host, self.signals))
+        return QIcon()
+
+    def cached(self, host):
+        """内存中的图标，没有时返回空图标，不会触发加载"""
+        icon = self.cache.get(host)
+        return icon if icon is not None else QIcon()
+
+    def set_icon(self, url, icon):
+        """页面加载出了图标，放入缓存并保存到磁盘"""
+        host = _host(url)
+        if not host or icon.isNull():
+            return
+
+        pixmap = icon.pixmap(ICON_SIZE, ICON_SIZE)
+        self.put(host, QIcon(pixmap))
+        self.missing.discard(host)
+        if host not in self.saved:
+            self.saved.add(host)
+            self.pool.start(SaveTask(self.path, host, pixmap.toImage()))
+        self.icon_ready.emit(host)
+
+    def put(self, host, icon):
+        self.cache[host] = icon
+        self.cache.move_to_end(host)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+
+    def loaded(self, host, image):
+        """线程池中的读取完成"""
+        self.pending.discard(host)
+        if host in self.cache:
+            # 加载期间页面已经提供了更新的图标
+            return
+
+        if image.isNull():
+            self.missing.add(host)
+        else:
+            self.put(host, QIcon(QPixmap.fromImage(image)))
+            self.icon_ready.emit(host)
+
+
+_service = None
+
+
+def favicon_service():
+    """所有窗口共用的图标服务，第一次调用时创建"""
+    global _service
+    if _service is None:
+        _service = FaviconService(data_path("favicons.db"), QApplication.instance())
+    return _service
@@ -0,0 +1,578 @@
+import array
+import hashlib
+import mmap
+import os
+import re
+import struct
+
+# 索引文件格式: 文件头之后依次是各个定长数组，全部按 8 字节对齐，
+# 打开时直接在内存映射上建立 memoryview，不需要反序列化。
+MAGIC = b"SFFI"
+VERSION = 1
+HEADER = struct.Struct("<4s11I")
+
+# 资源类型
+RESOURCE_TYPES = {
+    "document": 1 << 0,
+    "subdocument": 1 << 1,
+    "stylesheet": 1 << 2,
+    "script": 1 << 3,
+    "image": 1 << 4,
+    "font": 1 << 5,
+    "object": 1 << 6,
+    "xmlhttprequest": 1 << 7,
+    "media": 1 << 8,
+    "websocket": 1 << 9,
+    "ping": 1 << 10,
+    "other": 1 << 11,
+}
+ALL_TYPES = (1 << 12) - 1
+# 没有指定类型的规则不拦截主文档，和 Adblock Plus 一致
+DEFAULT_TYPES = ALL_TYPES & ~RESOURCE_TYPES["document"]
+
+TYPE_ALIASES = {
+    "xhr": "xmlhttprequest",
+    "css": "stylesheet",
+    "frame": "subdocument",
+    "doc": "document",
+    "object-subrequest": "object",
+}
+
+# 规则标记
+THIRD_PARTY = 1
+FIRST_PARTY = 2
+EXCEPTION = 4
+EXACT_HOST = 8
+MATCH_CASE = 16
+IMPORTANT = 32
+DOMAIN_RULE = 64
+
+# 规则表每条记录的 u32 字段: 类型掩码、标记、同一主机的下一条规则(+1)、
+# 模式在字符串池中的偏移和长度、$domain= 的偏移和长度
+RULE_FIELDS = 7
+
+# 子串规则用模式中最长的一段字面量作为关键字，最多取这么多字符
+KEYWORD_LENGTH = 16
+MIN_KEYWORD_LENGTH = 3
+
+# 自动机按广度优先编号，前这么多个(即最浅的)状态使用 256 项的稠密转移表，
+# 其余状态的转移放在哈希表中
+DENSE_STATES = 4096
+
+GOLDEN = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+_HOSTS_LINE = re.compile(r"^(?:0\.0\.0\.0|127\.0\.0\.1|::1?)\s+([^\s#]+)")
+_HOSTS_IGNORE = {"localhost", "localhost.localdomain", "local", "broadcasthost", "0.0.0.0", "ip6-localhost"}
+_DOMAIN_ANCHOR = re.compile(r"^([a-z0-9.-]+)\^?\|?$")
+_URL_HOST = re.compile(r"^[a-z][a-z0-9+.-]*://(?:[^@/?#]*@)?([^/?#:]*)", re.I)
+_SCHEME = re.compile(r"^[a-z][a-z0-9+.-]*://", re.I)
+_LITERALS = re.compile(r"[^*^|]+")
+
+# 常见的二级公共后缀，用来近似判断是否为第三方请求
+_SECOND_LEVEL = {"co", "com", "net", "org", "gov", "edu", "ac"}
+
+
+class UnsupportedRule(ValueError):
+    pass
+
+
+def hash64(text):
+    """域名的 64 位哈希，0 保留给空槽"""
+    value = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    return value or 1
+
+
+def url_host(url):
+    match = _URL_HOST.match(url)
+    return match.group(1).lower() if match else ""
+
+
+def base_domain(host):
+    """近似的可注册域名(不使用公共后缀列表)"""
+    labels = host.split(".")
+    if len(labels) > 2 and labels[-2] in _SECOND_LEVEL and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def parse_options(text):
+    """解析 $ 之后的选项，返回 (类型掩码, 标记, domain 列表)"""
+    include = 0
+    exclude = 0
+    flags = 0
+    domains = ""
+    for option in text.split(","):
+        option = option.strip().lower()
+        negated = option.startswith("~")
+        name = option.lstrip("~")
+        name = TYPE_ALIASES.get(name, name)
+        if name in RESOURCE_TYPES:
+            if negated:
+                exclude |= RESOURCE_TYPES[name]
+            else:
+                include |= RESOURCE_TYPES[name]
+        elif name in ("third-party", "3p"):
+            flags |= FIRST_PARTY if negated else THIRD_PARTY
+        elif name in ("first-party", "1p"):
+            flags |= THIRD_PARTY if negated else FIRST_PARTY
+        elif name == "match-case":
+            flags |= MATCH_CASE
+        elif name == "important":
+            flags |= IMPORTANT
+        elif name.startswith("domain="):
+            domains = option[len("domain="):]
+        else:
+            # popup、csp=、redirect= 等无法在请求拦截中实现的选项
+            raise UnsupportedRule(option)
+
+    type_mask = include or DEFAULT_TYPES
+    if exclude:
+        type_mask = (include or ALL_TYPES) & ~exclude
+    return type_mask, flags, domains
+
+
+def parse_rule(line):
+    """解析一行过滤规则
+
+    返回 (键, 模式, 类型掩码, 标记, domain 列表)，注释、元素隐藏规则等返回 None。
+    域名规则的键是主机名，子串规则的键是用于 Aho-Corasick 匹配的关键字(可能为空)。
+    """
+    line = line.strip()
+    if not line or line[0] in "!#[":
+        return None
+    if "##" in line or "#@#" in line or "#?#" in line or "#$#" in line:
+        return None
+
+    # hosts 文件格式
+    match = _HOSTS_LINE.match(line)
+    if match:
+        host = match.group(1).lower()
+        if host in _HOSTS_IGNORE:
+            return None
+        return host, "", DEFAULT_TYPES, DOMAIN_RULE | EXACT_HOST, ""
+
+    flags = 0
+    if line.startswith("@@"):
+        flags |= EXCEPTION
+        line = line[2:]
+
+    pattern, type_mask, domains = line, DEFAULT_TYPES, ""
+    if "$" in line:
+        pattern, _, options = line.rpartition("$")
+        type_mask, option_flags, domains = parse_options(options)
+        flags |= option_flags
+
+    if len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/"):
+        raise UnsupportedRule(pattern)
+
+    # ||example.com^ 形式的规则按主机名查找
+    if pattern.startswith("||"):
+        match = _DOMAIN_ANCHOR.match(pattern[2:].lower())
+        if match:
+            return match.group(1).strip("."), pattern, type_mask, flags | DOMAIN_RULE, domains
+
+    literals = _LITERALS.findall(pattern if pattern.startswith("||") else pattern.lstrip("|"))
+    keyword = max(literals, key=len, default="").lower()[:KEYWORD_LENGTH]
+    if len(keyword) < MIN_KEYWORD_LENGTH:
+        keyword = ""
+    return keyword, pattern, type_mask, flags, domains
+
+
+def pattern_regex(pattern, match_case=False):
+    """把 Adblock Plus 的模式转换为正则表达式"""
+    regex = ""
+    if pattern.startswith("||"):
+        regex = r"^[a-z][a-z0-9+.-]*://(?:[^/?#]*\.)?"
+        pattern = pattern[2:]
+    elif pattern.startswith("|"):
+        regex = "^"
+        pattern = pattern[1:]
+    end = ""
+    if pattern.endswith("|"):
+        end = "$"
+        pattern = pattern[:-1]
+
+    for ch in pattern:
+        if ch == "*":
+            regex += ".*"
+        elif ch == "^":
+            regex += r"(?:[^\w.%-]|$)"
+        else:
+            regex += re.escape(ch)
+    return re.compile(regex + end, 0 if match_case else re.IGNORECASE)
+
+
+def _table_bits(count):
+    """开放寻址表的大小(2 的幂)，负载不超过一半"""
+    bits = 4
+    while (1 << bits) < count * 2:
+        bits += 1
+    return bits
+
+
+def _slot(key, bits):
+    return ((key * GOLDEN) & MASK64) >> (64 - bits)
+
+
+def _layout(counts):
+    """根据各部分的元素个数计算偏移，返回 {名称: (偏移, 类型, 个数)}"""
+    rule_count, domain_bits, state_count, dense_count, goto_bits, out_count, generic_count, pool_size = counts
+    sections = [
+        ("domain_keys", "Q", 1 << domain_bits),
+        ("domain_vals", "I", 1 << domain_bits),
+        ("dense", "I", dense_count << 8),
+        ("goto_keys", "Q", 1 << goto_bits),
+        ("goto_vals", "I", 1 << goto_bits),
+        ("fail", "I", state_count),
+        ("report", "I", state_count),
+        ("dict_link", "I", state_count),
+        ("out_start", "I", state_count + 1),
+        ("out_rules", "I", out_count),
+        ("generic", "I", generic_count),
+        ("rules", "I", rule_count * RULE_FIELDS),
+        ("pool", "B", pool_size),
+    ]
+    layout = {}
+    offset = HEADER.size
+    for name, typecode, count in sections:
+        offset = (offset + 7) & ~7
+        layout[name] = (offset, typecode, count)
+        offset += count * array.array(typecode).itemsize
+    return layout
+
+
+def compile_filters(sources, path, meta=""):
+    """把过滤列表编译为索引文件
+
+    sources 为文件路径列表，支持 Adblock Plus/EasyList 语法和 hosts 文件。
+    meta 原样保存在索引中，可用于判断索引是否过期。返回统计信息。
+    """
+    stats = {"rules": 0, "domains": 0, "patterns": 0, "generic": 0, "unsupported": 0, "duplicates": 0}
+    seen = set()
+    rules = array.array("I")
+    pool = bytearray()
+    pool_index = {}
+    domain_heads = {}
+    keywords = []
+    generic = array.array("I")
+
+    def intern(text):
+        if not text:
+            return 0, 0
+        data = text.encode()
+        offset = pool_index.get(data)
+        if offset is None:
+            offset = pool_index[data] = len(pool)
+            pool.extend(data)
+        return offset, len(data)
+
+    for source in sources:
+        with open(source, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(line)
+                try:
+                    rule = parse_rule(line)
+                except UnsupportedRule:
+                    stats["unsupported"] += 1
+                    continue
+                if rule is None:
+                    continue
+
+                key, pattern, type_mask, flags, domains = rule
+                rule_id = len(rules) // RULE_FIELDS
+                next_rule = 0
+                if flags & DOMAIN_RULE:
+                    next_rule = domain_heads.get(key, 0)
+                    domain_heads[key] = rule_id + 1
+                    stats["domains"] += 1
+                elif key:
+                    keywords.append((key, rule_id))
+                    stats["patterns"] += 1
+                else:
+                    generic.append(rule_id)
+                    stats["generic"] += 1
+                rules.extend((type_mask, flags, next_rule) + intern(pattern) + intern(domains))
+    stats["rules"] = len(rules) // RULE_FIELDS
+
+    # 域名哈希表
+    domain_bits = _table_bits(len(domain_heads))
+    domain_keys = array.array("Q", bytes(8 << domain_bits))
+    domain_vals = array.array("I", bytes(4 << domain_bits))
+    mask = (1 << domain_bits) - 1
+    for host, head in domain_heads.items():
+        key = hash64(host)
+        slot = key & mask
+        while domain_keys[slot] and domain_keys[slot] != key:
+            slot = (slot + 1) & mask
+        domain_keys[slot] = key
+        domain_vals[slot] = head
+
+    # Aho-Corasick 自动机: 先建字典树，再按广度优先重新编号
+    trie = [{}]
+    trie_outputs = [[]]
+    for keyword, rule_id in keywords:
+        state = 0
+        for byte in keyword.encode():
+            nxt = trie[state].get(byte)
+            if nxt is None:
+                nxt = trie[state][byte] = len(trie)
+                trie.append({})
+                trie_outputs.append([])
+            state = nxt
+        trie_outputs[state].append(rule_id)
+
+    order = [0]
+    for state in order:
+        order.extend(trie[state].values())
+    number = {old: new for new, old in enumerate(order)}
+    goto = [{byte: number[child] for byte, child in trie[old].items()} for old in order]
+    outputs = [trie_outputs[old] for old in order]
+    del trie, trie_outputs
+
+    state_count = len(goto)
+    fail = array.array("I", bytes(4 * state_count))
+    dict_link = array.array("I", bytes(4 * state_count))
+    for state in range(state_count):
+        for byte, child in goto[state].items():
+            if state:
+                f = fail[state]
+                while f and byte not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(byte, 0)
+            target = fail[child]
+            dict_link[child] = target if outputs[target] else dict_link[target]
+
+    report = array.array("I", (state if outputs[state] else dict_link[state] for state in range(state_count)))
+    out_start = array.array("I", [0])
+    out_rules = array.array("I")
+    for rule_ids in outputs:
+        out_rules.extend(rule_ids)
+        out_start.append(len(out_rules))
+
+    # 浅层状态的完整转移函数(已经包含失败转移)，失败状态的编号总是更小
+    dense_count = min(state_count, DENSE_STATES)
+    dense = array.array("I", bytes(4 * (dense_count << 8)))
+    for state in range(dense_count):
+        children = goto[state]
+        fallback = fail[state] << 8
+        for byte in range(256):
+            child = children.get(byte)
+            if child is None:
+                child = dense[fallback | byte] if state else 0
+            dense[(state << 8) | byte] = child
+
+    transitions = sum(len(children) for children in goto[dense_count:])
+    goto_bits = _table_bits(transitions)
+    goto_keys = array.array("Q", bytes(8 << goto_bits))
+    goto_vals = array.array("I", bytes(4 << goto_bits))
+    mask = (1 << goto_bits) - 1
+    for state in range(dense_count, state_count):
+        for byte, child in goto[state].items():
+            key = (state << 8) | byte
+            slot = _slot(key, goto_bits)
+            while goto_keys[slot]:
+                slot = (slot + 1) & mask
+            goto_keys[slot] = key
+            goto_vals[slot] = child
+
+    meta_offset, meta_length = intern(meta)
+    counts = (stats["rules"], domain_bits, state_count, dense_count, goto_bits,
+              len(out_rules), len(generic), len(pool))
+    data = {
+        "domain_keys": domain_keys, "domain_vals": domain_vals, "dense": dense,
+        "goto_keys": goto_keys, "goto_vals": goto_vals, "fail": fail, "report": report,
+        "dict_link": dict_link, "out_start": out_start, "out_rules": out_rules,
+        "generic": generic, "rules": rules, "pool": array.array("B", pool),
+    }
+
+    # 先写临时文件再替换，正在使用旧索引的进程不受影响
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, *counts, meta_offset, meta_length))
+        for name, (offset, typecode, count) in _layout(counts).items():
+            f.write(bytes(offset - f.tell()))
+            f.write(data[name].tobytes())
+    os.replace(temp_path, path)
+    return stats
+
+
+class FilterIndex:
+    """内存映射的过滤规则索引
+
+    主机名及其各级父域名在域名哈希表中查找，其余规则由 Aho-Corasick
+    自动机在 URL 中找出关键字，再用正则表达式校验完整模式。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *counts, meta_offset, meta_length = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"不是有效的过滤规则索引: {path}")
+
+        self.rule_count, self.domain_bits, self.state_count, self.dense_count, self.goto_bits = counts[:5]
+        view = memoryview(self.map)
+        self.views = [view]
+        for name, (offset, typecode, count) in _layout(counts).items():
+            size = count * array.array(typecode).itemsize
+            section = view[offset:offset + size].cast(typecode)
+            self.views.append(section)
+            setattr(self, name, section)
+        self.meta = bytes(self.pool[meta_offset:meta_offset + meta_length]).decode()
+
+        # 命中过的规则才编译正则和解析 domain 列表
+        self.regex_cache = {}
+        self.domain_cache = {}
+
+    def close(self):
+        for view in getattr(self, "views", []):
+            view.release()
+        self.views = []
+        self.map.close()
+        self.file.close()
+
+    def _string(self, offset, length):
+        return bytes(self.pool[offset:offset + length]).decode()
+
+    def rule_pattern(self, rule_id):
+        """规则的模式文本"""
+        base = rule_id * RULE_FIELDS
+        return self._string(self.rules[base + 3], self.rules[base + 4])
+
+    def _domain_candidates(self, host):
+        """在域名哈希表中查找主机名及其父域名，生成 (规则, 是否完全匹配)"""
+        keys = self.domain_keys
+        mask = (1 << self.domain_bits) - 1
+        exact = True
+        while host:
+            key = hash64(host)
+            slot = key & mask
+            while True:
+                stored = keys[slot]
+                if stored == key:
+                    head = self.domain_vals[slot]
+                    while head:
+                        yield head - 1, exact
+                        head = self.rules[(head - 1) * RULE_FIELDS + 2]
+                    break
+                if not stored:
+                    break
+                slot = (slot + 1) & mask
+            exact = False
+            host = host.partition(".")[2]
+
+    def _scan(self, data):
+        """用 Aho-Corasick 自动机找出 URL 中出现的所有关键字对应的规则"""
+        dense, fail, report = self.dense, self.fail, self.report
+        goto_keys, goto_vals = self.goto_keys, self.goto_vals
+        dict_link, out_start, out_rules = self.dict_link, self.out_start, self.out_rules
+        dense_count = self.dense_count
+        shift = 64 - self.goto_bits
+        mask = (1 << self.goto_bits) - 1
+
+        hits = set()
+        state = 0
+        for byte in data:
+            # 深层状态查哈希表，找不到就沿失败链回退，直到进入稠密转移表
+            while state >= dense_count:
+                key = (state << 8) | byte
+                slot = ((key * GOLDEN) & MASK64) >> shift
+                while True:
+                    stored = goto_keys[slot]
+                    if stored == key or not stored:
+                        break
+                    slot = (slot + 1) & mask
+                if stored:
+                    state = goto_vals[slot]
+                    break
+                state = fail[state]
+            else:
+                state = dense[(state << 8) | byte]
+
+            output = report[state]
+            while output:
+                hits.update(out_rules[out_start[output]:out_start[output + 1]])
+                output = dict_link[output]
+        return hits
+
+    def _domain_allowed(self, rule_id, document_host):
+        """检查 $domain= 选项"""
+        base = rule_id * RULE_FIELDS
+        length = self.rules[base + 6]
+        if not length:
+            return True
+
+        domains = self.domain_cache.get(rule_id)
+        if domains is None:
+            include, exclude = set(), set()
+            for domain in self._string(self.rules[base + 5], length).split("|"):
+                if domain.startswith("~"):
+                    exclude.add(domain[1:])
+                elif domain:
+                    include.add(domain)
+            domains = self.domain_cache[rule_id] = (include, exclude)
+
+        include, exclude = domains
+        host = document_host
+        while host:
+            if host in exclude:
+                return False
+            if host in include:
+                return True
+            host = host.partition(".")[2]
+        return not include
+
+    def _applies(self, rule_id, url, type_bit, third_party, document_host):
+        base = rule_id * RULE_FIELDS
+        flags = self.rules[base + 1]
+        if not self.rules[base] & type_bit:
+            return False
+        if flags & THIRD_PARTY and not third_party:
+            return False
+        if flags & FIRST_PARTY and third_party:
+            return False
+        if not self._domain_allowed(rule_id, document_host):
+            return False
+        if flags & DOMAIN_RULE:
+            return True
+
+        regex = self.regex_cache.get(rule_id)
+        if regex is None:
+            regex = self.regex_cache[rule_id] = pattern_regex(self.rule_pattern(rule_id), flags & MATCH_CASE)
+        return regex.search(url) is not None
+
+    def match(self, url, document_url="", resource_type="other"):
+        """返回拦截该请求的规则编号，不拦截时返回 None"""
+        host = url_host(url)
+        document_host = url_host(document_url) if document_url else host
+        third_party = bool(document_host) and base_domain(host) != base_domain(document_host)
+        type_bit = RESOURCE_TYPES.get(resource_type, RESOURCE_TYPES["other"])
+
+        candidates = [rule_id for rule_id, exact in self._domain_candidates(host)
+                      if exact or not self.rules[rule_id * RULE_FIELDS + 1] & EXACT_HOST]
+        if self.state_count > 1:
+            candidates.extend(self._scan(_SCHEME.sub("", url, 1).lower().encode()))
+        candidates.extend(self.generic)
+
+        blocked = None
+        excepted = False
+        for rule_id in candidates:
+            if not self._applies(rule_id, url, type_bit, third_party, document_host):
+                continue
+            flags = self.rules[rule_id * RULE_FIELDS + 1]
+            if flags & EXCEPTION:
+                excepted = True
+            elif flags & IMPORTANT:
+                return rule_id
+            elif blocked is None:
+                blocked = rule_id
+        return None if excepted else blocked
+
+    def should_block(self, url, document_url="", resource_type="other"):
+        return self.match(url, document_url, resource_type) is not None
@@ -0,0 +1,234 @@
+import bisect
+import heapq
+import itertools
+import math
+import re
+import time
+
+# 频率 × 近期度: 访问得分每 14 天衰减一半
+HALF_LIFE = 14 * 24 * 3600
+DECAY = math.log(2) / HALF_LIFE
+
+# 书签相当于额外的访问次数
+BOOKMARK_WEIGHT = 10
+
+# 前缀树只建到这个深度，更长的前缀在有序键列表中二分查找
+TRIE_DEPTH = 12
+
+# 每个前缀树节点缓存的最佳结果数
+TOP_K = 10
+
+# 二分查找路径最多扫描的候选数
+MAX_SCAN = 1000
+
+_SCHEME = re.compile(r"^[a-z][a-z0-9+.-]*://")
+
+
+def normalize(text):
+    """去掉协议和 www. 前缀并转为小写，作为匹配用的键"""
+    text = _SCHEME.sub("", text.strip().lower())
+    if text.startswith("www."):
+        text = text[4:]
+    return text
+
+
+def url_keys(url):
+    """一个 URL 的全部匹配键: 完整的 主机/路径，以及去掉子域名后的形式"""
+    key = normalize(url)
+    keys = [key]
+    host, sep, path = key.partition("/")
+    labels = host.split(".")
+    # mail.google.com/inbox 也能通过 google.com 和 google 匹配
+    for i in range(1, len(labels) - 1):
+        keys.append(".".join(labels[i:]) + sep + path)
+    return keys
+
+
+class Entry:
+    __slots__ = ("url", "title", "visits", "last_visit", "bookmarked", "rank")
+
+    def __init__(self, url, title):
+        self.url = url
+        self.title = title
+        self.visits = 0
+        self.last_visit = 0.0
+        self.bookmarked = False
+        self.rank = float("-inf")
+
+    def update_rank(self):
+        """排序键: ln(权重) + DECAY × 最后访问时间
+
+        权重 × exp(-DECAY × (now - t)) 的排序与 now 无关，因此排序键
+        只在访问、收藏或取消收藏时变化；只有取消收藏会使它减小。
+        """
+        weight = self.visits + (BOOKMARK_WEIGHT if self.bookmarked else 0)
+        last_visit = self.last_visit or time.time()
+        self.rank = math.log(max(weight, 1)) + DECAY * last_visit
+
+    def score(self, now=None):
+        """当前的 frecency 得分"""
+        now = time.time() if now is None else now
+        return math.exp(self.rank - DECAY * now)
+
+
+class FrecencyIndex:
+    """历史记录和书签的地址栏补全索引
+
+    浅层前缀树的每个节点缓存排序键最高的 TOP_K 个条目，短前缀查询只需
+    沿树走到节点；超过 TRIE_DEPTH 的前缀在有序键列表上二分查找。
+    访问和收藏只会增大排序键，增量更新时缓存的前 K 个仍然准确；取消
+    收藏会减小排序键，这时从有序键列表中重新计算缓存了该条目的节点。
+    """
+
+    def __init__(self):
+        self.entries = {}
+        # 前缀树节点: [子节点字典, [(-排序键, url), ...]]，按升序排列，即排序键从高到低
+        self.root = [{}, []]
+        # 有序的 (键, url) 列表
+        self.keys = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _entry(self, url, title):
+        entry = self.entries.get(url)
+        if entry is None:
+            entry = Entry(url, title)
+            self.entries[url] = entry
+            for key in url_keys(url):
+                bisect.insort(self.keys, (key, url))
+        elif title:
+            entry.title = title
+        return entry
+
+    def _promote(self, entry):
+        """把条目的新排序键写入路径上各节点的缓存"""
+        item = (-entry.rank, entry.url)
+        for key in url_keys(entry.url):
+            node = self.root
+            for ch in key[:TRIE_DEPTH]:
+                children = node[0]
+                node = children.get(ch)
+                if node is None:
+                    node = children[ch] = [{}, []]
+                top = node[1]
+                for i, (rank, url) in enumerate(top):
+                    if url == entry.url:
+                        del top[i]
+                        break
+                if len(top) < TOP_K or item < top[-1]:
+                    bisect.insort(top, item)
+                    del top[TOP_K:]
+
+    def _demote(self, url, old_rank):
+        """条目的排序键减小或条目被删除后，重新计算缓存中有它的节点"""
+        item = (-old_rank, url)
+        for key in url_keys(url):
+            node = self.root
+            for depth, ch in enumerate(key[:TRIE_DEPTH], 1):
+                node = node[0].get(ch)
+                if node is None:
+                    break
+                if item in node[1]:
+                    node[1] = self._top(key[:depth])
+
+    def _top(self, prefix):
+        """有序键列表中以 prefix 开头的排序键最高的 TOP_K 个条目"""
+        start = bisect.bisect_left(self.keys, (prefix,))
+        urls = set()
+        for key, url in itertools.islice(self.keys, start, None):
+            if not key.startswith(prefix):
+                break
+            urls.add(url)
+        return heapq.nsmallest(TOP_K, ((-self.entries[url].rank, url) for url in urls))
+
+    def load(self, visits, bookmarks=()):
+        """一次性建立索引
+
+        visits 为 (url, title, 访问次数, 最后访问时间)，bookmarks 为 (url, title)。
+        """
+        self.entries = {}
+        self.root = [{}, []]
+        for url, title, count, last_visit in visits:
+            entry = self.entries.get(url) or self.entries.setdefault(url, Entry(url, title))
+            entry.visits += count
+            entry.last_visit = max(entry.last_visit, last_visit)
+        for url, title in bookmarks:
+            entry = self.entries.get(url) or self.entries.setdefault(url, Entry(url, title))
+            entry.bookmarked = True
+
+        keys = []
+        for entry in self.entries.values():
+            entry.update_rank()
+            keys.extend((key, entry.url) for key in url_keys(entry.url))
+        keys.sort()
+        self.keys = keys
+
+        # 按排序键从高到低插入，每个节点只需追加到满 TOP_K 为止
+        for entry in sorted(self.entries.values(), key=lambda entry: (-entry.rank, entry.url)):
+            item = (-entry.rank, entry.url)
+            for key in url_keys(entry.url):
+                node = self.root
+                for ch in key[:TRIE_DEPTH]:
+                    children = node[0]
+                    node = children.get(ch)
+                    if node is None:
+                        node = children[ch] = [{}, []]
+                    top = node[1]
+                    if len(top) < TOP_K and (not top or top[-1][1] != entry.url):
+                        top.append(item)
+
+    def add_visit(self, url, title="", visited_at=None, count=1):
+        """记录一次(或 count 次)访问"""
+        entry = self._entry(url, title)
+        entry.visits += count
+        entry.last_visit = max(entry.last_visit, visited_at or time.time())
+        entry.update_rank()
+        self._promote(entry)
+
+    def add_bookmark(self, url, title=""):
+        """记录一个书签"""
+        entry = self._entry(url, title)
+        if entry.bookmarked:
+            return
+        entry.bookmarked = True
+        entry.update_rank()
+        self._promote(entry)
+
+    def remove_bookmark(self, url):
+        """取消收藏；没有访问记录的条目从索引中删除"""
+        entry = self.entries.get(url)
+        if entry is None or not entry.bookmarked:
+            return
+        old_rank = entry.rank
+        entry.bookmarked = False
+        if entry.visits:
+            entry.update_rank()
+        else:
+            del self.entries[url]
+            for key in url_keys(url):
+                i = bisect.bisect_left(self.keys, (key, url))
+                if i < len(self.keys) and self.keys[i] == (key, url):
+                    del self.keys[i]
+        self._demote(url, old_rank)
+
+    def query(self, text, limit=8):
+        """返回与输入前缀匹配、得分最高的条目"""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+
+        if len(prefix) <= TRIE_DEPTH:
+            node = self.root
+            for ch in prefix:
+                node = node[0].get(ch)
+                if node is None:
+                    return []
+            return [self.entries[url] for _, url in node[1][:limit]]
+
+        # 长前缀: 在有序键列表中取出所有以它开头的键
+        start = bisect.bisect_left(self.keys, (prefix,))
+        matches = itertools.takewhile(lambda pair: pair[0].startswith(prefix),
+                                      self.keys[start:start + MAX_SCAN])
+        urls = {url for key, url in matches}
+        return heapq.nlargest(limit, (self.entries[url] for url in urls), key=lambda entry: entry.rank)
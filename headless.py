@@ -0,0 +1,277 @@
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, asdict
+from PySide2.QtCore import Qt, QObject, QTimer, QUrl, Signal
+from PySide2.QtWebEngineWidgets import QWebEnginePage, QWebEngineProfile, QWebEngineView
+
+# 页面加载完成后等待绘制的时间(毫秒)
+SETTLE_MS = 100
+
+FORMATS = {
+    "png": ("png",),
+    "pdf": ("pdf",),
+    "both": ("png", "pdf"),
+    "none": (),
+}
+
+
+@dataclass
+class RenderResult:
+    """一个网址的渲染结果，时间单位为毫秒，-1 表示未取得"""
+    index: int
+    url: str
+    # ok、load_failed、timeout 或 error
+    status: str = ""
+    load_ms: float = -1
+    render_ms: float = -1
+    png: str = ""
+    pdf: str = ""
+    error: str = ""
+    worker: int = -1
+
+
+def read_urls(lines):
+    """逐个产生输入中的网址，忽略空行和 # 开头的注释"""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def parse_viewport(text):
+    """把 "1280x800" 解析为 (宽, 高)"""
+    match = re.fullmatch(r"(\d+)[xX](\d+)", text.strip())
+    if not match:
+        raise ValueError(f"无效的视口大小: {text}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def output_name(index, url):
+    """输出文件名(不含扩展名): 序号和主机名"""
+    host = re.sub(r"[^A-Za-z0-9.-]+", "_", QUrl.fromUserInput(url).host() or "page")[:60]
+    return f"{index:05d}-{host}"
+
+
+class RenderWorker(QObject):
+    """一个离屏的浏览器部件，依次渲染分配给它的网址
+
+    浏览器部件在任务之间重复使用；超时的任务会换一个新页面，
+    避免被中止的加载在下一个任务中发出信号。
+    """
+
+    finished = Signal(object)
+
+    def __init__(self, number, profile, viewport, formats, output_dir, timeout_ms, parent=None):
+        super().__init__(parent)
+        self.number = number
+        self.profile = profile
+        self.formats = formats
+        self.output_dir = output_dir
+
+        self.view = QWebEngineView()
+        self.view.setAttribute(Qt.WA_DontShowOnScreen)
+        self.view.resize(*viewport)
+        self.view.show()
+        self.page = None
+        self.new_page()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(timeout_ms)
+        self.timer.timeout.connect(self.timed_out)
+
+        # 每个任务一个编号，延迟执行的回调据此判断任务是否已经结束
+        self.job = 0
+        self.stage = None
+        self.result = None
+        self.base = ""
+        self.started = 0.0
+
+    def new_page(self):
+        page = QWebEnginePage(self.profile, self.view)
+        page.loadFinished.connect(lambda ok, page=page: self.load_finished(page, ok))
+        page.pdfPrintingFinished.connect(lambda path, ok, page=page: self.pdf_finished(page, path, ok))
+        self.view.setPage(page)
+        if self.page is not None:
+            self.page.deleteLater()
+        self.page = page
+
+    def render(self, index, url):
+        """开始渲染一个网址，完成后发出 finished(RenderResult)"""
+        self.job += 1
+        self.stage = "load"
+        self.result = RenderResult(index, url, worker=self.number)
+        self.base = os.path.join(self.output_dir, output_name(index, url))
+        self.started = time.perf_counter()
+        self.timer.start()
+        self.page.setUrl(QUrl.fromUserInput(url))
+
+    def load_finished(self, page, ok):
+        if page is not self.page or self.stage != "load":
+            return
+        self.result.load_ms = (time.perf_counter() - self.started) * 1000
+        if not ok:
+            self.finish("load_failed", "页面加载失败")
+            return
+        self.stage = "settle"
+        QTimer.singleShot(SETTLE_MS, lambda job=self.job: self.capture(job))
+
+    def capture(self, job):
+        if job != self.job or self.stage != "settle":
+            return
+        self.started = time.perf_counter()
+        if "png" in self.formats:
+            path = self.base + ".png"
+            if not self.view.grab().save(path):
+                self.finish("error", f"无法保存 {path}")
+                return
+            self.result.png = path
+        if "pdf" in self.formats:
+            self.stage = "pdf"
+            self.page.printToPdf(self.base + ".pdf")
+            return
+        self.result.render_ms = (time.perf_counter() - self.started) * 1000
+        self.finish("ok")
+
+    def pdf_finished(self, page, path, ok):
+        if page is not self.page or self.stage != "pdf":
+            return
+        if not ok:
+            self.finish("error", f"无法生成 {path}")
+            return
+        self.result.pdf = path
+        self.result.render_ms = (time.perf_counter() - self.started) * 1000
+        self.finish("ok")
+
+    def timed_out(self):
+        self.page.triggerAction(QWebEnginePage.Stop)
+        self.new_page()
+        self.finish("timeout", "超时")
+
+    def finish(self, status, error=""):
+        self.timer.stop()
+        result = self.result
+        result.status = status
+        result.error = error
+        self.result = None
+        self.stage = None
+        self.job += 1
+        self.finished.emit(result)
+
+    def close(self):
+        self.timer.stop()
+        self.view.close()
+        self.view.deleteLater()
+
+
+class RenderPool(QObject):
+    """由固定数量的离屏浏览器部件组成的渲染池
+
+    网址按需从 urls 迭代器中取出，某个部件空闲时分配下一个，同时最多
+    concurrency 个页面在加载。所有页面使用一个无痕 profile，不读写
+    浏览器的缓存和 Cookie。
+    """
+
+    result_ready = Signal(object)
+    finished = Signal()
+
+    def __init__(self, urls, concurrency=4, output_dir=".", formats=("png",), timeout_ms=30000,
+                 viewport=(1280, 800), parent=None):
+        super().__init__(parent)
+        self.jobs = enumerate(urls)
+        self.profile = QWebEngineProfile(self)
+        self.workers = []
+        for number in range(max(1, concurrency)):
+            worker = RenderWorker(number, self.profile, viewport, formats, output_dir, timeout_ms, self)
+            worker.finished.connect(lambda result, worker=worker: self.worker_finished(worker, result))
+            self.workers.append(worker)
+        self.busy = 0
+        self.counts = {}
+        self.started = 0.0
+        self.elapsed_ms = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        for worker in self.workers:
+            self.dispatch(worker)
+        if not self.busy:
+            QTimer.singleShot(0, self.done)
+
+    def dispatch(self, worker):
+        job = next(self.jobs, None)
+        if job is None:
+            return
+        self.busy += 1
+        worker.render(*job)
+
+    def worker_finished(self, worker, result):
+        self.busy -= 1
+        self.counts[result.status] = self.counts.get(result.status, 0) + 1
+        self.result_ready.emit(result)
+        # 不在页面的信号处理中直接开始下一次加载
+        QTimer.singleShot(0, lambda: self.next_job(worker))
+
+    def next_job(self, worker):
+        self.dispatch(worker)
+        if not self.busy:
+            self.done()
+
+    def done(self):
+        self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+        self.finished.emit()
+
+    def summary(self):
+        pages = sum(self.counts.values())
+        return {
+            "pages": pages,
+            "statuses": self.counts,
+            "elapsed_ms": round(self.elapsed_ms, 1),
+            "pages_per_second": round(pages * 1000 / self.elapsed_ms, 2) if self.elapsed_ms else 0.0,
+        }
+
+
+def run_batch(app, args):
+    """--headless 模式: 渲染命令行和 --input 中的网址，每个结果以一行 JSON 输出，返回退出码
+
+    参数或输入文件有误时返回 2，有页面没有渲染成功时返回 1。
+    """
+    if not args.urls and args.input is None:
+        print("没有要渲染的网址: 在命令行中给出网址或使用 --input FILE|-", file=sys.stderr)
+        return 2
+    try:
+        viewport = parse_viewport(args.viewport)
+        os.makedirs(args.output_dir, exist_ok=True)
+        if args.input is None:
+            source = None
+        elif args.input == "-":
+            source = sys.stdin
+        else:
+            source = open(args.input, encoding="utf-8", errors="replace")
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    urls = itertools.chain(args.urls, read_urls(source or ()))
+    pool = RenderPool(urls, args.concurrency, args.output_dir,
+                      FORMATS[args.format], int(args.timeout * 1000), viewport)
+
+    def print_result(result):
+        print(json.dumps(asdict(result), ensure_ascii=False), flush=True)
+
+    pool.result_ready.connect(print_result)
+    pool.finished.connect(app.quit)
+    QTimer.singleShot(0, pool.start)
+    app.exec_()
+
+    if source is not None and source is not sys.stdin:
+        source.close()
+    summary = pool.summary()
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+    return 0 if summary["statuses"].get("ok", 0) == summary["pages"] else 1
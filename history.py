@@ -1,20 +1,170 @@
-from PySide2.QtWidgets import QWidget, QVBoxLayout, QListWidget, QHBoxLayout, QPushButton, QMessageBox
-from PySide2.QtCore import Qt, QSettings, QDateTime
-from PySide2.QtGui import QDesktopServices
+import queue
+import sqlite3
+import time
+from PySide2.QtWidgets import (QWidget, QVBoxLayout, QTableView, QHBoxLayout, QPushButton, QMessageBox,
+                               QApplication, QAbstractItemView, QHeaderView, QLineEdit, QFileDialog)
+from PySide2.QtCore import Qt, QDateTime, QThread, QTimer, QUrl, Signal
+from favicons import favicon_service
+from history_store import HistoryStore, url_host
+from import_formats import HISTORY_READERS, detect_format
+from importer import ImportProgress
+from lazy_model import LazyTableModel
+from search_index import SearchIndex
+from settings import settings
+from storage import data_path
+
+
+class SearchIndexer(QThread):
+    """在后台线程中更新历史记录的全文索引
+
+    调用方只把操作放入队列，分词和写入数据库都在这个线程中进行，
+    队列中积累的操作一次提交。第一次运行时从历史记录数据库导入已有记录。
+    """
+
+    def __init__(self, path, history_path, text_limit=8000, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.history_path = history_path
+        self.text_limit = text_limit
+        self.queue = queue.Queue()
+
+    def add_visit(self, url, title, visited_at=None):
+        self.queue.put(("add_visit", (url, title, visited_at or time.time())))
+
+    def set_text(self, url, text):
+        self.queue.put(("set_text", (url, text[:self.text_limit])))
+
+    def clear(self):
+        self.queue.put(("clear", ()))
+
+    def stop(self):
+        """处理完队列中的操作后结束线程"""
+        if self.isRunning():
+            self.queue.put(None)
+            self.wait()
+
+    def run(self):
+        index = SearchIndex(self.path, self.text_limit)
+        index.import_history(self.history_path)
+        while True:
+            batch = [self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            for operation in batch:
+                if operation is None:
+                    index.close()
+                    return
+                method, args = operation
+                getattr(index, method)(*args)
+            index.commit()
+
+
+class HistoryTableModel(LazyTableModel):
+    """历史记录表格模型，按访问时间倒序分页读取数据库"""
+
+    headers = ["时间", "标题", "网址"]
+
+    def __init__(self, store, search=None, parent=None):
+        super().__init__(parent)
+        self.store = store
+        # search(text, offset, limit)，返回的行与 store.page() 格式相同
+        self.search = search
+        self.query = ""
+        favicon_service().icon_ready.connect(self.favicon_ready)
+
+    def set_query(self, query):
+        """按关键词搜索，为空时显示全部记录"""
+        self.query = query.strip()
+        self.reload()
+
+    def fetch_rows(self, offset, limit):
+        if self.query and self.search:
+            return self.search(self.query, offset, limit)
+        before = (self.rows[-1][1], self.rows[-1][0]) if self.rows else None
+        return self.store.page(before, limit)
+
+    def display(self, row, column):
+        row_id, visited_at, url, title = row
+        if column == 0:
+            dt = QDateTime.fromMSecsSinceEpoch(int(visited_at * 1000))
+            return dt.toString("yyyy-MM-dd hh:mm:ss")
+        if column == 1:
+            return title
+        return url
+
+    def decoration(self, row, column):
+        if column == 1:
+            return favicon_service().icon(row[2])
+        return None
+
+    def favicon_ready(self, host):
+        self.rows_changed(lambda row: url_host(row[2]) == host, 1)
 
 
 class HistoryManager(QWidget):
+    open_url = Signal(QUrl)
+    # 鼠标悬停在某条记录上
+    url_hovered = Signal(str)
+    visit_added = Signal(str, str)
+    history_cleared = Signal()
+    history_imported = Signal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("历史记录")
         self.resize(800, 500)
 
+        # 历史记录存储，写入在后台线程中合并提交
+        self.store = HistoryStore(data_path("history.db"),
+                                  settings.int_value("storage/write_interval_ms", 500),
+                                  settings.int_value("storage/write_batch", 200))
+        self.migrate_legacy_history()
+
+        # 全文索引在后台更新，查询使用单独的只读连接
+        self.index_page_text = settings.bool_value("history/index_page_text", True)
+        self.search_indexer = SearchIndexer(data_path("history-search.db"), data_path("history.db"),
+                                            settings.int_value("history/index_text_chars", 8000), self)
+        self.search_indexer.start()
+        self._search_index = None
+
+        app = QApplication.instance()
+        if app:
+            app.aboutToQuit.connect(self.store.close)
+            app.aboutToQuit.connect(self.search_indexer.stop)
+
         # 创建布局
         layout = QVBoxLayout()
 
+        # 搜索框，停止输入后再查询
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("搜索标题、网址和页面内容")
+        self.search_edit.setClearButtonEnabled(True)
+        layout.addWidget(self.search_edit)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_edit.textChanged.connect(lambda: self.search_timer.start())
+        self.search_edit.returnPressed.connect(self.run_search)
+
         # 历史记录列表
-        self.history_list = QListWidget()
-        layout.addWidget(self.history_list)
+        self.history_model = HistoryTableModel(self.store, self.search, self)
+        self.history_view = QTableView()
+        self.history_view.setModel(self.history_model)
+        self.history_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.history_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.history_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.history_view.verticalHeader().hide()
+        self.history_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.history_view.horizontalHeader().setStretchLastSection(True)
+        self.history_view.setColumnWidth(0, 150)
+        self.history_view.setColumnWidth(1, 250)
+        self.history_view.doubleClicked.connect(self.open_history)
+        self.history_view.setMouseTracking(True)
+        self.history_view.entered.connect(lambda index: self.url_hovered.emit(self.history_model.row_at(index.row())[2]))
+        layout.addWidget(self.history_view)
 
         # 按钮布局
         button_layout = QHBoxLayout()
@@ -27,6 +177,10 @@ class HistoryManager(QWidget):
         self.open_btn.clicked.connect(self.open_history)
         button_layout.addWidget(self.open_btn)
 
+        self.import_btn = QPushButton("导入")
+        self.import_btn.clicked.connect(self.import_history)
+        button_layout.addWidget(self.import_btn)
+
         self.close_btn = QPushButton("关闭")
         self.close_btn.clicked.connect(self.close)
         button_layout.addWidget(self.close_btn)
@@ -34,36 +188,49 @@ class HistoryManager(QWidget):
         layout.addLayout(button_layout)
         self.setLayout(layout)
 
-        # 加载历史记录
+    def showEvent(self, event):
+        """每次显示窗口时从最新的记录开始加载"""
+        self.store.flush()
         self.load_history()
+        super().showEvent(event)
 
-    def load_history(self):
-        """从设置加载历史记录"""
-        settings = QSettings("", "Browser")
-        history = settings.value("history", [])
+    def migrate_legacy_history(self):
+        """把旧版保存在设置中的历史记录迁移到数据库"""
+        history = settings.list_value("history")
+        if not history:
+            return
 
-        self.history_list.clear()
-        for entry in history:
-            timestamp, url, title = entry
+        entries = []
+        for timestamp, url, title in history:
             dt = QDateTime.fromString(timestamp, Qt.ISODate)
-            self.history_list.addItem(f"{dt.toString('yyyy-MM-dd hh:mm:ss')} - {title} - {url}")
+            entries.append((url, title, dt.toMSecsSinceEpoch() / 1000))
+        self.store.import_visits(entries)
+        settings.remove("history")
+
+    def load_history(self):
+        """重新加载历史记录列表，具体行由视图滚动时按需获取"""
+        self.history_model.reload()
 
-    def save_history(self, history):
-        """保存历史记录到设置"""
-        settings = QSettings("", "Browser")
-        settings.setValue("history", history)
+    def search(self, text, offset=0, limit=50):
+        """在全文索引中搜索，第一次搜索时才打开索引"""
+        if self._search_index is None:
+            self._search_index = SearchIndex(data_path("history-search.db"))
+        return self._search_index.search(text, offset, limit)
+
+    def run_search(self):
+        self.search_timer.stop()
+        self.history_model.set_query(self.search_edit.text())
 
     def add_history_entry(self, url, title):
         """添加历史记录条目"""
-        settings = QSettings("", "Browser")
-        history = settings.value("history", [])
-
-        # 保留最近100条历史记录
-        if len(history) >= 100:
-            history = history[-99:]
+        self.store.add_visit(url, title)
+        self.search_indexer.add_visit(url, title)
+        self.visit_added.emit(url, title)
 
-        history.append((QDateTime.currentDateTime().toString(Qt.ISODate), url, title))
-        settings.setValue("history", history)
+    def add_page_text(self, url, text):
+        """页面加载完成后取得的正文，加入全文索引"""
+        if self.index_page_text and text:
+            self.search_indexer.set_text(url, text)
 
     def clear_history(self):
         """清除历史记录"""
@@ -72,23 +239,50 @@ class HistoryManager(QWidget):
                                      QMessageBox.Yes | QMessageBox.No)
 
         if reply == QMessageBox.Yes:
-            settings = QSettings("", "Browser")
-            settings.remove("history")
-            self.history_list.clear()
+            self.store.clear()
+            self.search_indexer.clear()
+            self.load_history()
+            self.history_cleared.emit()
 
-    def open_history(self):
-        """打开选中的历史记录"""
-        current_item = self.history_list.currentItem()
-        if not current_item:
+    def import_history(self):
+        """从 Chrome 的 History 或 Firefox 的 places.sqlite 导入访问记录"""
+        path, _ = QFileDialog.getOpenFileName(self, "导入历史记录", "", "浏览器数据 (History places.sqlite);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            reader = HISTORY_READERS.get(detect_format(path))
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.warning(self, "导入历史记录", f"无法读取文件: {e}")
             return
+        if reader is None:
+            QMessageBox.warning(self, "导入历史记录", "该文件不是 Chrome 或 Firefox 的历史记录数据库")
+            return
+
+        # 前几批导入的记录可能还没有提交，查数据库看不到
+        seen = set()
+
+        def consume(batch):
+            added = self.store.import_visits(batch, seen)
+            # 只把新增的访问计入全文索引，重复导入不会增加访问次数
+            for url, title, visited_at in added:
+                self.search_indexer.add_visit(url, title, visited_at)
+            return len(added)
 
-        text = current_item.text()
-        parts = text.split(" - ")
-        if len(parts) < 3:
+        progress = ImportProgress("导入历史记录", reader, path, consume, self)
+        progress.completed.connect(self.history_import_completed)
+
+    def history_import_completed(self, read, imported):
+        self.store.flush()
+        self.load_history()
+        self.history_imported.emit()
+        QMessageBox.information(self, "导入历史记录",
+                                f"已导入 {imported} 条访问记录，跳过 {read - imported} 条已有的记录。")
+
+    def open_history(self):
+        """打开选中的历史记录"""
+        row = self.history_model.row_at(self.history_view.currentIndex().row())
+        if not row:
             return
 
-        url = parts[-1]
-        # 通过父窗口打开历史记录
-        if self.parent():
-            self.parent().tab_widget.add_new_tab(QUrl(url))
-        self.close()
\ No newline at end of file
+        self.open_url.emit(QUrl(row[2]))
+        self.close()
@@ -0,0 +1,146 @@
+import re
+import sqlite3
+import time
+from urllib.parse import urlsplit
+from write_behind import FLUSH_TIMEOUT, WriteBehind
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    host TEXT NOT NULL DEFAULT '',
+    visited_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_visits_url ON visits(url);
+DROP INDEX IF EXISTS idx_visits_visited_at;
+CREATE INDEX IF NOT EXISTS idx_visits_visited_at_id ON visits(visited_at, id);
+CREATE INDEX IF NOT EXISTS idx_visits_host ON visits(host);
+"""
+
+# 协议、主机(含端口)、路径和查询字符串，片段不参与比较
+URL_PARTS = re.compile(r"([a-zA-Z][a-zA-Z0-9+.-]*):(?://([^/?#]*))?([^?#]*)(\?[^#]*)?")
+
+
+def normalize_url(url):
+    """判断网址是否重复时使用的形式: 协议和主机名小写，去掉默认端口、片段和路径末尾的斜杠"""
+    url = url.strip()
+    match = URL_PARTS.match(url)
+    if match is None:
+        return url
+    scheme, authority, path, query = match.groups()
+    scheme = scheme.lower()
+    if authority is None:
+        return f"{scheme}:{path}{query or ''}"
+    host = authority.rpartition("@")[2].lower()
+    if (scheme == "http" and host.endswith(":80")) or (scheme == "https" and host.endswith(":443")):
+        host = host.rpartition(":")[0]
+    return f"{scheme}://{host}{path.rstrip('/')}{query or ''}"
+
+
+def url_host(url):
+    """提取URL中的主机名(小写)"""
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+class HistoryStore:
+    """基于 SQLite 的历史记录存储
+
+    写入交给后台线程批量提交(见 WriteBehind)，调用 flush() 等待提交完成；
+    读取按访问时间倒序分页，不会一次性载入全部记录。read_only 为 True 时
+    只用于读取，不启动写入线程。
+    """
+
+    def __init__(self, path, interval_ms=500, batch_size=200, read_only=False):
+        self.path = path
+
+        self.conn = sqlite3.connect(path, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.writer = None if read_only else WriteBehind(path, interval_ms, batch_size)
+
+    def add_visit(self, url, title="", visited_at=None):
+        """追加一条访问记录"""
+        if visited_at is None:
+            visited_at = time.time()
+        self.writer.execute(
+            "INSERT INTO visits (url, title, host, visited_at) VALUES (?, ?, ?, ?)",
+            (url, title or "", url_host(url), visited_at))
+
+    def import_visits(self, entries, seen=None):
+        """批量导入 (url, title, visited_at) 记录，在一个事务中写入，返回实际导入的记录
+
+        已有同一时间访问同一网址的记录时跳过，重复导入同一个文件不会产生重复记录。
+        seen 为集合时还跳过其中的 (url, visited_at)，并把导入的记录加入集合，
+        用于分批导入时识别前几批中尚未提交的记录。
+        """
+        added = []
+        for url, title, visited_at in entries:
+            key = (url, visited_at)
+            if seen is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            if self.conn.execute("SELECT 1 FROM visits WHERE url = ? AND visited_at = ?", key).fetchone():
+                continue
+            added.append((url, title or "", visited_at))
+        # 其他进程可能同时在写入，插入时再检查一次
+        self.writer.executemany(
+            "INSERT INTO visits (url, title, host, visited_at) SELECT ?, ?, ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM visits WHERE url = ? AND visited_at = ?)",
+            ((url, title, url_host(url), visited_at, url, visited_at) for url, title, visited_at in added))
+        return added
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """提交尚未写入磁盘的记录并等待完成，返回是否在超时之前提交成功"""
+        if self.writer:
+            return self.writer.flush(timeout)
+        return True
+
+    def page(self, before=None, limit=200):
+        """按访问时间倒序返回一页记录: [(id, visited_at, url, title), ...]
+
+        before 为上一页最后一条记录的 (visited_at, id)，为 None 时从最新的记录开始。
+        """
+        if before is None:
+            rows = self.conn.execute(
+                "SELECT id, visited_at, url, title FROM visits ORDER BY visited_at DESC, id DESC LIMIT ?",
+                (limit,))
+        else:
+            rows = self.conn.execute(
+                "SELECT id, visited_at, url, title FROM visits WHERE (visited_at, id) < (?, ?) "
+                "ORDER BY visited_at DESC, id DESC LIMIT ?",
+                (*before, limit))
+        return rows.fetchall()
+
+    def visits_for_host(self, host, limit=200):
+        """返回某个主机最近的访问记录"""
+        return self.conn.execute(
+            "SELECT id, visited_at, url, title FROM visits WHERE host = ? ORDER BY visited_at DESC LIMIT ?",
+            (host.lower(), limit)).fetchall()
+
+    def url_stats(self):
+        """按 URL 汇总访问记录: [(url, title, 访问次数, 最后访问时间), ...]"""
+        return self.conn.execute(
+            "SELECT url, title, COUNT(*), MAX(visited_at) FROM visits GROUP BY url").fetchall()
+
+    def count(self):
+        """记录总数"""
+        return self.conn.execute("SELECT COUNT(*) FROM visits").fetchone()[0]
+
+    def clear(self):
+        """删除全部记录"""
+        self.writer.execute("DELETE FROM visits")
+        self.flush()
+
+    def close(self):
+        """提交并关闭数据库"""
+        if self.writer:
+            self.writer.close()
+        self.conn.close()
@@ -0,0 +1,17 @@
+import os
+from PySide2.QtGui import QIcon
+
+ICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "icons")
+
+# 图标名 -> QIcon，每个图标只从磁盘读取一次
+_icons = {}
+
+
+def icon(name):
+    """按名称返回 resources/icons 下的图标，文件不存在时返回空图标"""
+    cached = _icons.get(name)
+    if cached is None:
+        path = os.path.join(ICON_DIR, name + ".png")
+        cached = QIcon(path) if os.path.exists(path) else QIcon()
+        _icons[name] = cached
+    return cached
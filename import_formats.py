@@ -0,0 +1,435 @@
+import codecs
+import html
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from json.decoder import scanstring
+
+
+# 每次从文件读取的字节数
+CHUNK_SIZE = 1024 * 1024
+
+# Chrome 的时间是从 1601-01-01 起的微秒数
+WEBKIT_EPOCH_OFFSET = 11644473600
+
+# Firefox 根文件夹的显示名称
+FIREFOX_ROOTS = {
+    "menu________": "书签菜单",
+    "toolbar_____": "书签工具栏",
+    "unfiled_____": "其他书签",
+    "mobile______": "移动设备书签",
+}
+
+NETSCAPE_TAG = re.compile(r"<(/?)(dl|h3|a)\b([^>]*)>([^<]*)", re.IGNORECASE)
+NETSCAPE_ATTR = re.compile(r"""([\w-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+
+JSON_TOKEN = re.compile(r'\s*(?:([{}\[\],:])|(")|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null))')
+
+# 解析一个记号之前至少读入这么多后续字符，用于判断节点类型
+JSON_LOOKAHEAD = 64
+CHROME_FOLDER = re.compile(r'\{\s*"children"\s*:')
+
+
+class SourceFile:
+    """按块读取并解码文件，记录已读取的字节数用于显示进度"""
+
+    def __init__(self, path, progress=None, passes=1):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.progress = progress
+        # 需要读取几遍，进度按总字节数计算
+        self.passes = passes
+        self.done = 0
+
+    def chunks(self):
+        """逐块产生解码后的文本"""
+        decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        with open(self.path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                self.done += len(data)
+                if self.progress:
+                    self.progress(self.done, self.size * self.passes)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    yield text
+                if not data:
+                    return
+
+
+def detect_format(path):
+    """根据文件内容判断格式: netscape、chrome、firefox、chrome_history，无法识别时返回 None"""
+    with open(path, "rb") as f:
+        head = f.read(4096)
+    if head.startswith(b"SQLite format 3\0"):
+        conn = open_database(path)
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+        if {"moz_places", "moz_bookmarks"} <= tables:
+            return "firefox"
+        if {"urls", "visits"} <= tables:
+            return "chrome_history"
+        return None
+    text = head.decode("utf-8", "replace").lstrip("\ufeff \t\r\n")
+    if text.startswith("{"):
+        return "chrome"
+    if text.startswith("<"):
+        return "netscape"
+    return None
+
+
+def open_database(path):
+    """以只读方式打开其他浏览器的数据库，浏览器正在运行并锁定文件时也能读取"""
+    uri = "file:" + os.path.abspath(path).replace("?", "%3f").replace("#", "%23") + "?mode=ro&immutable=1"
+    return sqlite3.connect(uri, uri=True)
+
+
+def parse_timestamp(value):
+    """书签文件中的时间，可能是秒、毫秒或微秒"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return time.time()
+    if value > 1e14:
+        return value / 1e6
+    if value > 1e11:
+        return value / 1e3
+    return value
+
+
+def webkit_time(value):
+    """Chrome 的时间转换为 Unix 时间戳"""
+    try:
+        return int(value) / 1e6 - WEBKIT_EPOCH_OFFSET
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def read_netscape_bookmarks(path, progress=None):
+    """逐条产生 Netscape 书签文件(各浏览器导出的 HTML)中的 (标题, 网址, 文件夹, 添加时间)
+
+    文件只用到 <DL>、<H3> 和 <A> 几种标签，直接用正则表达式扫描，
+    每次只处理缓冲区中到最后一个 "<" 为止的部分。
+    """
+    # 每一层 <DL> 对应的文件夹名，最外层为 None
+    folders = []
+    next_folder = None
+    rest = ""
+    for text in SourceFile(path, progress).chunks():
+        buffer = rest + text
+        cut = buffer.rfind("<")
+        if cut <= 0:
+            rest = buffer
+            continue
+        rest = buffer[cut:]
+        for closing, tag, attrs, data in NETSCAPE_TAG.findall(buffer, 0, cut):
+            tag = tag.lower()
+            if tag == "dl":
+                if closing:
+                    if folders:
+                        folders.pop()
+                else:
+                    folders.append(next_folder)
+                    next_folder = None
+            elif closing:
+                continue
+            elif tag == "h3":
+                next_folder = " ".join(html.unescape(data).split())
+            else:
+                attrs = {name.lower(): html.unescape(double or single or bare)
+                         for name, double, single, bare in NETSCAPE_ATTR.findall(attrs)}
+                url = attrs.get("href")
+                if url:
+                    title = " ".join(html.unescape(data).split()) or url
+                    yield title, url, "/".join(name for name in folders if name), parse_timestamp(attrs.get("add_date"))
+
+
+def json_events(chunks, whole=None):
+    """流式解析 JSON，逐个产生 (事件, 值)
+
+    事件为 start_map、end_map、start_array、end_array、key 和 value，
+    只在缓冲区中保留尚未解析的部分。数组中的对象在 whole(buffer, pos)
+    为真时整个解码，作为一个 value 事件产生。
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    # 每一层容器是否为对象
+    stack = []
+    expect_key = False
+
+    while True:
+        match = JSON_TOKEN.match(buffer, pos)
+        token = None
+        if match and (eof or match.end() + JSON_LOOKAHEAD <= len(buffer)):
+            punctuation, quote, scalar = match.groups()
+            try:
+                if quote:
+                    value, end = scanstring(buffer, match.end())
+                    token = "string"
+                elif punctuation == "{" and stack and not stack[-1] and whole and whole(buffer, match.start(1)):
+                    value, end = decoder.raw_decode(buffer, match.start(1))
+                    token = "object"
+                else:
+                    token, value, end = punctuation or "scalar", scalar, match.end()
+            except ValueError:
+                if eof:
+                    raise
+                token = None
+
+        if token is None:
+            if eof:
+                if buffer[pos:].strip():
+                    raise ValueError(f"无法解析的 JSON: {buffer[pos:pos + 40]!r}")
+                return
+            # 读到的数据不完整，接上下一块再解析
+            chunk = next(chunks, "")
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        pos = end
+        if token == "{":
+            stack.append(True)
+            expect_key = True
+            yield "start_map", None
+        elif token == "[":
+            stack.append(False)
+            expect_key = False
+            yield "start_array", None
+        elif token in ("}", "]"):
+            stack.pop()
+            expect_key = False
+            yield ("end_map" if token == "}" else "end_array"), None
+        elif token == ",":
+            expect_key = bool(stack) and stack[-1]
+        elif token == ":":
+            expect_key = False
+        elif token == "string":
+            yield ("key" if expect_key else "value"), value
+            expect_key = False
+        elif token == "object":
+            yield "value", value
+        else:
+            yield "value", json.loads(value)
+
+
+def chrome_leaf(buffer, pos):
+    """Chrome 按键名排序写出节点，不以 children 开头的节点没有子节点，可以整个解码"""
+    return not CHROME_FOLDER.match(buffer, pos)
+
+
+def chrome_nodes(path, progress, passes, current_pass):
+    """产生 Chrome 书签文件中每个结束的节点: (编号, 祖先节点编号列表, 字段)
+
+    节点编号是对象在文件中出现的顺序，两遍读取时相同。
+    """
+    source = SourceFile(path, progress, passes)
+    source.done = source.size * current_pass
+    ordinal = 0
+    # [(编号, 字段, 当前的键)]
+    frames = []
+    for event, value in json_events(source.chunks(), chrome_leaf):
+        if event == "start_map":
+            frames.append([ordinal, {}, None])
+            ordinal += 1
+        elif event == "end_map":
+            node, fields, key = frames.pop()
+            yield node, [frame[0] for frame in frames], fields
+        elif event == "key" and frames:
+            frames[-1][2] = value
+        elif event == "value" and isinstance(value, dict):
+            yield ordinal, [frame[0] for frame in frames], value
+            ordinal += 1
+        elif event == "value" and frames:
+            key = frames[-1][2]
+            if key in ("name", "type", "url", "date_added"):
+                frames[-1][1][key] = value
+
+
+def read_chrome_bookmarks(path, progress=None):
+    """逐条产生 Chrome 书签文件(Bookmarks)中的 (标题, 网址, 文件夹, 添加时间)
+
+    文件夹的名称写在子节点之后，先读一遍记下所有文件夹的名称，第二遍再产生书签。
+    """
+    folders = {}
+    for node, ancestors, fields in chrome_nodes(path, progress, 2, 0):
+        if fields.get("type") == "folder":
+            folders[node] = fields.get("name", "")
+
+    for node, ancestors, fields in chrome_nodes(path, progress, 2, 1):
+        if fields.get("type") == "url" and fields.get("url"):
+            folder = "/".join(folders[ancestor] for ancestor in ancestors if folders.get(ancestor))
+            yield (fields.get("name") or fields["url"], fields["url"], folder,
+                   webkit_time(fields.get("date_added")))
+
+
+def query_rows(path, count_sql, sql, progress=None):
+    """逐行产生查询结果，按行数报告进度"""
+    conn = open_database(path)
+    try:
+        total = conn.execute(count_sql).fetchone()[0]
+        for done, row in enumerate(conn.execute(sql), 1):
+            if progress and done % 1000 == 0:
+                progress(done, total)
+            yield row
+        if progress:
+            progress(total, total)
+    finally:
+        conn.close()
+
+
+def read_firefox_bookmarks(path, progress=None):
+    """逐条产生 Firefox 配置文件中 places.sqlite 的书签，不包括标签和智能书签"""
+    conn = open_database(path)
+    try:
+        folders = {row[0]: row[1:] for row in conn.execute(
+            "SELECT id, parent, guid, IFNULL(title, '') FROM moz_bookmarks WHERE type = 2")}
+    finally:
+        conn.close()
+    tags_root = next((folder_id for folder_id, (_, guid, _) in folders.items() if guid == "tags________"), None)
+
+    paths = {}
+
+    def folder_path(folder_id):
+        """文件夹的完整路径，标签文件夹返回 None"""
+        if folder_id not in paths:
+            if folder_id == tags_root:
+                paths[folder_id] = None
+            elif folder_id not in folders:
+                paths[folder_id] = ""
+            else:
+                parent, guid, title = folders[folder_id]
+                parent_path = folder_path(parent) if parent != folder_id else ""
+                name = FIREFOX_ROOTS.get(guid, "" if guid == "root________" else title)
+                if parent_path is None:
+                    paths[folder_id] = None
+                else:
+                    paths[folder_id] = "/".join(part for part in (parent_path, name) if part)
+        return paths[folder_id]
+
+    rows = query_rows(
+        path, "SELECT COUNT(*) FROM moz_bookmarks WHERE type = 1",
+        "SELECT b.parent, IFNULL(b.title, ''), p.url, b.dateAdded FROM moz_bookmarks b "
+        "JOIN moz_places p ON p.id = b.fk WHERE b.type = 1 ORDER BY b.parent, b.position", progress)
+    for parent, title, url, added in rows:
+        folder = folder_path(parent)
+        if folder is None or not url or url.startswith("place:"):
+            continue
+        yield title or url, url, folder, (added or 0) / 1e6 or time.time()
+
+
+def read_firefox_history(path, progress=None):
+    """逐条产生 places.sqlite 中的访问记录 (网址, 标题, 访问时间)"""
+    rows = query_rows(
+        path, "SELECT COUNT(*) FROM moz_historyvisits",
+        "SELECT p.url, IFNULL(p.title, ''), v.visit_date FROM moz_historyvisits v "
+        "JOIN moz_places p ON p.id = v.place_id ORDER BY v.visit_date", progress)
+    for url, title, visited_at in rows:
+        yield url, title, visited_at / 1e6
+
+
+def read_chrome_history(path, progress=None):
+    """逐条产生 Chrome 配置文件中 History 数据库的访问记录 (网址, 标题, 访问时间)"""
+    rows = query_rows(
+        path, "SELECT COUNT(*) FROM visits",
+        "SELECT u.url, IFNULL(u.title, ''), v.visit_time FROM visits v "
+        "JOIN urls u ON u.id = v.url ORDER BY v.visit_time", progress)
+    for url, title, visited_at in rows:
+        yield url, title, webkit_time(visited_at)
+
+
+BOOKMARK_READERS = {
+    "netscape": read_netscape_bookmarks,
+    "chrome": read_chrome_bookmarks,
+    "firefox": read_firefox_bookmarks,
+}
+
+HISTORY_READERS = {
+    "firefox": read_firefox_history,
+    "chrome_history": read_chrome_history,
+}
+
+
+def folder_tree(bookmarks):
+    """按文件夹路径把书签组织成树: (子文件夹字典, 书签列表)"""
+    root = ({}, [])
+    for bookmark in bookmarks:
+        node = root
+        for name in bookmark.folder.split("/"):
+            if name:
+                node = node[0].setdefault(name, ({}, []))
+        node[1].append(bookmark)
+    return root
+
+
+def write_netscape_bookmarks(path, bookmarks):
+    """把书签写成 Netscape 书签文件，各浏览器都能导入"""
+    def write_folder(f, node, depth):
+        indent = "    " * depth
+        f.write(f"{indent}<DL><p>\n")
+        folders, items = node
+        for name, child in folders.items():
+            f.write(f"{indent}    <DT><H3>{html.escape(name)}</H3>\n")
+            write_folder(f, child, depth + 1)
+        for bookmark in items:
+            f.write(f'{indent}    <DT><A HREF="{html.escape(bookmark.url)}" ADD_DATE="{int(bookmark.created)}">'
+                    f"{html.escape(bookmark.title)}</A>\n")
+        f.write(f"{indent}</DL><p>\n")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE NETSCAPE-Bookmark-file-1>\n"
+                '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+                "<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n")
+        write_folder(f, folder_tree(bookmarks), 0)
+
+
+def write_chrome_bookmarks(path, bookmarks):
+    """把书签写成 Chrome 书签文件的格式，全部放在“其他书签”下"""
+    ids = iter(range(4, 1 << 62))
+
+    def write_folder(f, name, node, node_id, depth):
+        indent = "   " * depth
+        f.write(f'{indent}{{"children": [')
+        folders, items = node
+        first = True
+        for child_name, child in folders.items():
+            f.write("\n" if first else ",\n")
+            write_folder(f, child_name, child, next(ids), depth + 1)
+            first = False
+        for bookmark in items:
+            f.write("\n" if first else ",\n")
+            f.write(indent + "   " + json.dumps({
+                "date_added": str(int((bookmark.created + WEBKIT_EPOCH_OFFSET) * 1e6)),
+                "guid": str(uuid.uuid4()),
+                "id": str(next(ids)),
+                "name": bookmark.title,
+                "type": "url",
+                "url": bookmark.url,
+            }, ensure_ascii=False))
+            first = False
+        f.write(f'], "guid": "{uuid.uuid4()}", "id": "{node_id}", '
+                f'"name": {json.dumps(name, ensure_ascii=False)}, "type": "folder"}}')
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"roots": {\n"bookmark_bar": ')
+        write_folder(f, "书签栏", ({}, []), 1, 1)
+        f.write(',\n"other": ')
+        write_folder(f, "其他书签", folder_tree(bookmarks), 2, 1)
+        f.write(',\n"synced": ')
+        write_folder(f, "移动设备书签", ({}, []), 3, 1)
+        f.write('\n}, "version": 1}\n')
+
+
+BOOKMARK_WRITERS = {
+    "netscape": write_netscape_bookmarks,
+    "chrome": write_chrome_bookmarks,
+}
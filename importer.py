@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import threading
+from PySide2.QtWidgets import QProgressDialog, QMessageBox
+from PySide2.QtCore import Qt, QThread, Signal
+
+# 每批交给界面线程写入的条数
+IMPORT_BATCH = 1000
+
+# 界面线程还没处理完这么多批时，读取线程暂停
+MAX_PENDING_BATCHES = 4
+
+
+class ImportWorker(QThread):
+    """在后台线程中读取其他浏览器的数据，按批交给界面线程写入
+
+    reader(path, progress) 逐条产生记录。已读取但未处理的批数有上限，
+    写入跟不上时读取线程等待，内存中最多只有几批记录。
+    """
+
+    batch_ready = Signal(list)
+    # 千分比
+    progress = Signal(int)
+    failed = Signal(str)
+
+    def __init__(self, reader, path, parent=None):
+        super().__init__(parent)
+        self.reader = reader
+        self.path = path
+        self.slots = threading.Semaphore(MAX_PENDING_BATCHES)
+        self.cancelled = False
+        self.read = 0
+        self.permille = -1
+
+    def report(self, done, total):
+        permille = min(1000, done * 1000 // total) if total else 1000
+        if permille != self.permille:
+            self.permille = permille
+            self.progress.emit(permille)
+
+    def run(self):
+        batch = []
+        try:
+            for entry in self.reader(self.path, self.report):
+                if self.cancelled:
+                    return
+                batch.append(entry)
+                if len(batch) >= IMPORT_BATCH:
+                    self.send(batch)
+                    batch = []
+            if batch and not self.cancelled:
+                self.send(batch)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.failed.emit(str(e))
+
+    def send(self, batch):
+        self.slots.acquire()
+        self.read += len(batch)
+        self.batch_ready.emit(batch)
+
+    def batch_done(self):
+        """界面线程处理完一批"""
+        self.slots.release()
+
+    def cancel(self):
+        self.cancelled = True
+        self.slots.release()
+
+
+class ImportProgress(QProgressDialog):
+    """导入进度对话框
+
+    consume(batch) 在界面线程中写入一批记录并返回实际导入的条数，
+    全部完成后发出 completed(读取的条数, 导入的条数)，取消或出错时不发出。
+    """
+
+    completed = Signal(int, int)
+
+    def __init__(self, title, reader, path, consume, parent=None):
+        super().__init__(f"正在导入 {os.path.basename(path)}...", "取消", 0, 1000, parent)
+        self.setWindowTitle(title)
+        self.setWindowModality(Qt.WindowModal)
+        self.setMinimumDuration(300)
+        self.consume = consume
+        self.imported = 0
+        self.error = None
+
+        self.worker = ImportWorker(reader, path, self)
+        self.worker.progress.connect(self.setValue)
+        self.worker.batch_ready.connect(self.import_batch)
+        self.worker.failed.connect(self.import_failed)
+        self.worker.finished.connect(self.import_finished)
+        self.canceled.connect(self.worker.cancel)
+        self.worker.start()
+
+    def import_batch(self, batch):
+        if not self.worker.cancelled:
+            self.imported += self.consume(batch)
+        self.worker.batch_done()
+
+    def import_failed(self, message):
+        self.error = message
+
+    def import_finished(self):
+        self.reset()
+        self.hide()
+        if self.error:
+            QMessageBox.warning(self.parent(), self.windowTitle(), f"导入失败: {self.error}")
+        elif not self.worker.cancelled:
+            self.completed.emit(self.worker.read, self.imported)
+        self.deleteLater()
@@ -0,0 +1,93 @@
+from PySide2.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class LazyTableModel(QAbstractTableModel):
+    """按需分批获取数据的表格模型基类
+
+    子类实现 fetch_rows() 返回下一批原始行数据，
+    实现 display() 在绘制单元格时才格式化显示内容，
+    需要图标时实现 decoration()。
+    """
+
+    headers = []
+    batch_size = 200
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.exhausted = False
+
+    def fetch_rows(self, offset, limit):
+        """返回从 offset 开始的最多 limit 行原始数据"""
+        raise NotImplementedError
+
+    def display(self, row, column):
+        """返回某一行某一列的显示文本"""
+        raise NotImplementedError
+
+    def decoration(self, row, column):
+        """返回某一行某一列的图标"""
+        return None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.display(self.rows[index.row()], index.column())
+        if role == Qt.DecorationRole:
+            return self.decoration(self.rows[index.row()], index.column())
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+
+        batch = self.fetch_rows(len(self.rows), self.batch_size)
+        if len(batch) < self.batch_size:
+            self.exhausted = True
+        if not batch:
+            return
+
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+        self.rows.extend(batch)
+        self.endInsertRows()
+
+    def reload(self):
+        """丢弃已加载的行，从头开始获取"""
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+
+    def notify_appended(self):
+        """数据源末尾追加了数据，已经全部加载时立即取回新行"""
+        if self.exhausted:
+            self.exhausted = False
+            self.fetchMore()
+
+    def rows_changed(self, matches, column=0):
+        """已加载的行中满足 matches(row) 的行需要重绘"""
+        rows = [i for i, row in enumerate(self.rows) if matches(row)]
+        if rows:
+            self.dataChanged.emit(self.index(rows[0], column), self.index(rows[-1], column))
+
+    def row_at(self, row):
+        """返回某一行的原始数据"""
+        if 0 <= row < len(self.rows):
+            return self.rows[row]
+        return None
@@ -1,24 +1,169 @@
+from startup_profile import startup
+from tracing import HEARTBEAT_MS, STALL_MS, tracer
+import argparse
+import json
 import sys
 import os
-from PySide2.QtWidgets import QApplication
-from PySide2.QtCore import QSettings, QStandardPaths
-from browser_window import BrowserWindow
+from PySide2.QtCore import QCoreApplication, QTimer
+from single_instance import InstanceServer, send_command
+
+
+def parse_args(argv):
+    """解析命令行参数，未识别的参数留给 Qt"""
+    parser = argparse.ArgumentParser(prog="SaFan")
+    parser.add_argument("urls", nargs="*", metavar="URL",
+                        help="要打开的网址，已有实例在运行时在该实例中打开")
+    parser.add_argument("--new-window", action="store_true",
+                        help="在新窗口中打开网址")
+    parser.add_argument("--new-instance", action="store_true",
+                        help="不连接正在运行的实例，单独启动")
+    parser.add_argument("--list-tabs", action="store_true",
+                        help="以 JSON 输出正在运行的实例的所有标签页")
+    parser.add_argument("--close-tab", type=int, metavar="TAB_ID",
+                        help="关闭正在运行的实例中的标签页")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="启动后打印各阶段耗时")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="记录界面线程上每个回调的耗时和卡顿，退出时以 Chrome 跟踪格式写入 FILE")
+    parser.add_argument("--trace-stall-ms", type=int, default=STALL_MS, metavar="MS",
+                        help=f"界面线程超过多少毫秒没有响应算作卡顿(默认 {STALL_MS})")
+
+    batch = parser.add_argument_group("批量渲染")
+    batch.add_argument("--headless", action="store_true",
+                       help="不显示窗口，渲染命令行和 --input 中的网址后退出")
+    batch.add_argument("--input", metavar="FILE",
+                       help="从 FILE 读取要渲染的网址，每行一个；- 表示标准输入")
+    batch.add_argument("--output-dir", default=".", metavar="DIR",
+                       help="截图和 PDF 的保存目录(默认当前目录)")
+    batch.add_argument("--format", choices=["png", "pdf", "both", "none"], default="png",
+                       help="输出格式(默认 png)")
+    batch.add_argument("--concurrency", type=int, default=4, metavar="N",
+                       help="同时渲染的页面数(默认 4)")
+    batch.add_argument("--timeout", type=float, default=30, metavar="SECONDS",
+                       help="每个页面的超时时间(默认 30 秒)")
+    batch.add_argument("--viewport", default="1280x800", metavar="WxH",
+                       help="页面的视口大小(默认 1280x800)")
+    args, qt_args = parser.parse_known_args(argv[1:])
+    if args.input is not None and not args.headless:
+        parser.error("--input 只能和 --headless 一起使用")
+    return args, qt_args
+
+
+def forward_to_running_instance(args):
+    """把命令交给正在运行的实例
+
+    返回进程的退出码；没有正在运行的实例、需要自己启动时返回 None。
+    """
+    if args.list_tabs:
+        command = {"command": "list"}
+    elif args.close_tab is not None:
+        command = {"command": "close", "tab_id": args.close_tab}
+    else:
+        command = {"command": "open", "urls": args.urls, "new_window": args.new_window}
+
+    reply = send_command(command)
+    if reply is None:
+        if command["command"] == "open":
+            return None
+        print("没有正在运行的 SaFan", file=sys.stderr)
+        return 1
+
+    if not reply.get("ok"):
+        print(reply.get("error", "命令执行失败"), file=sys.stderr)
+        return 1
+    if command["command"] == "list":
+        print(json.dumps(reply["tabs"], ensure_ascii=False, indent=2))
+    return 0
 
 
 def main():
+    args, qt_args = parse_args(sys.argv)
+    startup.enabled = args.profile_startup
+    startup.mark("导入模块")
+
+    # 数据目录和本地套接字的名称都取决于组织名和应用名
+    QCoreApplication.setOrganizationName("SaFan")
+    QCoreApplication.setApplicationName("SaFan Browser")
+
+    # 批量渲染不连接正在运行的实例，也不读写浏览器的数据
+    if args.headless:
+        sys.exit(run_headless(args, qt_args))
+
+    # 已有实例在运行时交给它处理，不加载浏览器模块也不创建窗口
+    if not args.new_instance:
+        status = forward_to_running_instance(args)
+        if status is not None:
+            sys.exit(status)
+    startup.mark("检查正在运行的实例")
+
+    from PySide2.QtWidgets import QApplication
+    from browser_services import BrowserServices
+    from browser_window import BrowserWindow
+    from profile_manager import ProfileManager
+    from session import SessionManager
+    from settings import settings
+    from storage import data_path
+    startup.mark("导入浏览器模块")
+
     # 创建应用
-    app = QApplication(sys.argv)
-    app.setApplicationName("SaFan Browser")
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setApplicationVersion("2.0.0")
+    startup.mark("创建应用")
 
-    # 设置应用样式
-    apply_styles(app)
+    # 跟踪从这里开始，事件循环开始之前的启动工作会记为一次卡顿
+    if args.trace:
+        tracer.start(args.trace, args.trace_stall_ms)
+        heartbeat = QTimer(app)
+        heartbeat.setInterval(HEARTBEAT_MS)
+        heartbeat.timeout.connect(tracer.beat)
+        heartbeat.start()
+        app.aboutToQuit.connect(tracer.stop)
+
+    # 所有窗口共用同一个 profile 和缓存
+    profile_manager = ProfileManager()
+    startup.mark("创建 profile")
+
+    # 所有窗口共用历史记录、书签和下载管理器
+    session = SessionManager(data_path("session.json"))
+    services = BrowserServices(session, profile_manager)
+    app.aboutToQuit.connect(session.save)
+
+    # 之后启动的进程通过本地套接字把网址和命令发到这里
+    instance_server = InstanceServer(services.handle_command, app)
+    if not args.new_instance:
+        instance_server.listen()
+
+    # 恢复上次的会话，没有会话时创建主窗口
+    if not session.restore(lambda: BrowserWindow(services, open_home=False)):
+        services.new_window(open_home=not args.urls)
+    if args.urls:
+        services.command_open(args.urls)
+    startup.mark("显示窗口")
 
-    # 创建主窗口
-    browser = BrowserWindow()
-    browser.show()
+    # 首次绘制之后再设置应用样式
+    services.current_window().first_painted.connect(lambda: finish_startup(app))
 
-    sys.exit(app.exec_())
+    status = app.exec_()
+    settings.flush()
+    sys.exit(status)
+
+
+def run_headless(args, qt_args):
+    """--headless 模式，默认使用离屏平台"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ.setdefault("QTWEBENGINE_CHROMIUM_FLAGS", "--disable-gpu")
+    from PySide2.QtWidgets import QApplication
+    from headless import run_batch
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    return run_batch(app, args)
+
+
+def finish_startup(app):
+    """窗口显示之后再做的启动工作"""
+    apply_styles(app)
+    startup.mark("加载样式表")
+    startup.report()
 
 
 def apply_styles(app):
@@ -0,0 +1,171 @@
+from PySide2.QtWidgets import QCompleter
+from PySide2.QtGui import QStandardItemModel, QStandardItem
+from PySide2.QtCore import Qt, QObject, QThread, QTimer, Signal
+from frecency_index import FrecencyIndex
+from history_store import HistoryStore
+
+# 停止输入多久之后才查询(毫秒)
+DEBOUNCE_MS = 30
+
+
+class IndexBuilder(QThread):
+    """在后台线程中从历史数据库和书签建立补全索引"""
+
+    built = Signal(object)
+
+    def __init__(self, history_path, bookmarks, parent=None):
+        super().__init__(parent)
+        self.history_path = history_path
+        self.bookmarks = bookmarks
+
+    def run(self):
+        # SQLite 连接不能跨线程使用，这里单独打开一个
+        store = HistoryStore(self.history_path, read_only=True)
+        try:
+            visits = store.url_stats()
+        finally:
+            store.close()
+
+        index = FrecencyIndex()
+        index.load(visits, self.bookmarks)
+        self.built.emit(index)
+
+
+class OmniboxIndex(QObject):
+    """地址栏补全索引，首次使用时在后台建立，之后增量更新"""
+
+    ready = Signal()
+
+    def __init__(self, history_path, bookmarks_provider, parent=None):
+        super().__init__(parent)
+        self.history_path = history_path
+        self.bookmarks_provider = bookmarks_provider
+        self.index = None
+        self.builder = None
+        # 每次 reset() 加一，之前开始建立的索引完成后直接丢弃
+        self.generation = 0
+        # 建立索引期间收到的更新
+        self.pending = []
+
+    def is_ready(self):
+        return self.index is not None
+
+    def build(self):
+        """开始在后台建立索引"""
+        if self.index is not None or self.builder is not None:
+            return
+        bookmarks = [(bookmark.url, bookmark.title) for bookmark in self.bookmarks_provider()]
+        self.builder = IndexBuilder(self.history_path, bookmarks, self)
+        self.builder.built.connect(lambda index, generation=self.generation: self.index_built(generation, index))
+        self.builder.finished.connect(self.builder.deleteLater)
+        self.builder.start()
+
+    def index_built(self, generation, index):
+        if generation != self.generation:
+            return
+        self.index = index
+        self.builder = None
+        for method, args in self.pending:
+            getattr(index, method)(*args)
+        self.pending = []
+        self.ready.emit()
+
+    def reset(self):
+        """丢弃索引和正在建立的索引，下次查询时重新建立"""
+        self.generation += 1
+        self.index = None
+        self.builder = None
+        self.pending = []
+
+    def add_visit(self, url, title):
+        """记录一次访问"""
+        if self.index is not None:
+            self.index.add_visit(url, title)
+        elif self.builder is not None:
+            self.pending.append(("add_visit", (url, title)))
+
+    def add_bookmark(self, url, title):
+        """记录一个书签"""
+        if self.index is not None:
+            self.index.add_bookmark(url, title)
+        elif self.builder is not None:
+            self.pending.append(("add_bookmark", (url, title)))
+
+    def remove_bookmark(self, url):
+        """删除一个书签"""
+        if self.index is not None:
+            self.index.remove_bookmark(url)
+        elif self.builder is not None:
+            self.pending.append(("remove_bookmark", (url,)))
+
+    def query(self, text, limit=8):
+        """查询补全结果，索引尚未就绪时返回空列表"""
+        if self.index is None:
+            self.build()
+            return []
+        return self.index.query(text, limit)
+
+
+class OmniboxCompleter(QObject):
+    """地址栏补全
+
+    每次按键只重新启动定时器，停止输入 DEBOUNCE_MS 毫秒后才查询一次；
+    新的按键会取消尚未执行的查询。
+    """
+
+    activated = Signal(str)
+
+    def __init__(self, line_edit, omnibox_index, parent=None):
+        super().__init__(parent)
+        self.line_edit = line_edit
+        self.omnibox_index = omnibox_index
+
+        self.model = QStandardItemModel(self)
+        self.completer = QCompleter(self.model, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setCompletionRole(Qt.UserRole)
+        self.completer.setWidget(line_edit)
+        self.completer.activated[str].connect(self.complete_activated)
+
+        self.query_timer = QTimer(self)
+        self.query_timer.setSingleShot(True)
+        self.query_timer.setInterval(DEBOUNCE_MS)
+        self.query_timer.timeout.connect(self.run_query)
+
+        line_edit.textEdited.connect(self.text_edited)
+        line_edit.returnPressed.connect(self.cancel)
+        omnibox_index.ready.connect(self.run_query)
+
+    def text_edited(self, text):
+        """输入变化时推迟查询"""
+        if text.strip():
+            self.query_timer.start()
+        else:
+            self.cancel()
+
+    def cancel(self):
+        """取消尚未执行的查询并隐藏补全列表"""
+        self.query_timer.stop()
+        self.completer.popup().hide()
+
+    def run_query(self):
+        """查询索引并显示补全列表"""
+        text = self.line_edit.text()
+        if not self.line_edit.hasFocus() or not text.strip():
+            return
+
+        entries = self.omnibox_index.query(text)
+        self.model.clear()
+        for entry in entries:
+            item = QStandardItem(f"{entry.url}    {entry.title}" if entry.title else entry.url)
+            item.setData(entry.url, Qt.UserRole)
+            self.model.appendRow(item)
+
+        if entries:
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def complete_activated(self, url):
+        self.line_edit.setText(url)
+        self.activated.emit(url)
@@ -0,0 +1,152 @@
+import csv
+import json
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, asdict, fields
+from PySide2.QtCore import QObject, Signal
+from history_store import url_host
+from settings import settings
+
+# 页面加载完成后读取 Navigation Timing 和 Resource Timing，时间均相对于导航开始
+NAVIGATION_TIMING_JS = """
+(function () {
+    var nav = performance.getEntriesByType("navigation")[0];
+    var resources = performance.getEntriesByType("resource");
+    var transfer = nav ? nav.transferSize : 0;
+    resources.forEach(function (entry) {
+        transfer += entry.transferSize || 0;
+    });
+    return {
+        ttfb: nav ? nav.responseStart : -1,
+        dom_content_loaded: nav ? nav.domContentLoadedEventEnd : -1,
+        load_event: nav ? nav.loadEventStart : -1,
+        resources: resources.length,
+        transfer: transfer
+    };
+})();
+"""
+
+# 参与汇总的指标
+SUMMARY_FIELDS = ["load_started_ms", "load_finished_ms", "ttfb_ms", "dom_content_loaded_ms",
+                  "load_event_ms", "transfer_bytes", "blocked"]
+
+
+@dataclass
+class PageLoad:
+    """一次页面加载的记录，时间单位为毫秒，-1 表示未取得"""
+    tab_id: int
+    url: str
+    started: float
+    ok: bool = False
+    # 从请求导航到 loadStarted、loadFinished 的时间
+    load_started_ms: float = -1
+    load_finished_ms: float = -1
+    # 页面内的 Navigation Timing
+    ttfb_ms: float = -1
+    dom_content_loaded_ms: float = -1
+    load_event_ms: float = -1
+    resources: int = 0
+    transfer_bytes: int = 0
+    blocked: int = 0
+
+
+def percentile(values, fraction):
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class PageMetrics(QObject):
+    """记录每个标签页每次导航的加载耗时
+
+    最近的记录保存在环形缓冲区中，可以按主机汇总 p50/p95，
+    并导出为 JSON 或 CSV 以便对比不同版本。
+    """
+
+    recorded = Signal(object)
+
+    def __init__(self, content_filter=None, parent=None):
+        super().__init__(parent)
+        self.content_filter = content_filter
+        capacity = settings.int_value("metrics/capacity", 500)
+        self.records = deque(maxlen=capacity)
+        # 正在加载的标签页: 浏览器部件 -> (开始时间, 记录)
+        self.pending = {}
+
+    def attach(self, browser):
+        """开始记录某个标签页的加载"""
+        browser.page().navigation_requested.connect(
+            lambda url, navigation_type: self.navigation_requested(browser, url))
+        browser.loadStarted.connect(lambda: self.load_started(browser))
+        browser.loadFinished.connect(lambda ok: self.load_finished(browser, ok))
+        browser.destroyed.connect(lambda: self.pending.pop(browser, None))
+
+    def navigation_requested(self, browser, url):
+        record = PageLoad(browser.tab_id, url.toString(), time.time())
+        self.pending[browser] = (time.perf_counter(), record)
+
+    def load_started(self, browser):
+        # 恢复前进/后退记录等情况不会经过 acceptNavigationRequest
+        if browser not in self.pending:
+            self.navigation_requested(browser, browser.url())
+        start, record = self.pending[browser]
+        record.load_started_ms = (time.perf_counter() - start) * 1000
+
+    def load_finished(self, browser, ok):
+        if browser not in self.pending:
+            return
+        start, record = self.pending.pop(browser)
+        record.load_finished_ms = (time.perf_counter() - start) * 1000
+        record.ok = ok
+        record.url = browser.url().toString()
+        if self.content_filter is not None:
+            record.blocked = self.content_filter.blocked_count(browser)
+
+        if ok:
+            browser.page().runJavaScript(NAVIGATION_TIMING_JS, lambda result: self.timing_collected(record, result))
+        else:
+            self.add_record(record)
+
+    def timing_collected(self, record, result):
+        if isinstance(result, dict):
+            record.ttfb_ms = float(result.get("ttfb", -1))
+            record.dom_content_loaded_ms = float(result.get("dom_content_loaded", -1))
+            record.load_event_ms = float(result.get("load_event", -1))
+            record.resources = int(result.get("resources", 0))
+            record.transfer_bytes = int(result.get("transfer", 0))
+        self.add_record(record)
+
+    def add_record(self, record):
+        self.records.append(record)
+        self.recorded.emit(record)
+
+    def summary(self, host=None):
+        """各项指标的 p50/p95，host 不为空时只统计该主机"""
+        records = [record for record in self.records
+                   if record.ok and (host is None or url_host(record.url) == host)]
+        result = {"count": len(records)}
+        for name in SUMMARY_FIELDS:
+            values = [getattr(record, name) for record in records if getattr(record, name) >= 0]
+            result[name] = {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+        return result
+
+    def export_json(self, path):
+        """导出全部记录和汇总"""
+        data = {
+            "exported": time.time(),
+            "summary": self.summary(),
+            "records": [asdict(record) for record in self.records],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def export_csv(self, path):
+        """每条记录导出为一行"""
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([field.name for field in fields(PageLoad)])
+            for record in self.records:
+                writer.writerow(asdict(record).values())
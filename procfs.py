@@ -0,0 +1,29 @@
+import os
+
+
+def rss_bytes(pid):
+    """读取进程的常驻内存(字节)，进程不存在或不支持 /proc 时返回 0"""
+    if not pid:
+        return 0
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def cpu_seconds(pid):
+    """读取进程累计使用的 CPU 时间(用户态 + 内核态，秒)，不可用时返回 None"""
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # 第二个字段是括号中的进程名，其中可能有空格
+    fields = data[data.rfind(")") + 2:].split()
+    try:
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (ValueError, IndexError):
+        return None
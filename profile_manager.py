@@ -0,0 +1,288 @@
+import os
+import time
+from PySide2.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QComboBox, QSpinBox, QLabel,
+                               QPushButton, QMessageBox)
+from PySide2.QtCore import QObject, QStandardPaths, Signal
+from PySide2.QtWebEngineWidgets import QWebEngineProfile
+from adblock import ContentFilter
+from downloads import format_size
+from page_metrics import PageMetrics
+from settings import settings
+from storage import data_path
+from user_scripts import UserScriptManager
+
+CACHE_TYPES = {
+    "disk": QWebEngineProfile.DiskHttpCache,
+    "memory": QWebEngineProfile.MemoryHttpCache,
+}
+
+# 默认的磁盘缓存上限(MB)
+DEFAULT_CACHE_SIZE_MB = 512
+
+# 统计页面资源中有多少来自缓存: transferSize 为 0 且有内容的资源视为缓存命中。
+# 未设置 Timing-Allow-Origin 的跨域资源两项都为 0，不参与统计。
+RESOURCE_TIMING_JS = """
+(function () {
+    var hits = 0, misses = 0, cached = 0, network = 0;
+    var entries = performance.getEntriesByType("navigation").concat(performance.getEntriesByType("resource"));
+    entries.forEach(function (entry) {
+        if (!entry.decodedBodySize) {
+            return;
+        }
+        if (entry.transferSize === 0) {
+            hits++;
+            cached += entry.decodedBodySize;
+        } else {
+            misses++;
+            network += entry.transferSize;
+        }
+    });
+    return [hits, misses, cached, network];
+})();
+"""
+
+
+def cache_files(path):
+    """列出缓存目录中的文件: [(路径, 大小, 最后使用时间), ...]"""
+    files = []
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(root, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            files.append((file_path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+    return files
+
+
+def trim_cache(path, max_bytes=0, older_than=0):
+    """清理缓存目录
+
+    先删除最后使用时间早于 older_than(时间戳)的文件，再按最近最少使用的
+    顺序删除，直到总大小不超过 max_bytes。返回释放的字节数。
+    只能在使用该目录的 profile 创建之前调用。
+    """
+    files = cache_files(path)
+    total = sum(size for _, size, _ in files)
+    freed = 0
+
+    # 按最后使用时间从早到晚，遇到既未过期又不超出上限的文件即可停止
+    files.sort(key=lambda item: item[2])
+    for file_path, size, last_used in files:
+        expired = older_than and last_used < older_than
+        over_budget = max_bytes and total - freed > max_bytes
+        if not expired and not over_budget:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        freed += size
+    return freed
+
+
+class ProfileManager(QObject):
+    """管理 QWebEngineProfile 及其 HTTP 缓存
+
+    每个 profile 使用独立的持久化存储和磁盘缓存目录，缓存类型和大小上限
+    保存在设置中。Chromium 自己会在上限内按 LRU 淘汰缓存；安排了清理
+    或调低了上限时，下次启动会在 profile 创建之前先清理过期或超出上限的缓存文件。
+    """
+
+    stats_changed = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.profiles = {}
+        # 广告和跟踪器拦截，所有 profile 共用
+        self.content_filter = ContentFilter(self)
+        # 页面加载耗时统计，所有窗口共用
+        self.page_metrics = PageMetrics(self.content_filter, self)
+        # 用户脚本和元素隐藏规则，所有 profile 共用
+        self.user_scripts = UserScriptManager(self)
+
+        # 通过 Resource Timing 统计的缓存命中情况
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes_from_cache = 0
+        self.bytes_from_network = 0
+
+    def setting(self, name, key, default):
+        return settings.value(f"profiles/{name}/{key}", default)
+
+    def set_setting(self, name, key, value):
+        settings.set_value(f"profiles/{name}/{key}", value)
+
+    def cache_path(self, name):
+        """profile 的磁盘缓存目录"""
+        base = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+        return os.path.join(base, "profiles", name)
+
+    def profile(self, name="default"):
+        """按名称获取 profile，第一次使用时创建"""
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.create_profile(name)
+            self.profiles[name] = profile
+        return profile
+
+    def create_profile(self, name):
+        cache_path = self.cache_path(name)
+        os.makedirs(cache_path, exist_ok=True)
+
+        # 在 Chromium 打开缓存之前处理上次安排的清理。Chromium 自己会把缓存控制在
+        # 上限以内，所以只有安排了清理或上限比上次启动时调低了，才需要遍历缓存目录
+        size_mb = int(self.setting(name, "cache_size_mb", DEFAULT_CACHE_SIZE_MB))
+        last_size_mb = self.setting(name, "last_cache_size_mb", None)
+        older_than = float(self.setting(name, "clear_older_than", 0))
+        if older_than or (last_size_mb is not None and size_mb < int(last_size_mb)):
+            trim_cache(cache_path, size_mb * 1024 * 1024, older_than)
+        if older_than:
+            self.set_setting(name, "clear_older_than", 0)
+        if last_size_mb is None or int(last_size_mb) != size_mb:
+            self.set_setting(name, "last_cache_size_mb", size_mb)
+
+        profile = QWebEngineProfile(f"SaFan-{name}", self)
+        profile.setPersistentStoragePath(data_path(os.path.join("profiles", name)))
+        profile.setCachePath(cache_path)
+        profile.setHttpCacheType(CACHE_TYPES.get(self.setting(name, "cache_type", "disk"),
+                                                 QWebEngineProfile.DiskHttpCache))
+        profile.setHttpCacheMaximumSize(size_mb * 1024 * 1024)
+        return profile
+
+    def cache_type(self, name="default"):
+        return self.setting(name, "cache_type", "disk")
+
+    def set_cache_type(self, name, cache_type):
+        """选择内存缓存或磁盘缓存"""
+        self.set_setting(name, "cache_type", cache_type)
+        if name in self.profiles:
+            self.profiles[name].setHttpCacheType(CACHE_TYPES[cache_type])
+
+    def cache_size_mb(self, name="default"):
+        return int(self.setting(name, "cache_size_mb", DEFAULT_CACHE_SIZE_MB))
+
+    def set_cache_size_mb(self, name, size_mb):
+        """设置磁盘缓存上限"""
+        self.set_setting(name, "cache_size_mb", size_mb)
+        if name in self.profiles:
+            self.profiles[name].setHttpCacheMaximumSize(size_mb * 1024 * 1024)
+
+    def clear_cache(self, name="default"):
+        """立即清空缓存"""
+        self.profile(name).clearHttpCache()
+
+    def clear_cache_older_than(self, name, days):
+        """安排在下次启动、缓存被打开之前删除超过 days 天未使用的缓存"""
+        self.set_setting(name, "clear_older_than", time.time() - days * 24 * 3600)
+
+    def cache_stats(self, name="default"):
+        """缓存大小与命中率"""
+        files = cache_files(self.cache_path(name))
+        requests = self.cache_hits + self.cache_misses
+        return {
+            "size": sum(size for _, size, _ in files),
+            "files": len(files),
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / requests if requests else 0.0,
+            "bytes_from_cache": self.bytes_from_cache,
+            "bytes_from_network": self.bytes_from_network,
+        }
+
+    def collect_cache_stats(self, browser):
+        """页面加载完成后统计其资源的缓存命中情况"""
+        browser.page().runJavaScript(RESOURCE_TIMING_JS, self.record_resource_timing)
+
+    def record_resource_timing(self, result):
+        if not result:
+            return
+        hits, misses, cached, network = result
+        self.cache_hits += int(hits)
+        self.cache_misses += int(misses)
+        self.bytes_from_cache += int(cached)
+        self.bytes_from_network += int(network)
+        self.stats_changed.emit()
+
+
+class CacheSettings(QWidget):
+    """缓存设置和统计窗口"""
+
+    def __init__(self, profile_manager, name="default", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("缓存设置")
+        self.profile_manager = profile_manager
+        self.name = name
+
+        layout = QVBoxLayout()
+        form = QFormLayout()
+
+        self.type_combo = QComboBox()
+        self.type_combo.addItem("磁盘缓存", "disk")
+        self.type_combo.addItem("仅内存缓存", "memory")
+        self.type_combo.setCurrentIndex(self.type_combo.findData(profile_manager.cache_type(name)))
+        self.type_combo.currentIndexChanged.connect(self.cache_type_changed)
+        form.addRow("缓存类型:", self.type_combo)
+
+        self.size_spin = QSpinBox()
+        self.size_spin.setRange(16, 16384)
+        self.size_spin.setSuffix(" MB")
+        self.size_spin.setValue(profile_manager.cache_size_mb(name))
+        self.size_spin.editingFinished.connect(self.cache_size_changed)
+        form.addRow("缓存上限:", self.size_spin)
+
+        self.stats_label = QLabel()
+        form.addRow("统计:", self.stats_label)
+        layout.addLayout(form)
+
+        # 按钮布局
+        button_layout = QHBoxLayout()
+
+        self.days_spin = QSpinBox()
+        self.days_spin.setRange(1, 365)
+        self.days_spin.setValue(30)
+        self.days_spin.setSuffix(" 天")
+        button_layout.addWidget(self.days_spin)
+
+        self.clear_old_btn = QPushButton("清除更早的缓存")
+        self.clear_old_btn.clicked.connect(self.clear_older)
+        button_layout.addWidget(self.clear_old_btn)
+
+        self.clear_btn = QPushButton("清除全部缓存")
+        self.clear_btn.clicked.connect(self.clear_all)
+        button_layout.addWidget(self.clear_btn)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        profile_manager.stats_changed.connect(self.update_stats)
+
+    def showEvent(self, event):
+        self.update_stats()
+        super().showEvent(event)
+
+    def update_stats(self):
+        if not self.isVisible():
+            return
+        stats = self.profile_manager.cache_stats(self.name)
+        self.stats_label.setText(
+            f"磁盘占用 {format_size(stats['size'])} ({stats['files']} 个文件)\n"
+            f"命中率 {stats['hit_rate']:.0%} ({stats['hits']} / {stats['hits'] + stats['misses']})，"
+            f"缓存提供 {format_size(stats['bytes_from_cache'])}，"
+            f"网络传输 {format_size(stats['bytes_from_network'])}")
+
+    def cache_type_changed(self):
+        self.profile_manager.set_cache_type(self.name, self.type_combo.currentData())
+
+    def cache_size_changed(self):
+        self.profile_manager.set_cache_size_mb(self.name, self.size_spin.value())
+
+    def clear_older(self):
+        days = self.days_spin.value()
+        self.profile_manager.clear_cache_older_than(self.name, days)
+        QMessageBox.information(self, "缓存设置", f"超过 {days} 天未使用的缓存将在下次启动时清除。")
+
+    def clear_all(self):
+        self.profile_manager.clear_cache(self.name)
+        self.update_stats()
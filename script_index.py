@@ -0,0 +1,218 @@
+import os
+import re
+from dataclasses import dataclass, field
+from history_store import url_host
+
+# 索引中匹配所有主机的键
+GENERIC = ""
+
+RUN_AT = ("document-start", "document-end", "document-idle")
+
+# @inject-into 的取值对应的脚本环境
+WORLDS = {"page": "main", "content": "isolated", "auto": "isolated"}
+
+METADATA_BLOCK = re.compile(r"==User(Script|Style)==(.*?)==/User\1==", re.S)
+METADATA_LINE = re.compile(r"^[ \t/*]*@([\w:-]+)(?:[ \t]+(.*?))?[ \t]*$", re.M)
+
+MATCH_PATTERN = re.compile(r"^(\*|https?|file|ftp|wss?)://(\*|\*\.[^/*]+|[^/*]*)(/.*)$")
+INCLUDE_HOST = re.compile(r"^[\w*]+://(\*\.)?([^/*:]+)/")
+
+
+@dataclass
+class UserScript:
+    """一个用户脚本或用户样式"""
+    name: str
+    source: str
+    # js 或 css
+    kind: str = "js"
+    run_at: str = "document-end"
+    # main 或 isolated
+    world: str = "isolated"
+    # [(主机键, 正则), ...]
+    matches: list = field(default_factory=list)
+    excludes: list = field(default_factory=list)
+    path: str = ""
+    id: int = -1
+
+    def applies(self, url):
+        return (any(regex.match(url) for _, regex in self.matches)
+                and not any(regex.match(url) for regex in self.excludes))
+
+
+def glob_regex(text):
+    """* 匹配任意字符，其余按原样匹配"""
+    return ".*".join(re.escape(part) for part in text.split("*"))
+
+
+def host_keys(host):
+    """主机及其各级上级域名，最后是匹配所有主机的键"""
+    while host:
+        yield host
+        _, _, host = host.partition(".")
+    yield GENERIC
+
+
+def match_pattern(pattern):
+    """把 @match 模式转换为 (主机键, 正则)"""
+    if pattern == "<all_urls>":
+        return GENERIC, re.compile(r"^(?:https?|file|ftp)://")
+    match = MATCH_PATTERN.match(pattern)
+    if not match:
+        raise ValueError(f"无效的匹配模式: {pattern}")
+    scheme, host, path = match.groups()
+    scheme_regex = "https?" if scheme == "*" else re.escape(scheme)
+    host = host.lower()
+    if host == "*":
+        key, host_regex = GENERIC, "[^/]*"
+    elif host.startswith("*."):
+        key = host[2:]
+        host_regex = r"(?:[^/]*\.)?" + re.escape(key)
+    else:
+        key, host_regex = host, re.escape(host)
+    return key, re.compile(f"^{scheme_regex}://{host_regex}(?::\\d+)?{glob_regex(path)}$")
+
+
+def include_pattern(pattern):
+    """把 Greasemonkey 的 @include 通配符转换为 (主机键, 正则)，主机中有通配符时放在通用的键下"""
+    if pattern == "*":
+        return GENERIC, re.compile(r"^(?:https?|file|ftp)://")
+    match = INCLUDE_HOST.match(pattern)
+    key = match.group(2).lower() if match else GENERIC
+    return key, re.compile(f"^{glob_regex(pattern)}$")
+
+
+def parse_metadata(text):
+    """返回 (UserScript 或 UserStyle, {键: [值, ...]})，没有元数据块时返回 (None, {})"""
+    match = METADATA_BLOCK.search(text)
+    if not match:
+        return None, {}
+    metadata = {}
+    for key, value in METADATA_LINE.findall(match.group(2)):
+        metadata.setdefault(key.lower(), []).append(value.strip())
+    return "User" + match.group(1), metadata
+
+
+def parse_user_script(path, text):
+    """解析 .user.js 或 .user.css 文件"""
+    block, metadata = parse_metadata(text)
+    if block is None:
+        raise ValueError("没有 ==UserScript== 或 ==UserStyle== 元数据块")
+
+    def first(key, default):
+        values = metadata.get(key)
+        return values[0] if values and values[0] else default
+
+    script = UserScript(first("name", os.path.basename(path)), text, path=path)
+    script.kind = "css" if block == "UserStyle" else "js"
+    script.run_at = first("run-at", "document-start" if script.kind == "css" else "document-end")
+    if script.run_at not in RUN_AT:
+        raise ValueError(f"无效的 @run-at: {script.run_at}")
+    script.world = WORLDS.get(first("inject-into", "auto"), "isolated")
+
+    script.matches = [match_pattern(value) for value in metadata.get("match", [])]
+    script.matches += [include_pattern(value) for value in metadata.get("include", [])]
+    script.excludes = [match_pattern(value)[1] for value in metadata.get("exclude-match", [])]
+    script.excludes += [include_pattern(value)[1] for value in metadata.get("exclude", [])]
+    if not script.matches:
+        raise ValueError("没有 @match 或 @include")
+    return script
+
+
+def parse_cosmetic_rule(line):
+    """解析 "域名,~域名##选择器" 形式的元素隐藏规则，返回 (包含的域名, 排除的域名, 选择器)
+
+    不是元素隐藏规则时返回 None；例外规则(#@#)和扩展语法不支持。
+    """
+    line = line.strip()
+    if not line or line.startswith(("!", "[")) or "##" not in line:
+        return None
+    domains, _, selector = line.partition("##")
+    if "#@" in domains or "#?" in domains or "#$" in domains or not selector.strip():
+        return None
+    included, excluded = [], []
+    for domain in filter(None, (part.strip().lower() for part in domains.split(","))):
+        if domain.startswith("~"):
+            excluded.append(domain[1:])
+        else:
+            included.append(domain)
+    return included, excluded, selector.strip()
+
+
+class ScriptIndex:
+    """按主机索引的用户脚本和元素隐藏规则
+
+    脚本按匹配模式中的主机放入字典，查找时只取页面主机及其各级上级域名
+    对应的脚本，再用完整的匹配模式确认，不需要对每个页面检查全部脚本。
+    主机中有通配符的模式放在通用的键下，对所有页面都要检查。
+    """
+
+    def __init__(self):
+        self.scripts = []
+        # 主机键 -> [脚本编号, ...]
+        self.by_host = {}
+        # 主机键 -> [(选择器, 排除的域名), ...]
+        self.cosmetic = {}
+        # 适用于所有主机、没有排除域名的选择器，不需要逐条检查
+        self.generic_selectors = []
+        self.cosmetic_count = 0
+        # [(文件, 错误), ...]
+        self.errors = []
+
+    def add_script(self, script):
+        script.id = len(self.scripts)
+        self.scripts.append(script)
+        for key in {key for key, _ in script.matches}:
+            self.by_host.setdefault(key, []).append(script.id)
+
+    def add_cosmetic(self, line):
+        rule = parse_cosmetic_rule(line)
+        if rule is None:
+            return False
+        included, excluded, selector = rule
+        self.cosmetic_count += 1
+        if not included and not excluded:
+            self.generic_selectors.append(selector)
+            return True
+        for key in included or [GENERIC]:
+            self.cosmetic.setdefault(key, []).append((selector, tuple(excluded)))
+        return True
+
+    def match(self, url):
+        """适用于网址的脚本，按加载顺序排列"""
+        ids = set()
+        for key in host_keys(url_host(url)):
+            for script_id in self.by_host.get(key, ()):
+                if script_id not in ids and self.scripts[script_id].applies(url):
+                    ids.add(script_id)
+        return [self.scripts[script_id] for script_id in sorted(ids)]
+
+    def selectors(self, host):
+        """主机上要隐藏的元素的选择器，不含 generic_selectors(由所有主机共用)"""
+        selectors = []
+        for key in host_keys(host):
+            for selector, excluded in self.cosmetic.get(key, ()):
+                if not any(host == domain or host.endswith("." + domain) for domain in excluded):
+                    selectors.append(selector)
+        return selectors
+
+
+def load_scripts(directory):
+    """读取目录中的 *.user.js、*.user.css 和元素隐藏规则列表 *.txt，出错的文件记录在 errors 中"""
+    index = ScriptIndex()
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return index
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith((".user.js", ".user.css")):
+                with open(path, encoding="utf-8") as f:
+                    index.add_script(parse_user_script(path, f.read()))
+            elif name.endswith(".txt"):
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        index.add_cosmetic(line)
+        except (OSError, ValueError, re.error) as e:
+            index.errors.append((path, str(e)))
+    return index
@@ -0,0 +1,158 @@
+import re
+import sqlite3
+import time
+from history_store import HistoryStore, url_host
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    host TEXT NOT NULL DEFAULT '',
+    visit_count INTEGER NOT NULL DEFAULT 0,
+    last_visit REAL NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(title, url, body, tokenize='unicode61');
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# 标题、网址、正文在 BM25 中的权重
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0)
+RANK_FUNCTION = "bm25({}, {}, {})".format(*COLUMN_WEIGHTS)
+
+# 中日韩文字没有空格分词，索引和查询时都切成相邻两字的词
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+CJK_RUN = re.compile(f"[{CJK}]+")
+QUERY_PIECE = re.compile(f"([{CJK}]+)|([^{CJK}]+)")
+WORD = re.compile(r"\w+")
+
+
+def bigrams(run):
+    if len(run) < 2:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def index_terms(text):
+    """把文本转换为写入 FTS 表的形式，中日韩文字切成两字词"""
+    return CJK_RUN.sub(lambda m: " " + " ".join(bigrams(m.group())) + " ", text)
+
+
+def match_query(text):
+    """把用户输入转换为 FTS5 查询，所有词都必须出现；没有可搜索的词时返回空字符串"""
+    terms = []
+    for cjk, other in QUERY_PIECE.findall(text):
+        if cjk and len(cjk) == 1:
+            terms.append(f'"{cjk}"*')
+        elif cjk:
+            terms.append('"' + " ".join(bigrams(cjk)) + '"')
+        else:
+            # 最后输入的词可能还没写完，所有普通词都按前缀匹配
+            terms.extend(f'"{word}"*' for word in WORD.findall(other))
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """历史记录的全文索引
+
+    每个网址一行，索引标题、网址和页面文本(可选)，查询按 BM25 排序并分页。
+    写入不会自动提交，由调用者批量调用 commit()。一个实例只能在
+    创建它的线程中使用。
+    """
+
+    def __init__(self, path, text_limit=8000):
+        self.path = path
+        self.text_limit = text_limit
+
+        self.conn = sqlite3.connect(path, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def _write_document(self, page_id, title, url, body=None):
+        """重写某一页的索引行，body 为 None 时保留已有的页面文本"""
+        if body is None:
+            row = self.conn.execute("SELECT body FROM pages_fts WHERE rowid = ?", (page_id,)).fetchone()
+            body = row[0] if row else ""
+        else:
+            body = index_terms(body[:self.text_limit])
+        self.conn.execute("DELETE FROM pages_fts WHERE rowid = ?", (page_id,))
+        self.conn.execute("INSERT INTO pages_fts (rowid, title, url, body) VALUES (?, ?, ?, ?)",
+                          (page_id, index_terms(title), url, body))
+
+    def add_visit(self, url, title="", visited_at=None, count=1):
+        """记录一次访问，标题变化时更新索引"""
+        if visited_at is None:
+            visited_at = time.time()
+        row = self.conn.execute("SELECT id, title FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            page_id = self.conn.execute(
+                "INSERT INTO pages (url, title, host, visit_count, last_visit) VALUES (?, ?, ?, ?, ?)",
+                (url, title or "", url_host(url), count, visited_at)).lastrowid
+            self._write_document(page_id, title or "", url, "")
+            return
+
+        page_id, old_title = row
+        title = title or old_title
+        self.conn.execute(
+            "UPDATE pages SET title = ?, visit_count = visit_count + ?, last_visit = MAX(last_visit, ?) WHERE id = ?",
+            (title, count, visited_at, page_id))
+        if title != old_title:
+            self._write_document(page_id, title, url)
+
+    def set_text(self, url, text):
+        """更新页面文本，网址还没有访问记录时不索引"""
+        row = self.conn.execute("SELECT id, title FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            self._write_document(row[0], row[1], url, text)
+
+    def import_history(self, history_path):
+        """从历史记录数据库导入全部访问记录，只在索引建立时执行一次"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'history_imported'").fetchone():
+            return
+        history = HistoryStore(history_path, read_only=True)
+        for url, title, count, visited_at in history.url_stats():
+            self.add_visit(url, title, visited_at, count)
+        history.close()
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('history_imported', '1')")
+        self.commit()
+
+    def search(self, text, offset=0, limit=50):
+        """按相关度返回一页结果: [(id, last_visit, url, title), ...]
+
+        所有匹配的页面都参与 BM25 排序，相关度相同时较新的在前。
+        """
+        query = match_query(text)
+        if not query:
+            return []
+        return self.conn.execute(
+            "SELECT pages.id, pages.last_visit, pages.url, pages.title FROM pages_fts "
+            "JOIN pages ON pages.id = pages_fts.rowid "
+            "WHERE pages_fts MATCH ? AND pages_fts.rank MATCH ? "
+            "ORDER BY pages_fts.rank, pages.last_visit DESC LIMIT ? OFFSET ?",
+            (query, RANK_FUNCTION, limit, offset)).fetchall()
+
+    def count(self):
+        """已索引的网址数"""
+        return self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def clear(self):
+        """删除全部索引，之后不再从历史记录导入"""
+        self.conn.execute("DELETE FROM pages")
+        self.conn.execute("DELETE FROM pages_fts")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('history_imported', '1')")
+        self.commit()
+
+    def commit(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+
+    def close(self):
+        """提交并关闭数据库"""
+        self.commit()
+        self.conn.close()
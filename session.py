@@ -0,0 +1,159 @@
+import json
+from PySide2.QtCore import QObject, QTimer, QSaveFile, QIODevice, QByteArray, QUrl
+from tab_widget import PlaceholderTab, serialize_history
+
+SESSION_VERSION = 1
+
+
+def tab_snapshot(widget):
+    """标签页的会话数据"""
+    if isinstance(widget, PlaceholderTab):
+        return {
+            "url": widget.url.toString(),
+            "title": widget.title,
+            "zoom": widget.state.get("zoom", 1.0),
+            "history": widget.state.get("history"),
+        }
+
+    return {
+        "url": widget.url().toString(),
+        "title": widget.title(),
+        "zoom": widget.zoomFactor(),
+        "history": serialize_history(widget),
+    }
+
+
+class SessionManager(QObject):
+    """会话快照
+
+    记录所有窗口的标签页，变化后延迟合并写入；只重新序列化发生变化的
+    标签页，其余标签页沿用上次的 JSON 片段。文件通过 QSaveFile
+    先写临时文件再改名，崩溃时不会留下写了一半的会话。
+    """
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.windows = []
+
+        # tab_id -> 该标签页上次序列化的 JSON 片段
+        self.tab_cache = {}
+        self.dirty_tabs = set()
+
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(1000)
+        self.save_timer.timeout.connect(self.save)
+
+    def add_window(self, window):
+        """开始记录某个窗口"""
+        self.windows.append(window)
+        tab_widget = window.tab_widget
+        tab_widget.tab_updated.connect(self.mark_tab_dirty)
+        tab_widget.tabs_changed.connect(self.schedule_save)
+        self.schedule_save()
+
+    def window_closed(self, window):
+        """窗口关闭时停止记录，最后一个窗口保留在会话中以便下次恢复"""
+        if window not in self.windows:
+            return
+        if len(self.windows) > 1:
+            self.windows.remove(window)
+            self.schedule_save()
+        else:
+            self.save()
+
+    def mark_tab_dirty(self, widget):
+        """标记标签页需要重新序列化"""
+        self.dirty_tabs.add(widget.tab_id)
+        self.schedule_save()
+
+    def schedule_save(self):
+        """合并短时间内的多次变化，只写一次"""
+        if not self.save_timer.isActive():
+            self.save_timer.start()
+
+    def tab_fragment(self, widget):
+        """返回标签页的 JSON 片段，未变化时直接使用缓存"""
+        tab_id = widget.tab_id
+        if tab_id in self.dirty_tabs or tab_id not in self.tab_cache:
+            self.tab_cache[tab_id] = json.dumps(tab_snapshot(widget), ensure_ascii=False)
+        return self.tab_cache[tab_id]
+
+    def snapshot(self):
+        """生成整个会话的 JSON 文本"""
+        live_ids = set()
+        windows = []
+        for window in self.windows:
+            tab_widget = window.tab_widget
+            fragments = []
+            for index in range(tab_widget.count()):
+                widget = tab_widget.widget(index)
+                live_ids.add(widget.tab_id)
+                fragments.append(self.tab_fragment(widget))
+
+            geometry = bytes(window.saveGeometry().toBase64()).decode()
+            windows.append('{"geometry": %s, "current": %d, "tabs": [%s]}' % (
+                json.dumps(geometry), tab_widget.currentIndex(), ", ".join(fragments)))
+
+        # 清理已关闭标签页的缓存
+        for tab_id in set(self.tab_cache) - live_ids:
+            del self.tab_cache[tab_id]
+        self.dirty_tabs.clear()
+
+        return '{"version": %d, "windows": [%s]}' % (SESSION_VERSION, ", ".join(windows))
+
+    def save(self):
+        """原子地写入会话文件"""
+        self.save_timer.stop()
+        data = self.snapshot().encode("utf-8")
+
+        save_file = QSaveFile(self.path)
+        if not save_file.open(QIODevice.WriteOnly):
+            return False
+        save_file.write(QByteArray(data))
+        return save_file.commit()
+
+    def load(self):
+        """读取会话文件，不存在或损坏时返回 None"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if session.get("version") != SESSION_VERSION:
+            return None
+        return session
+
+    def restore(self, create_window):
+        """恢复上次的会话，所有标签页先以占位标签页打开
+
+        create_window 用于创建一个不带初始标签页的空窗口。
+        没有可恢复的会话时返回 False。
+        """
+        session = self.load()
+        if not session or not any(window["tabs"] for window in session["windows"]):
+            return False
+
+        for window_data in session["windows"]:
+            if not window_data["tabs"]:
+                continue
+
+            window = create_window()
+            window.restoreGeometry(QByteArray.fromBase64(window_data["geometry"].encode()))
+            tab_widget = window.tab_widget
+
+            # 批量添加时不触发切换，避免第一个标签页被立即加载
+            tab_widget.blockSignals(True)
+            for tab in window_data["tabs"]:
+                state = {"zoom": tab.get("zoom", 1.0), "history": tab.get("history")}
+                tab_widget.add_new_tab(QUrl(tab["url"]), tab["title"] or tab["url"], lazy=True, state=state)
+            current = min(max(window_data.get("current", 0), 0), tab_widget.count() - 1)
+            tab_widget.setCurrentIndex(current)
+            tab_widget.blockSignals(False)
+            tab_widget.currentChanged.emit(current)
+
+            window.show()
+
+        self.schedule_save()
+        return True
@@ -0,0 +1,89 @@
+from PySide2.QtCore import QObject, QSettings, QByteArray, Signal
+from settings_store import SettingsStore, to_bool, to_list, to_number
+from storage import data_path
+
+
+def plain(value):
+    """把 QSettings 读出的值转换为可以写入 JSON 的值，无法转换时返回 None"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): plain(item) for key, item in value.items()}
+    if isinstance(value, QByteArray):
+        return bytes(value).decode("utf-8", "replace")
+    return None
+
+
+def migrate_qsettings(values):
+    """版本 0 -> 1: 复制旧版 QSettings 中的全部设置
+
+    旧版的历史记录保存在另一个文件 QSettings("", "Browser") 中，一并复制；
+    旧文件保持不变。
+    """
+    for legacy in (QSettings("", "Browser"), QSettings("SaFan", "Browser")):
+        for key in legacy.allKeys():
+            value = plain(legacy.value(key))
+            if value is not None and key not in values:
+                values[key] = value
+
+
+MIGRATIONS = [migrate_qsettings]
+
+
+class Settings(QObject):
+    """全部设置的唯一入口
+
+    设置保存在数据目录的 settings.json 中，第一次访问时读取一次，之后的
+    读取只访问内存；修改在后台线程中合并写入，并通过 changed(键, 值)
+    通知，删除时值为 None。
+    """
+
+    changed = Signal(str, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._store = None
+
+    @property
+    def store(self):
+        # 数据目录取决于应用名，第一次使用时才打开
+        if self._store is None:
+            self._store = SettingsStore(data_path("settings.json"), MIGRATIONS)
+        return self._store
+
+    def value(self, key, default=None):
+        return self.store.get(key, default)
+
+    def bool_value(self, key, default=False):
+        return to_bool(self.store.get(key), default)
+
+    def int_value(self, key, default=0):
+        return to_number(self.store.get(key, default), int, default)
+
+    def float_value(self, key, default=0.0):
+        return to_number(self.store.get(key, default), float, default)
+
+    def list_value(self, key, default=None):
+        return to_list(self.store.get(key), default)
+
+    def contains(self, key):
+        return self.store.contains(key)
+
+    def set_value(self, key, value):
+        if self.store.set(key, value):
+            self.changed.emit(key, value)
+
+    def remove(self, key):
+        if self.store.remove(key):
+            self.changed.emit(key, None)
+
+    def flush(self):
+        """立即写入尚未保存的修改，退出前调用"""
+        if self._store is not None:
+            self._store.flush()
+
+
+# 全局实例
+settings = Settings()
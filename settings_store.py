@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+
+# 设置文件的格式版本，每次需要迁移时加一
+SCHEMA_VERSION = 1
+
+# 修改后合并这么久再写入(秒)
+SYNC_DELAY = 1.0
+
+TRUE_STRINGS = {"true", "1", "yes", "on"}
+FALSE_STRINGS = {"false", "0", "no", "off", ""}
+
+
+def to_bool(value, default=False):
+    """兼容旧设置中以字符串保存的布尔值"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in TRUE_STRINGS:
+            return True
+        if text in FALSE_STRINGS:
+            return False
+    return default
+
+
+def to_number(value, cast, default):
+    """cast 为 int 或 float，兼容以字符串保存的数字"""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        try:
+            return cast(float(value))
+        except (TypeError, ValueError):
+            return default
+
+
+def to_list(value, default=None):
+    """单个值视为只有一项的列表"""
+    if value is None:
+        return list(default or [])
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class SettingsStore:
+    """设置的内存缓存和 JSON 文件
+
+    启动时读取一次文件，之后的读取只访问内存中的字典。修改后由后台线程
+    在 delay 秒内合并，整体写入临时文件再改名，崩溃时不会留下写了一半的
+    文件。文件中记录格式版本，版本较旧时依次执行 migrations[版本]
+    (values)，迁移完成后立即写入。
+    """
+
+    def __init__(self, path, migrations=(), delay=SYNC_DELAY):
+        self.path = path
+        self.delay = delay
+        self.values = {}
+        self.version = 0
+
+        self.condition = threading.Condition()
+        # 每次修改加一；written 为已写入文件的版本
+        self.generation = 0
+        self.written = 0
+        self.write_count = 0
+        self.dirty_since = None
+        self.write_lock = threading.Lock()
+        self.closing = False
+
+        self.load()
+        self.migrate(migrations)
+
+        self.thread = threading.Thread(target=self._run, name="settings sync", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            # 文件损坏时保留一份，重新开始
+            os.replace(self.path, self.path + ".corrupt")
+            return
+        self.values = dict(data.get("values") or {})
+        self.version = int(data.get("version", 0))
+
+    def migrate(self, migrations):
+        if self.version >= SCHEMA_VERSION:
+            return
+        for version in range(self.version, SCHEMA_VERSION):
+            if version < len(migrations):
+                migrations[version](self.values)
+        self.version = SCHEMA_VERSION
+        self.generation += 1
+        self.flush()
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def contains(self, key):
+        return key in self.values
+
+    def keys(self, prefix=""):
+        return [key for key in self.values if key.startswith(prefix)]
+
+    def set(self, key, value):
+        """修改一项设置，值没有变化时返回 False"""
+        if key in self.values and self.values[key] == value:
+            return False
+        with self.condition:
+            self.values[key] = value
+            self._changed()
+        return True
+
+    def remove(self, key):
+        """删除一项设置，不存在时返回 False
+
+        只删除这一个键: 旧版的 "history" 列表和 "history/..." 设置同时存在。
+        """
+        if key not in self.values:
+            return False
+        with self.condition:
+            del self.values[key]
+            self._changed()
+        return True
+
+    def _changed(self):
+        self.generation += 1
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+        self.condition.notify()
+
+    def _snapshot(self):
+        """在持有 condition 时序列化当前内容"""
+        self.dirty_since = None
+        data = json.dumps({"version": self.version, "values": self.values}, ensure_ascii=False, indent=1)
+        return self.generation, data
+
+    def _write(self, generation, data):
+        with self.write_lock:
+            # 另一个线程已经写入了更新的内容
+            if generation <= self.written:
+                return
+            temp = self.path + ".tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+            self.written = generation
+            self.write_count += 1
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.dirty_since is None and not self.closing:
+                    self.condition.wait()
+                if self.closing:
+                    return
+                # 合并 delay 秒内的修改
+                remaining = self.dirty_since + self.delay - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                generation, data = self._snapshot()
+            try:
+                self._write(generation, data)
+            except OSError:
+                pass
+
+    def flush(self):
+        """立即写入尚未保存的修改"""
+        with self.condition:
+            if self.generation <= self.written:
+                return
+            generation, data = self._snapshot()
+        self._write(generation, data)
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
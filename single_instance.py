@@ -0,0 +1,111 @@
+import hashlib
+import json
+from PySide2.QtCore import QObject, QStandardPaths
+from PySide2.QtNetwork import QAbstractSocket, QLocalServer, QLocalSocket
+
+# 连接和等待回复的超时(毫秒)
+TIMEOUT_MS = 2000
+
+# 监听失败时确认已有实例是否还在运行的连接超时(毫秒)
+PROBE_TIMEOUT_MS = 200
+
+
+def server_name():
+    """本地套接字的名称，按数据目录区分，不同用户和隔离的数据目录互不干扰
+
+    调用前必须已经设置好组织名和应用名。
+    """
+    base = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+    return "safan-" + hashlib.sha1(base.encode("utf-8")).hexdigest()[:16]
+
+
+def send_command(command, name=None, timeout=TIMEOUT_MS):
+    """把命令发给正在运行的实例并等待回复
+
+    没有正在运行的实例时返回 None。不需要事件循环，可以在创建
+    QApplication 之前调用。
+    """
+    socket = QLocalSocket()
+    socket.connectToServer(name or server_name())
+    if not socket.waitForConnected(timeout):
+        return None
+
+    socket.write(json.dumps(command, ensure_ascii=False).encode("utf-8") + b"\n")
+    socket.waitForBytesWritten(timeout)
+
+    data = b""
+    while not data.endswith(b"\n") and socket.waitForReadyRead(timeout):
+        data += bytes(socket.readAll())
+    socket.disconnectFromServer()
+
+    try:
+        return json.loads(data.decode("utf-8"))
+    except ValueError:
+        return {"ok": False, "error": "正在运行的实例没有回复"}
+
+
+class InstanceServer(QObject):
+    """接收其他进程发来的命令
+
+    协议为每行一个 JSON 对象，每条命令交给 handler(command) 处理，
+    返回的字典作为一行 JSON 回复。同一连接可以连续发送多条命令。
+    """
+
+    def __init__(self, handler, parent=None):
+        super().__init__(parent)
+        self.handler = handler
+        self.server = QLocalServer(self)
+        # 只允许当前用户连接
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.new_connection)
+
+    def listen(self, name=None):
+        """开始监听，失败时返回 False
+
+        名称已被占用时先尝试连接: 能连上说明另一个实例正在运行(可能刚刚
+        启动)，不能删除它的套接字；连不上才是上次异常退出留下的套接字文件。
+        """
+        name = name or server_name()
+        if self.server.listen(name):
+            return True
+        if self.server.serverError() != QAbstractSocket.AddressInUseError:
+            return False
+        probe = QLocalSocket()
+        probe.connectToServer(name)
+        if probe.waitForConnected(PROBE_TIMEOUT_MS):
+            probe.disconnectFromServer()
+            return False
+        QLocalServer.removeServer(name)
+        return self.server.listen(name)
+
+    def close(self):
+        self.server.close()
+
+    def new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self.read_commands(socket))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def read_commands(self, socket):
+        """处理已经收到的完整命令行，不完整的行留在缓冲区中"""
+        while socket.canReadLine():
+            line = bytes(socket.readLine()).strip()
+            if not line:
+                continue
+            try:
+                command = json.loads(line.decode("utf-8"))
+            except ValueError:
+                reply = {"ok": False, "error": "无效的 JSON"}
+            else:
+                reply = self.execute(command)
+            socket.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def execute(self, command):
+        if not isinstance(command, dict):
+            return {"ok": False, "error": "命令必须是 JSON 对象"}
+        try:
+            return self.handler(command)
+        except Exception as e:
+            # 不让一条错误的命令中断服务器
+            return {"ok": False, "error": str(e)}
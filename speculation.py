@@ -0,0 +1,211 @@
+import time
+from PySide2.QtCore import QObject, QTimer, QUrl
+from PySide2.QtWebEngineWidgets import QWebEnginePage
+from procfs import rss_bytes
+from settings import settings
+
+# 停止输入多久之后才预测(毫秒)
+PREDICT_DELAY_MS = 120
+
+# 预渲染的页面多久没有用上就丢弃(毫秒)
+PRERENDER_TTL_MS = 30 * 1000
+
+# 同一来源多久之内不重复预连接(秒)
+PRECONNECT_INTERVAL = 10
+
+# 记录的预连接来源超过这个数时清理过期的
+MAX_PRECONNECTED = 64
+
+# 参与计算置信度的候选数
+CANDIDATES = 5
+
+
+def same_page(a, b):
+    """忽略片段和末尾斜杠后比较两个地址"""
+    a = a.adjusted(QUrl.RemoveFragment | QUrl.StripTrailingSlash)
+    b = b.adjusted(QUrl.RemoveFragment | QUrl.StripTrailingSlash)
+    return a == b
+
+
+class Prerender:
+    """一个在屏幕外加载的浏览器部件，以及创建它的标签页部件"""
+
+    def __init__(self, browser, tab_widget, url):
+        self.browser = browser
+        self.tab_widget = tab_widget
+        self.url = url
+        self.started = time.monotonic()
+        self.loaded = False
+        self.ok = False
+        # 开始预渲染时各标签页渲染进程的内存，预渲染和标签页共用进程时只计算增加的部分
+        self.tab_rss = {}
+
+
+class Speculator(QObject):
+    """预测下一次导航并提前准备
+
+    在地址栏输入时从 frecency 索引取得最可能的网址：置信度达到
+    preconnect_threshold 时通过一个隐藏页面预连接并预取该网址，达到
+    prerender_threshold 时在屏幕外的浏览器部件中完整加载。悬停在书签
+    或历史记录上时只预连接。同一时间最多一个预渲染，占用内存超过上限、
+    渲染进程崩溃、超时没有用上或被新的预测取代时丢弃。tab_pids() 返回
+    所有标签页的渲染进程，用于区分预渲染自己占用的内存。
+    """
+
+    def __init__(self, profile, omnibox_index, tab_pids=None, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.omnibox_index = omnibox_index
+        self.tab_pids = tab_pids or set
+
+        self.enabled = settings.bool_value("speculation/enabled", True)
+        self.preconnect_threshold = settings.float_value("speculation/preconnect_threshold", 0.3)
+        self.prerender_threshold = settings.float_value("speculation/prerender_threshold", 0.6)
+        self.prerender_limit = settings.int_value("speculation/prerender_memory_mb", 300) * 1024 * 1024
+
+        # 预连接和预取用的隐藏页面，第一次使用时创建
+        self.warmer = None
+        self.preconnected = {}
+        self.prerender = None
+
+        self.stats = {
+            "predictions": 0,
+            "preconnects": 0,
+            "prefetches": 0,
+            "prerenders": 0,
+            "hits": 0,
+            "wasted": 0,
+            "over_memory": 0,
+            "crashed": 0,
+        }
+
+        # 等待预测的 (输入, 标签页部件)
+        self.pending = None
+        self.predict_timer = QTimer(self)
+        self.predict_timer.setSingleShot(True)
+        self.predict_timer.setInterval(PREDICT_DELAY_MS)
+        self.predict_timer.timeout.connect(self.predict)
+
+        # 预渲染期间检查内存和过期
+        self.check_timer = QTimer(self)
+        self.check_timer.setInterval(1000)
+        self.check_timer.timeout.connect(self.check_prerender)
+
+    def text_edited(self, text, tab_widget):
+        """地址栏的输入变化，停止输入后再预测"""
+        if not self.enabled:
+            return
+        self.pending = (text, tab_widget)
+        self.predict_timer.start()
+
+    def predict(self):
+        text, tab_widget = self.pending
+        self.pending = None
+        entries = self.omnibox_index.query(text, CANDIDATES)
+        if not entries:
+            return
+
+        # 置信度: 第一个候选的得分占全部候选得分的比例
+        now = time.time()
+        scores = [entry.score(now) for entry in entries]
+        confidence = scores[0] / sum(scores)
+        url = QUrl(entries[0].url)
+        self.stats["predictions"] += 1
+
+        if confidence >= self.prerender_threshold:
+            self.start_prerender(url, tab_widget)
+        elif confidence >= self.preconnect_threshold:
+            self.warm(url, prefetch=True)
+
+    def url_hovered(self, url):
+        """鼠标悬停在书签或历史记录上"""
+        if self.enabled:
+            self.warm(QUrl(url))
+
+    def warm(self, url, prefetch=False):
+        """预连接目标网站，prefetch 为 True 时同时把页面取到缓存中"""
+        if url.scheme() not in ("http", "https"):
+            return
+        origin = url.adjusted(QUrl.RemovePath | QUrl.RemoveQuery | QUrl.RemoveFragment).toString(QUrl.FullyEncoded)
+        now = time.monotonic()
+        if not prefetch and now - self.preconnected.get(origin, 0) < PRECONNECT_INTERVAL:
+            return
+        self.preconnected[origin] = now
+        if len(self.preconnected) > MAX_PRECONNECTED:
+            self.preconnected = {key: at for key, at in self.preconnected.items()
+                                 if now - at < PRECONNECT_INTERVAL}
+
+        if self.warmer is None:
+            self.warmer = QWebEnginePage(self.profile, self)
+        links = f'<link rel="preconnect" href="{origin}"><link rel="dns-prefetch" href="{origin}">'
+        if prefetch:
+            links += f'<link rel="prefetch" href="{url.toString(QUrl.FullyEncoded)}">'
+            self.stats["prefetches"] += 1
+        self.stats["preconnects"] += 1
+        self.warmer.setHtml(f"<!DOCTYPE html><html><head>{links}</head></html>")
+
+    def start_prerender(self, url, tab_widget):
+        """在屏幕外加载页面，已有同一页面的预渲染时保留"""
+        if url.scheme() not in ("http", "https"):
+            return
+        if self.prerender is not None:
+            if same_page(self.prerender.url, url) and self.prerender.tab_widget is tab_widget:
+                return
+            self.discard()
+
+        browser = tab_widget.create_browser(url, speculative=True)
+        prerender = Prerender(browser, tab_widget, url)
+        prerender.tab_rss = {pid: rss_bytes(pid) for pid in self.tab_pids() if pid}
+        browser.loadFinished.connect(lambda ok: self.prerender_loaded(prerender, ok))
+        browser.page().renderProcessTerminated.connect(
+            lambda status, exit_code: self.prerender_crashed(prerender))
+        self.prerender = prerender
+        self.stats["prerenders"] += 1
+        self.check_timer.start()
+
+    def prerender_loaded(self, prerender, ok):
+        prerender.loaded = True
+        prerender.ok = ok
+
+    def prerender_crashed(self, prerender):
+        if prerender is self.prerender:
+            self.stats["crashed"] += 1
+            self.discard()
+
+    def take(self, url, tab_widget, usable=True):
+        """提交导航时调用，返回匹配的预渲染页面
+
+        不匹配或 usable 为 False 时丢弃该标签页部件的预渲染并返回 None。
+        """
+        prerender = self.prerender
+        if prerender is None or prerender.tab_widget is not tab_widget:
+            return None
+        if not usable or not same_page(prerender.url, url):
+            self.discard()
+            return None
+        self.prerender = None
+        self.check_timer.stop()
+        self.stats["hits"] += 1
+        return prerender
+
+    def discard(self):
+        """丢弃没有用上的预渲染页面"""
+        if self.prerender is None:
+            return
+        self.prerender.browser.deleteLater()
+        self.prerender = None
+        self.check_timer.stop()
+        self.stats["wasted"] += 1
+
+    def check_prerender(self):
+        prerender = self.prerender
+        if prerender is None:
+            self.check_timer.stop()
+            return
+        if (time.monotonic() - prerender.started) * 1000 > PRERENDER_TTL_MS:
+            self.discard()
+            return
+        pid = prerender.browser.page().renderProcessPid()
+        if self.prerender_limit and rss_bytes(pid) - prerender.tab_rss.get(pid, 0) > self.prerender_limit:
+            self.stats["over_memory"] += 1
+            self.discard()
@@ -0,0 +1,41 @@
+import time
+
+# 冷启动目标: 从导入主模块到首次绘制完成
+STARTUP_TARGET_MS = 800
+
+
+class StartupProfiler:
+    """记录启动过程中各阶段的耗时"""
+
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, name):
+        """结束一个阶段并记录其耗时"""
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000))
+        self.last = now
+
+    def total_ms(self):
+        """从开始到最后一个阶段的总耗时"""
+        return (self.last - self.start) * 1000
+
+    def report(self):
+        """打印各阶段耗时"""
+        if not self.enabled:
+            return
+        width = max((len(name) for name, _ in self.phases), default=0)
+        print("启动耗时:")
+        for name, elapsed in self.phases:
+            print(f"  {name:<{width}}  {elapsed:8.1f} ms")
+        total = self.total_ms()
+        status = "达标" if total <= STARTUP_TARGET_MS else "超出目标"
+        print(f"  {'总计':<{width}}  {total:8.1f} ms  (目标 {STARTUP_TARGET_MS} ms, {status})")
+        self.enabled = False
+
+
+# 全局实例，在 main 中通过 --profile-startup 启用
+startup = StartupProfiler()
@@ -0,0 +1,9 @@
+import os
+from PySide2.QtCore import QStandardPaths
+
+
+def data_path(name):
+    """返回应用数据目录下某个文件的完整路径"""
+    base = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, name)
@@ -0,0 +1,177 @@
+import time
+from PySide2.QtCore import QObject, QTimer, Signal
+from PySide2.QtWebEngineWidgets import QWebEnginePage, QWebEngineView
+from procfs import rss_bytes
+
+ACTIVE = QWebEnginePage.LifecycleState.Active
+FROZEN = QWebEnginePage.LifecycleState.Frozen
+DISCARDED = QWebEnginePage.LifecycleState.Discarded
+
+
+class TabLifecycleManager(QObject):
+    """后台标签页生命周期管理
+
+    不活动的标签页先冻结(停止 JS 和定时器)，空闲更久或渲染进程内存
+    超出预算时再丢弃(释放渲染进程资源)，切换回来时透明地恢复。
+    """
+
+    # 累计回收的内存(字节)
+    memory_reclaimed = Signal(int)
+
+    def __init__(self, tab_widget, freeze_after=5 * 60, discard_after=30 * 60, memory_budget=0, parent=None):
+        super().__init__(parent)
+        self.tab_widget = tab_widget
+        self.freeze_after = freeze_after
+        self.discard_after = discard_after
+        # 渲染进程内存预算(字节)，0 表示不限制
+        self.memory_budget = memory_budget
+
+        self.last_active = {}
+        self.scroll_positions = {}
+        self.reclaimed_bytes = 0
+        self.frozen_count = 0
+        self.discarded_count = 0
+
+        self.current = tab_widget.currentWidget()
+        tab_widget.currentChanged.connect(self.tab_activated)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(15000)
+        self.timer.timeout.connect(self.check_tabs)
+        self.timer.start()
+
+    def views(self):
+        """所有标签页中的浏览器部件"""
+        for index in range(self.tab_widget.count()):
+            widget = self.tab_widget.widget(index)
+            if isinstance(widget, QWebEngineView):
+                yield widget
+
+    def tab_activated(self, index):
+        """切换标签页时记录上一个标签页的活动时间并恢复新标签页"""
+        now = time.monotonic()
+        if self.current is not None:
+            self.last_active[self.current] = now
+
+        self.current = self.tab_widget.widget(index)
+        if isinstance(self.current, QWebEngineView):
+            self.last_active[self.current] = now
+            self.restore(self.current)
+
+    def restore(self, view):
+        """把冻结或丢弃的标签页恢复为活动状态"""
+        page = view.page()
+        state = page.lifecycleState()
+        if state == ACTIVE:
+            return
+
+        position = self.scroll_positions.pop(view, None)
+        if state == DISCARDED and position is not None:
+            # 丢弃的页面会重新加载，加载完成后恢复滚动位置
+            def restore_scroll(ok):
+                page.loadFinished.disconnect(restore_scroll)
+                if ok:
+                    page.runJavaScript(f"window.scrollTo({position.x()}, {position.y()});")
+            page.loadFinished.connect(restore_scroll)
+
+        page.setLifecycleState(ACTIVE)
+
+    def freeze(self, view):
+        """冻结标签页"""
+        page = view.page()
+        if page.lifecycleState() != ACTIVE or page.recentlyAudible():
+            return False
+
+        self.scroll_positions[view] = page.scrollPosition()
+        page.setLifecycleState(FROZEN)
+        self.frozen_count += 1
+        return True
+
+    def discard(self, view):
+        """丢弃标签页，只保留 URL、标题和滚动位置"""
+        page = view.page()
+        state = page.lifecycleState()
+        if state == DISCARDED or view is self.tab_widget.currentWidget():
+            return False
+        if state == ACTIVE and not self.freeze(view):
+            return False
+
+        pid = page.renderProcessPid()
+        before = rss_bytes(pid)
+        page.setLifecycleState(DISCARDED)
+        self.discarded_count += 1
+
+        # 渲染进程释放内存需要一点时间，稍后再统计
+        QTimer.singleShot(2000, lambda: self.measure_reclaimed(pid, before))
+        return True
+
+    def measure_reclaimed(self, pid, before):
+        """统计丢弃标签页后渲染进程释放的内存"""
+        reclaimed = before - rss_bytes(pid)
+        if reclaimed > 0:
+            self.reclaimed_bytes += reclaimed
+            self.memory_reclaimed.emit(self.reclaimed_bytes)
+
+    def live_memory(self):
+        """所有未丢弃标签页的渲染进程内存总和"""
+        pids = {view.page().renderProcessPid() for view in self.views()
+                if view.page().lifecycleState() != DISCARDED}
+        return sum(rss_bytes(pid) for pid in pids)
+
+    def check_tabs(self):
+        """定时检查空闲的后台标签页"""
+        now = time.monotonic()
+        current = self.tab_widget.currentWidget()
+        views = list(self.views())
+
+        # 清理已关闭的标签页
+        for view in list(self.last_active):
+            if view not in views:
+                self.last_active.pop(view, None)
+                self.scroll_positions.pop(view, None)
+
+        for view in views:
+            if view is current:
+                continue
+            idle = now - self.last_active.setdefault(view, now)
+            state = view.page().lifecycleState()
+            if idle >= self.discard_after and state != DISCARDED:
+                self.discard(view)
+            elif idle >= self.freeze_after and state == ACTIVE:
+                self.freeze(view)
+
+        if self.memory_budget:
+            self.enforce_budget(views, current)
+
+    def enforce_budget(self, views, current):
+        """超出内存预算时按最近最少使用的顺序丢弃后台标签页
+
+        每个渲染进程的内存只读取一次；多个标签页共用一个渲染进程时，
+        只有其中最后一个未丢弃的标签页被丢弃后才扣除这个进程的内存。
+        """
+        live_views = {}
+        for view in views:
+            if view.page().lifecycleState() != DISCARDED:
+                live_views.setdefault(view.page().renderProcessPid(), set()).add(view)
+        rss = {pid: rss_bytes(pid) for pid in live_views}
+        live = sum(rss.values())
+
+        candidates = sorted((view for view in views
+                             if view is not current and view.page().lifecycleState() != DISCARDED),
+                            key=lambda view: self.last_active.get(view, 0))
+        for view in candidates:
+            if live <= self.memory_budget:
+                break
+            pid = view.page().renderProcessPid()
+            if self.discard(view):
+                live_views[pid].discard(view)
+                if not live_views[pid]:
+                    live -= rss[pid]
+
+    def report(self):
+        """生命周期统计信息"""
+        return {
+            "frozen": self.frozen_count,
+            "discarded": self.discarded_count,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
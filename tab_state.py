@@ -0,0 +1,73 @@
+from PySide2.QtCore import QObject, QTimer, QUrl
+from PySide2.QtGui import QIcon
+
+# 界面最多每帧刷新一次(毫秒)
+FRAME_MS = 16
+
+
+class TabState:
+    """标签页的显示状态
+
+    由标签页自己的信号更新，后台标签页只修改这里的字段，不触发界面刷新。
+    """
+
+    def __init__(self, url=None, title=""):
+        self.url = url or QUrl()
+        self.title = title
+        self.progress = 100
+        self.loading = False
+        self.icon = QIcon()
+        # 最近一次加载的耗时(毫秒)
+        self.load_time_ms = None
+        # 渲染进程异常退出后尚未重新加载
+        self.crashed = False
+        self.crash_count = 0
+        # 最近几次崩溃的时间，用于限制自动重新加载
+        self.crash_times = []
+
+    @property
+    def secure(self):
+        return self.url.scheme() == "https"
+
+
+class UiRefresher(QObject):
+    """把当前标签页的状态应用到界面
+
+    状态变化只标记为待刷新，同一帧内的多次变化合并为一次刷新；
+    后台标签页的变化直接忽略，切换标签页时再读取其最新状态。
+    """
+
+    def __init__(self, tab_widget, apply, parent=None):
+        super().__init__(parent)
+        self.tab_widget = tab_widget
+        # apply(browser, state, switched)
+        self.apply = apply
+        self.switched = True
+        self.refresh_count = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(FRAME_MS)
+        self.timer.timeout.connect(self.refresh)
+
+        tab_widget.currentChanged.connect(self.tab_switched)
+        tab_widget.state_changed.connect(self.mark_dirty)
+
+    def mark_dirty(self, browser=None):
+        """某个标签页的状态变了，是当前标签页时安排下一帧刷新"""
+        if browser is not None and browser is not self.tab_widget.currentWidget():
+            return
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def tab_switched(self, index):
+        self.switched = True
+        self.mark_dirty()
+
+    def refresh(self):
+        browser = self.tab_widget.current_browser()
+        if browser is None:
+            return
+        switched, self.switched = self.switched, False
+        self.refresh_count += 1
+        self.apply(browser, browser.tab_state, switched)
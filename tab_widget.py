@@ -1,21 +1,104 @@
-from PySide2.QtWidgets import QTabWidget, QWidget, QVBoxLayout, QPushButton
+import itertools
+import time
+from collections import deque
+from PySide2.QtWidgets import QTabWidget, QWidget, QVBoxLayout, QPushButton, QLabel
 from PySide2.QtGui import QIcon
-from PySide2.QtCore import QUrl, Qt, Signal
-from PySide2.QtWebEngineWidgets import QWebEngineView
+from PySide2.QtCore import QUrl, Qt, Signal, QByteArray, QDataStream, QIODevice, QTimer
+from PySide2.QtWebEngineWidgets import QWebEnginePage, QWebEngineView
+from browser_page import BrowserPage
+from favicons import favicon_service
+from tab_state import TabState
+
+# 标签页编号，在所有窗口中唯一
+tab_ids = itertools.count(1)
+
+# 渲染进程崩溃后多久重新加载(毫秒)，以及 CRASH_WINDOW 秒内最多自动重新加载几次
+CRASH_RELOAD_DELAY_MS = 1000
+CRASH_WINDOW = 60
+MAX_CRASH_RELOADS = 3
+
+
+def serialize_history(view):
+    """把浏览器的前进/后退记录序列化为 base64 字符串，不支持时返回 None"""
+    data = QByteArray()
+    stream = QDataStream(data, QIODevice.WriteOnly)
+    try:
+        stream << view.history()
+    except TypeError:
+        return None
+    return bytes(data.toBase64()).decode()
+
+
+def restore_history(view, encoded):
+    """从 serialize_history() 的结果恢复前进/后退记录，并加载当前条目"""
+    stream = QDataStream(QByteArray.fromBase64(encoded.encode()))
+    try:
+        stream >> view.history()
+    except TypeError:
+        return False
+    return stream.status() == QDataStream.Ok
+
+
+class PlaceholderTab(QWidget):
+    """尚未创建浏览器部件的标签页，只保存 URL、标题和图标"""
+
+    def __init__(self, url, title, icon=None, state=None, parent=None):
+        super().__init__(parent)
+        self.url = url
+        self.title = title
+        self.icon = icon or QIcon()
+        # 会话恢复时附带的缩放、前进/后退记录等
+        self.state = state or {}
+        self.tab_id = next(tab_ids)
+        # 已被替换或关闭，等待删除
+        self.removed = False
+
+        layout = QVBoxLayout()
+        label = QLabel(url.toString())
+        label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(label)
+        self.setLayout(layout)
 
 
 class TabWidget(QTabWidget):
-    url_changed = Signal(QUrl)
-    title_changed = Signal(str)
-    load_progress = Signal(int)
+    # 当前标签页的显示状态(地址、标题、进度、图标)发生了变化
+    state_changed = Signal(QWidget)
+    page_loaded = Signal(QUrl, str)
+    # 某个标签页成功加载完成
+    browser_loaded = Signal(QWidget)
+    # 某个标签页的地址、标题或缩放发生了变化
+    tab_updated = Signal(QWidget)
+    # 标签页的增删、移动或切换
+    tabs_changed = Signal()
+    # 某个标签页的渲染进程异常退出: (浏览器部件, 是否自动重新加载)
+    tab_crashed = Signal(QWidget, bool)
 
-    def __init__(self, parent=None):
+    def __init__(self, profile=None, content_filter=None, page_metrics=None, user_scripts=None, parent=None):
         super().__init__(parent)
+        # 新建标签页使用的 profile，为 None 时使用默认 profile
+        self.profile = profile
+        # 请求过滤，为 None 时不拦截
+        self.content_filter = content_filter
+        # 页面加载耗时统计，为 None 时不记录
+        self.page_metrics = page_metrics
+        # 用户脚本，为 None 时不注入
+        self.user_scripts = user_scripts
         self.setTabsClosable(True)
         self.setMovable(True)
         self.setDocumentMode(True)
         self.tabCloseRequested.connect(self.close_tab)
         self.currentChanged.connect(self.tab_changed)
+        self.currentChanged.connect(lambda index: self.tabs_changed.emit())
+        self.tabBar().tabMoved.connect(lambda src, dst: self.tabs_changed.emit())
+        favicon_service().icon_ready.connect(self.favicon_ready)
+
+        # 渲染进程崩溃时自动重新加载
+        self.reload_crashed = True
+
+        # 后台预加载: 同时加载的标签页数量上限，0 表示不预加载
+        self.preload_limit = 0
+        self.preload_queue = deque()
+        self.preloading = set()
 
         # 添加新标签页按钮
         new_tab_btn = QPushButton("+")
@@ -34,41 +117,226 @@ class TabWidget(QTabWidget):
         new_tab_btn.clicked.connect(self.add_new_tab)
         self.setCornerWidget(new_tab_btn, Qt.TopRightCorner)
 
-    def add_new_tab(self, qurl=None, label="新标签页"):
-        """添加新标签页"""
-        if qurl is None:
-            qurl = QUrl("https://www.google.com")
+    def tabInserted(self, index):
+        super().tabInserted(index)
+        self.tabs_changed.emit()
+
+    def tabRemoved(self, index):
+        super().tabRemoved(index)
+        self.tabs_changed.emit()
 
+    def create_browser(self, qurl, state=None, tab_id=None, speculative=False):
+        """创建浏览器部件并连接信号
+
+        speculative 为 True 时是在屏幕外预渲染的页面，放入标签页(adopt_browser)
+        之前不记录历史和加载耗时，不发出 tab_updated，渲染进程崩溃时也不
+        自动重新加载(由 Speculator 丢弃)。
+        """
         browser = QWebEngineView()
-        browser.setUrl(qurl)
+        browser.tab_id = tab_id or next(tab_ids)
+        browser.speculative = speculative
+        browser.tab_state = TabState(qurl)
+        browser.tab_state.icon = favicon_service().icon(qurl)
+        if self.profile is not None:
+            browser.setPage(BrowserPage(self.profile, browser))
+        else:
+            browser.setPage(BrowserPage(browser))
+        if self.content_filter is not None:
+            self.content_filter.install(browser)
+        if not speculative:
+            self.attach_tab(browser)
+        if self.user_scripts is not None:
+            self.user_scripts.install(browser)
+
+        state = state or {}
+        if not (state.get("history") and restore_history(browser, state["history"])):
+            browser.setUrl(qurl)
+        if "zoom" in state:
+            browser.setZoomFactor(state["zoom"])
+
+        # 连接信号，标签页的变化先写入它自己的状态
+        browser.urlChanged.connect(lambda url: self.update_state(browser, url=url, icon=favicon_service().icon(url)))
+        browser.titleChanged.connect(lambda title: self.update_state(browser, title=title))
+        # 页面的图标交给图标服务，之后通过 favicon_ready 显示共享的图标
+        browser.iconChanged.connect(lambda icon: favicon_service().set_icon(browser.url(), icon))
+        browser.loadStarted.connect(lambda: self.update_state(browser, loading=True, progress=0, load_time_ms=None,
+                                                              crashed=False))
+        browser.loadProgress.connect(lambda progress: self.update_state(browser, progress=progress))
+        browser.loadFinished.connect(lambda ok: self.update_state(browser, loading=False, progress=100))
+        browser.loadFinished.connect(lambda ok: ok and not browser.speculative and self.loaded(browser))
+        return browser
+
+    def attach_tab(self, browser):
+        """开始记录标签页的加载耗时、变化和崩溃，预渲染的页面在放入标签页时才调用"""
+        if self.page_metrics is not None:
+            self.page_metrics.attach(browser)
+        browser.page().renderProcessTerminated.connect(
+            lambda status, exit_code: self.render_process_terminated(browser, status))
+        browser.urlChanged.connect(lambda q: self.tab_updated.emit(browser))
+        browser.titleChanged.connect(lambda title: self.tab_updated.emit(browser))
+
+    def loaded(self, browser):
+        self.page_loaded.emit(browser.url(), browser.title())
+        self.browser_loaded.emit(browser)
+
+    def adopt_browser(self, index, browser, loaded=False):
+        """用预渲染的浏览器部件替换某个标签页，loaded 表示它已经成功加载完成"""
+        old = self.widget(index)
+        browser.speculative = False
+        self.attach_tab(browser)
+        state = browser.tab_state
+
+        self.blockSignals(True)
+        self.insertTab(index, browser, state.icon, state.title or state.url.toString())
+        self.removeTab(index + 1)
+        self.setCurrentIndex(index)
+        self.blockSignals(False)
+        old.deleteLater()
+
+        self.currentChanged.emit(index)
+        self.tab_updated.emit(browser)
+        if loaded:
+            self.loaded(browser)
+
+    def render_process_terminated(self, browser, status):
+        """渲染进程异常退出时自动重新加载，短时间内反复崩溃时不再重试"""
+        if status == QWebEnginePage.NormalTerminationStatus:
+            return
+        state = browser.tab_state
+        now = time.monotonic()
+        state.crash_times = [t for t in state.crash_times if now - t < CRASH_WINDOW] + [now]
+        state.crash_count += 1
+        self.update_state(browser, loading=False, crashed=True)
+
+        reload = self.reload_crashed and len(state.crash_times) <= MAX_CRASH_RELOADS
+        if reload:
+            QTimer.singleShot(CRASH_RELOAD_DELAY_MS, browser.reload)
+        self.tab_crashed.emit(browser, reload)
+
+    def update_state(self, browser, **changes):
+        """更新标签页的状态，只有当前标签页的变化才通知界面"""
+        state = browser.tab_state
+        for name, value in changes.items():
+            setattr(state, name, value)
+
+        if "title" in changes or "icon" in changes:
+            index = self.indexOf(browser)
+            if index >= 0:
+                self.setTabText(index, state.title or state.url.toString())
+                self.setTabIcon(index, state.icon)
+
+        if browser is self.currentWidget():
+            self.state_changed.emit(browser)
+
+    def favicon_ready(self, host):
+        """某个网站的图标加载完成，更新该网站的所有标签页"""
+        icon = favicon_service().cached(host)
+        for index in range(self.count()):
+            widget = self.widget(index)
+            if isinstance(widget, PlaceholderTab):
+                if widget.url.host().lower() == host:
+                    widget.icon = icon
+                    self.setTabIcon(index, icon)
+            elif widget.tab_state.url.host().lower() == host:
+                self.update_state(widget, icon=icon)
+
+    def add_new_tab(self, qurl=None, label="新标签页", lazy=False, icon=None, state=None):
+        """添加新标签页
+
+        lazy 为 True 时只添加占位标签页，第一次切换到该标签页时才创建浏览器部件。
+        """
+        if not isinstance(qurl, QUrl):
+            qurl = QUrl("https://www.google.com")
 
-        # 连接信号
-        browser.urlChanged.connect(lambda q: self.url_changed.emit(q))
-        browser.titleChanged.connect(lambda title: self.title_changed.emit(title))
-        browser.loadProgress.connect(lambda p: self.load_progress.emit(p))
+        if lazy:
+            placeholder = PlaceholderTab(qurl, label, icon or favicon_service().icon(qurl), state)
+            self.addTab(placeholder, placeholder.icon, label)
+            if self.preload_limit:
+                self.preload_queue.append(placeholder)
+                self.preload_next()
+            return placeholder
+
+        browser = self.create_browser(qurl, state)
 
         # 添加标签页
-        index = self.addTab(browser, label)
+        index = self.addTab(browser, browser.tab_state.icon, label)
         self.setCurrentIndex(index)
         return browser
 
+    def materialize(self, index):
+        """把占位标签页替换为真正的浏览器部件"""
+        placeholder = self.widget(index)
+        if not isinstance(placeholder, PlaceholderTab):
+            return placeholder
+
+        browser = self.create_browser(placeholder.url, placeholder.state, placeholder.tab_id)
+        current = self.currentIndex()
+
+        # 替换过程中不发出 currentChanged，避免重复处理
+        self.blockSignals(True)
+        self.insertTab(index, browser, placeholder.icon, self.tabText(index))
+        self.removeTab(index + 1)
+        self.setCurrentIndex(current)
+        self.blockSignals(False)
+
+        placeholder.removed = True
+        if placeholder in self.preload_queue:
+            self.preload_queue.remove(placeholder)
+        placeholder.deleteLater()
+        return browser
+
+    def set_preload_limit(self, limit):
+        """设置后台同时预加载的标签页数量，0 表示不预加载"""
+        self.preload_limit = max(0, limit)
+        # 不预加载时不排队，重新开启时按标签页顺序排入所有占位标签页
+        self.preload_queue.clear()
+        if self.preload_limit:
+            self.preload_queue.extend(widget for widget in map(self.widget, range(self.count()))
+                                      if isinstance(widget, PlaceholderTab))
+        self.preload_next()
+
+    def preload_next(self):
+        """在并发上限内继续预加载排队的占位标签页"""
+        while len(self.preloading) < self.preload_limit and self.preload_queue:
+            placeholder = self.preload_queue.popleft()
+            if placeholder.removed:
+                continue
+            index = self.indexOf(placeholder)
+
+            browser = self.materialize(index)
+            self.preloading.add(browser)
+
+            def finished(ok, browser=browser):
+                browser.loadFinished.disconnect(finished)
+                self.preloading.discard(browser)
+                self.preload_next()
+            browser.loadFinished.connect(finished)
+
     def close_tab(self, index):
         """关闭标签页"""
         if self.count() < 2:
             return
 
         widget = self.widget(index)
+        if isinstance(widget, PlaceholderTab):
+            widget.removed = True
+            if widget in self.preload_queue:
+                self.preload_queue.remove(widget)
         widget.deleteLater()
         self.removeTab(index)
 
+        if widget in self.preloading:
+            self.preloading.discard(widget)
+            self.preload_next()
+
     def tab_changed(self, index):
-        """标签页切换时更新地址栏和标题"""
+        """切换到占位标签页时创建浏览器部件，界面由 UiRefresher 刷新"""
         if index >= 0:
-            browser = self.widget(index)
-            if browser:
-                self.url_changed.emit(browser.url())
-                self.title_changed.emit(browser.title())
+            self.materialize(index)
 
     def current_browser(self):
         """获取当前标签页的浏览器部件"""
-        return self.currentWidget()
\ No newline at end of file
+        widget = self.currentWidget()
+        if isinstance(widget, QWebEngineView):
+            return widget
+        return None
@@ -0,0 +1,286 @@
+import time
+from PySide2.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton,
+                               QAbstractItemView, QHeaderView, QLabel)
+from PySide2.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, Signal
+from PySide2.QtWebEngineWidgets import QWebEnginePage, QWebEngineScript, QWebEngineView
+from downloads import format_size
+from procfs import cpu_seconds, rss_bytes
+
+# 采样间隔(毫秒)
+SAMPLE_MS = 2000
+
+# 在隔离的脚本环境中统计页面的长任务(阻塞主线程超过 50 毫秒的任务)总时长
+LONG_TASKS_JS = """
+(function () {
+    if (!window.__safanLongTasks) {
+        window.__safanLongTasks = {total: 0};
+        try {
+            new PerformanceObserver(function (list) {
+                list.getEntries().forEach(function (entry) {
+                    window.__safanLongTasks.total += entry.duration;
+                });
+            }).observe({entryTypes: ["longtask"]});
+        } catch (e) {}
+    }
+    return window.__safanLongTasks.total;
+})();
+"""
+
+LIFECYCLE_NAMES = {
+    QWebEnginePage.LifecycleState.Active: "活动",
+    QWebEnginePage.LifecycleState.Frozen: "已冻结",
+    QWebEnginePage.LifecycleState.Discarded: "已丢弃",
+}
+
+
+class SampleSignals(QObject):
+    # {pid: (常驻内存, CPU 时间)}
+    sampled = Signal(dict)
+
+
+class SampleTask(QRunnable):
+    """在线程池中读取一组进程的 /proc 数据"""
+
+    def __init__(self, pids, signals):
+        super().__init__()
+        self.pids = pids
+        self.signals = signals
+
+    def run(self):
+        self.signals.sampled.emit({pid: (rss_bytes(pid), cpu_seconds(pid)) for pid in self.pids})
+
+
+class TaskManager(QObject):
+    """按标签页统计渲染进程的资源占用
+
+    每个标签页通过 renderProcessPid() 对应到渲染进程，定时在线程池中从
+    /proc 读取内存和 CPU 时间，页面中的长任务时长通过脚本统计。多个标签页
+    可能共用一个渲染进程，此时它们显示相同的进程数据。
+    """
+
+    updated = Signal()
+
+    def __init__(self, services, parent=None):
+        super().__init__(parent)
+        self.services = services
+
+        # pid -> (常驻内存, CPU 时间, 采样时间, CPU 使用率)
+        self.processes = {}
+        # tab_id -> 页面长任务总时长(毫秒)
+        self.js_blocked = {}
+
+        self.signals = SampleSignals(self)
+        self.signals.sampled.connect(self.sampled)
+        self.sampling = False
+        self.users = 0
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(SAMPLE_MS)
+        self.timer.timeout.connect(self.sample)
+
+    def start(self):
+        """开始定时采样，和 stop() 成对调用"""
+        self.users += 1
+        if not self.timer.isActive():
+            self.timer.start()
+            self.sample()
+
+    def stop(self):
+        self.users = max(0, self.users - 1)
+        if not self.users:
+            self.timer.stop()
+
+    def tabs(self):
+        """所有窗口中的 (窗口, 标签页部件)"""
+        for window in self.services.windows:
+            tab_widget = window.tab_widget
+            for index in range(tab_widget.count()):
+                yield window, tab_widget.widget(index)
+
+    def sample(self, wait=False):
+        """读取所有渲染进程的数据
+
+        默认在线程池中读取，上一次采样还没完成时跳过；wait 为 True 时直接读取。
+        """
+        pids = set()
+        for window, widget in self.tabs():
+            if not isinstance(widget, QWebEngineView):
+                continue
+            page = widget.page()
+            pids.add(page.renderProcessPid())
+            if page.lifecycleState() == QWebEnginePage.LifecycleState.Active:
+                page.runJavaScript(LONG_TASKS_JS, QWebEngineScript.ApplicationWorld,
+                                   lambda total, tab_id=widget.tab_id: self.js_sampled(tab_id, total))
+        pids.discard(0)
+
+        if wait:
+            SampleTask(pids, self.signals).run()
+        elif not self.sampling:
+            self.sampling = True
+            QThreadPool.globalInstance().start(SampleTask(pids, self.signals))
+
+    def js_sampled(self, tab_id, total):
+        if isinstance(total, (int, float)):
+            self.js_blocked[tab_id] = total
+
+    def sampled(self, samples):
+        """根据两次采样之间的 CPU 时间计算使用率"""
+        self.sampling = False
+        now = time.monotonic()
+        processes = {}
+        for pid, (rss, cpu) in samples.items():
+            percent = None
+            previous = self.processes.get(pid)
+            if previous and cpu is not None and previous[1] is not None and now > previous[2]:
+                percent = max(0.0, (cpu - previous[1]) / (now - previous[2]) * 100)
+            processes[pid] = (rss, cpu, now, percent)
+        self.processes = processes
+        self.updated.emit()
+
+    def tasks(self):
+        """每个标签页的一行统计数据"""
+        live_ids = set()
+        tasks = []
+        for window, widget in self.tabs():
+            live_ids.add(widget.tab_id)
+            task = {
+                "tab_id": widget.tab_id,
+                "window": self.services.windows.index(window),
+                "pid": 0,
+                "rss": 0,
+                "cpu_percent": None,
+                "js_blocked_ms": self.js_blocked.get(widget.tab_id, 0),
+                "crashes": 0,
+            }
+            if isinstance(widget, QWebEngineView):
+                page = widget.page()
+                state = widget.tab_state
+                pid = page.renderProcessPid()
+                rss, cpu, sampled_at, percent = self.processes.get(pid, (0, None, 0, None))
+                task.update(title=state.title or state.url.toString(), url=state.url.toString(), pid=pid,
+                            rss=rss, cpu_percent=percent, crashes=state.crash_count,
+                            state="已崩溃" if state.crashed else LIFECYCLE_NAMES.get(page.lifecycleState(), ""))
+            else:
+                task.update(title=widget.title, url=widget.url.toString(), state="未加载")
+            tasks.append(task)
+
+        # 清理已关闭的标签页
+        for tab_id in set(self.js_blocked) - live_ids:
+            del self.js_blocked[tab_id]
+        return tasks
+
+    def find_view(self, tab_id):
+        """按编号查找标签页，返回 (窗口, 浏览器部件)，未加载或不存在时返回 (None, None)"""
+        for window, widget in self.tabs():
+            if widget.tab_id == tab_id and isinstance(widget, QWebEngineView):
+                return window, widget
+        return None, None
+
+    def discard(self, tab_id):
+        """丢弃标签页以释放渲染进程的资源，当前标签页不能丢弃"""
+        window, view = self.find_view(tab_id)
+        return bool(view) and window.lifecycle_manager.discard(view)
+
+    def reload(self, tab_id):
+        """重新加载标签页，已丢弃或冻结的标签页先恢复"""
+        window, view = self.find_view(tab_id)
+        if view is None:
+            return False
+        window.lifecycle_manager.restore(view)
+        view.reload()
+        return True
+
+
+class TaskManagerWindow(QWidget):
+    """任务管理器窗口"""
+
+    headers = ["标签页", "进程", "内存", "CPU", "JS 阻塞", "状态"]
+
+    def __init__(self, task_manager, parent=None):
+        super().__init__(parent)
+        self.task_manager = task_manager
+        self.setWindowTitle("任务管理器")
+        self.resize(800, 400)
+        self.tab_ids = []
+
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(0, len(self.headers))
+        self.table.setHorizontalHeaderLabels(self.headers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        button_layout = QHBoxLayout()
+
+        self.discard_btn = QPushButton("丢弃")
+        self.discard_btn.clicked.connect(lambda: self.task_manager.discard(self.current_tab_id()))
+        button_layout.addWidget(self.discard_btn)
+
+        self.reload_btn = QPushButton("重新加载")
+        self.reload_btn.clicked.connect(lambda: self.task_manager.reload(self.current_tab_id()))
+        button_layout.addWidget(self.reload_btn)
+
+        self.close_btn = QPushButton("关闭")
+        self.close_btn.clicked.connect(self.close)
+        button_layout.addWidget(self.close_btn)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        task_manager.updated.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.task_manager.start()
+        self.refresh()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.task_manager.stop()
+        super().hideEvent(event)
+
+    def current_tab_id(self):
+        row = self.table.currentRow()
+        return self.tab_ids[row] if 0 <= row < len(self.tab_ids) else None
+
+    def refresh(self):
+        """用最新的采样结果刷新表格，保留选中的标签页"""
+        if not self.isVisible():
+            return
+        selected = self.current_tab_id()
+        tasks = self.task_manager.tasks()
+        self.tab_ids = [task["tab_id"] for task in tasks]
+
+        self.table.setRowCount(len(tasks))
+        total_rss = {}
+        for row, task in enumerate(tasks):
+            cpu = task["cpu_percent"]
+            values = [
+                task["title"],
+                str(task["pid"]) if task["pid"] else "",
+                format_size(task["rss"]) if task["rss"] else "",
+                f"{cpu:.1f}%" if cpu is not None else "",
+                f"{task['js_blocked_ms'] / 1000:.1f} 秒" if task["js_blocked_ms"] else "",
+                task["state"] + (f" (崩溃 {task['crashes']} 次)" if task["crashes"] else ""),
+            ]
+            for column, value in enumerate(values):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    if column:
+                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.table.setItem(row, column, item)
+                item.setText(value)
+            if task["pid"]:
+                total_rss[task["pid"]] = task["rss"]
+
+        if selected in self.tab_ids:
+            self.table.selectRow(self.tab_ids.index(selected))
+        self.summary_label.setText(f"{len(tasks)} 个标签页，{len(total_rss)} 个渲染进程，"
+                                   f"共 {format_size(sum(total_rss.values()))}")
@@ -0,0 +1,188 @@
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+# 默认的卡顿阈值(毫秒)
+STALL_MS = 100
+
+# 界面线程的心跳间隔(毫秒)，必须远小于卡顿阈值
+HEARTBEAT_MS = 20
+
+# 短于这个时间的回调不记录(秒)
+MIN_SLOT_SECONDS = 50e-6
+
+# 最多保留的事件数，超过后丢弃最早的事件
+MAX_EVENTS = 500000
+
+# 一次卡顿最多保存几个不同的调用栈
+MAX_STACKS = 10
+
+# 调用栈中的标记: 正在执行 Qt 的函数或其他 C 函数
+QT_CALL = object()
+C_CALL = object()
+
+
+def is_qt_function(func):
+    """是否为 PySide2 对象或类的方法"""
+    owner = getattr(func, "__self__", None)
+    if owner is None:
+        return False
+    cls = owner if isinstance(owner, type) else type(owner)
+    return getattr(cls, "__module__", "").startswith("PySide2")
+
+
+class Tracer:
+    """界面线程的跟踪
+
+    启用后通过 sys.setprofile 记录 Qt 直接调用的每个 Python 函数(槽、
+    事件处理函数和定时器回调)的耗时；看门狗线程检查界面线程的心跳，
+    超过卡顿阈值没有心跳时采样界面线程的 Python 调用栈。停止时写成
+    Chrome 跟踪格式的 JSON，可以在 chrome://tracing 或 Perfetto 中打开。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.stall_ms = STALL_MS
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.tid = threading.get_native_id()
+        self.main_thread = threading.main_thread().ident
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.names = {}
+
+        # 界面线程上的调用栈: 正在计时的回调为 (代码, 开始时间)，其他 Python 函数为 None
+        self.stack = []
+
+        self.lock = threading.Lock()
+        self.last_beat = self.origin
+        # 正在发生的卡顿: {"start": 最后一次心跳的时间, "stacks": [调用栈, ...]}
+        self.stall = None
+        self.stall_count = 0
+        self.watchdog = None
+        self.stopping = threading.Event()
+
+    def start(self, path, stall_ms=STALL_MS):
+        """开始跟踪，需在界面线程中调用"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.path = path
+        self.stall_ms = stall_ms
+        self.last_beat = time.perf_counter()
+        sys.setprofile(self.profile)
+        self.watchdog = threading.Thread(target=self.watch, name="stall watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        """停止跟踪并写入文件"""
+        if not self.enabled:
+            return
+        sys.setprofile(None)
+        self.stopping.set()
+        self.watchdog.join()
+        self.enabled = False
+        self.write()
+        print(f"跟踪数据已写入 {self.path}，界面线程卡顿 {self.stall_count} 次", file=sys.stderr)
+
+    def add(self, name, category, start, end, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": self.tid,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def slot_name(self, code):
+        name = self.names.get(code)
+        if name is None:
+            qualname = getattr(code, "co_qualname", code.co_name)
+            name = self.names[code] = f"{qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return name
+
+    def profile(self, frame, event, arg):
+        stack = self.stack
+        if event == "call":
+            # 由 Qt 调用的 Python 函数，即槽或事件处理函数
+            if not stack or stack[-1] is QT_CALL:
+                stack.append((frame.f_code, time.perf_counter()))
+            else:
+                stack.append(None)
+        elif event == "return":
+            if not stack:
+                return
+            item = stack.pop()
+            if isinstance(item, tuple):
+                code, start = item
+                end = time.perf_counter()
+                if end - start >= MIN_SLOT_SECONDS:
+                    self.add(self.slot_name(code), "slot", start, end)
+        elif event == "c_call":
+            stack.append(QT_CALL if is_qt_function(arg) else C_CALL)
+        elif stack:
+            stack.pop()
+
+    @contextmanager
+    def span(self, name, category="operation"):
+        """记录一段操作的耗时"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.perf_counter())
+
+    def beat(self):
+        """界面线程的心跳，由定时器调用；卡顿结束时记录其持续时间和调用栈"""
+        now = time.perf_counter()
+        with self.lock:
+            stall, self.stall = self.stall, None
+            self.last_beat = now
+        if stall:
+            self.stall_count += 1
+            self.add("界面线程卡顿", "stall", stall["start"], now, {"stacks": stall["stacks"]})
+            print(f"界面线程卡顿 {(now - stall['start']) * 1000:.0f} ms", file=sys.stderr)
+
+    def watch(self):
+        """看门狗线程: 心跳超时时采样界面线程的调用栈"""
+        interval = self.stall_ms / 1000 / 4
+        while not self.stopping.wait(interval):
+            last = self.last_beat
+            if (time.perf_counter() - last) * 1000 < self.stall_ms:
+                continue
+            frame = sys._current_frames().get(self.main_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            with self.lock:
+                # 采样期间心跳已恢复
+                if last != self.last_beat:
+                    continue
+                if self.stall is None:
+                    self.stall = {"start": last, "stacks": []}
+                stacks = self.stall["stacks"]
+                if stack not in stacks and len(stacks) < MAX_STACKS:
+                    stacks.append(stack)
+
+    def write(self):
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "SaFan"}},
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": self.tid, "args": {"name": "界面线程"}},
+        ]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+# 全局实例，在 main 中通过 --trace 启用
+tracer = Tracer()
@@ -0,0 +1,269 @@
+import json
+import os
+import sys
+from collections import OrderedDict
+from PySide2.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, Signal
+from PySide2.QtWebEngineWidgets import QWebEngineScript
+from script_index import ScriptIndex, load_scripts
+from settings import settings
+from storage import data_path
+
+INJECTION_POINTS = {
+    "document-start": QWebEngineScript.DocumentCreation,
+    "document-end": QWebEngineScript.DocumentReady,
+    "document-idle": QWebEngineScript.Deferred,
+}
+
+WORLDS = {
+    "main": QWebEngineScript.MainWorld,
+    "isolated": QWebEngineScript.ApplicationWorld,
+}
+
+# 缓存元素隐藏样式的主机数
+COSMETIC_CACHE_SIZE = 256
+
+# 脚本目录变化后等待这么久再重新读取(毫秒)
+RELOAD_DELAY_MS = 500
+
+# 每个脚本执行完后把耗时累加到所在环境的 window.__safanScriptTimings
+TIMING_PREFIX = "(function () {\nvar __safanStart = performance.now();\ntry {\n"
+TIMING_SUFFIX = """
+} finally {
+    var timings = window.__safanScriptTimings = window.__safanScriptTimings || {};
+    timings[%s] = (timings[%s] || 0) + performance.now() - __safanStart;
+}
+})();"""
+
+# 取出并清空页面中累计的脚本耗时
+COLLECT_TIMINGS_JS = """
+(function () {
+    var timings = window.__safanScriptTimings || {};
+    window.__safanScriptTimings = {};
+    return timings;
+})();
+"""
+
+STYLE_JS = """
+(function () {
+    var style = document.createElement("style");
+    style.textContent = %s;
+    var root = document.head || document.documentElement;
+    if (root) {
+        root.appendChild(style);
+    } else {
+        document.addEventListener("DOMContentLoaded", function () { document.head.appendChild(style); });
+    }
+})();
+"""
+
+
+def timed_source(key, source):
+    key = json.dumps(key)
+    return TIMING_PREFIX + source + TIMING_SUFFIX % (key, key)
+
+
+class ScriptLoader(QThread):
+    """在后台线程中读取脚本目录并建立索引"""
+
+    loaded = Signal(object)
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+
+    def run(self):
+        self.loaded.emit(load_scripts(self.directory))
+
+
+class UserScriptManager(QObject):
+    """用户脚本、用户样式和元素隐藏规则，所有标签页共用
+
+    脚本放在应用数据目录的 userscripts 文件夹中，启动时在后台建立按主机
+    索引的脚本表，文件夹变化时重新读取。每次主框架导航时只把匹配目标网址
+    的脚本放进该页面的脚本集合；编译好的 QWebEngineScript 按脚本缓存。
+    适用于所有主机的元素隐藏规则在读取后编译成一个共用的样式，主机专用的
+    规则按主机缓存，都由所有标签页共用。每个脚本的执行耗时在页面中累计，
+    离开页面或加载完成时取回。
+    """
+
+    loaded = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.enabled = settings.bool_value("userscripts/enabled", True)
+        self.directory = data_path("userscripts")
+        self.index = ScriptIndex()
+        self.loader = None
+        self.reload_pending = False
+        # 每次重新读取加一，写进脚本名称，标签页据此换上新版本的脚本
+        self.generation = 0
+
+        # 脚本编号 -> QWebEngineScript
+        self.compiled = {}
+        # 适用于所有主机的元素隐藏样式，每次读取后编译一次，没有规则时为 None
+        self.generic_cosmetic = None
+        # 主机 -> 该主机专用的元素隐藏 QWebEngineScript，没有规则时为 None
+        self.cosmetic_scripts = OrderedDict()
+        # 文件名 -> [执行次数, 总耗时, 最长耗时]
+        self.timings = {}
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_reload)
+        self.watcher.fileChanged.connect(self.schedule_reload)
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(RELOAD_DELAY_MS)
+        self.reload_timer.timeout.connect(self.load)
+
+        # 读取脚本不在启动的关键路径上
+        QTimer.singleShot(0, self.load)
+
+    def schedule_reload(self, path=""):
+        self.reload_timer.start()
+
+    def load(self):
+        """在后台重新读取脚本目录"""
+        if self.loader is not None:
+            self.reload_pending = True
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.loader = ScriptLoader(self.directory, self)
+        self.loader.loaded.connect(self.index_loaded)
+        self.loader.finished.connect(self.loader_finished)
+        self.loader.start()
+
+    def index_loaded(self, index):
+        self.index = index
+        self.generation += 1
+        self.compiled.clear()
+        self.generic_cosmetic = self.style_script("*", index.generic_selectors)
+        self.cosmetic_scripts.clear()
+        self.timings.clear()
+        for path, error in index.errors:
+            print(f"用户脚本 {path}: {error}", file=sys.stderr)
+
+        # 监视目录本身(增删文件)和其中的每个文件(修改内容)
+        watched = self.watcher.files() + self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        self.watcher.addPaths([self.directory] + [path for path in paths if os.path.isfile(path)])
+        self.loaded.emit()
+
+    def loader_finished(self):
+        self.loader.deleteLater()
+        self.loader = None
+        if self.reload_pending:
+            self.reload_pending = False
+            self.load()
+
+    def set_enabled(self, enabled):
+        """启用或停用，对之后的导航生效"""
+        self.enabled = enabled
+        settings.set_value("userscripts/enabled", enabled)
+
+    def compile(self, script):
+        """脚本对应的 QWebEngineScript，第一次使用时创建"""
+        compiled = self.compiled.get(script.id)
+        if compiled is None:
+            source = STYLE_JS % json.dumps(script.source) if script.kind == "css" else script.source
+            compiled = QWebEngineScript()
+            compiled.setName(f"safan-userscript-{self.generation}-{script.id}")
+            compiled.setSourceCode(timed_source(os.path.basename(script.path), source))
+            compiled.setInjectionPoint(INJECTION_POINTS[script.run_at])
+            # 样式表不需要访问页面的脚本
+            compiled.setWorldId(WORLDS["isolated" if script.kind == "css" else script.world])
+            compiled.setRunsOnSubFrames(False)
+            self.compiled[script.id] = compiled
+        return compiled
+
+    def style_script(self, name, selectors):
+        """隐藏 selectors 所选元素的 QWebEngineScript，没有选择器时返回 None"""
+        if not selectors:
+            return None
+        # 每个选择器单独一条规则，一个无效的选择器不影响其他规则
+        css = "\n".join(f"{selector} {{ display: none !important; }}" for selector in selectors)
+        compiled = QWebEngineScript()
+        compiled.setName(f"safan-cosmetic-{self.generation}-{name}")
+        compiled.setSourceCode(STYLE_JS % json.dumps(css))
+        compiled.setInjectionPoint(QWebEngineScript.DocumentCreation)
+        compiled.setWorldId(QWebEngineScript.ApplicationWorld)
+        compiled.setRunsOnSubFrames(False)
+        return compiled
+
+    def cosmetic_script(self, host):
+        """主机专用的元素隐藏样式，没有规则时返回 None"""
+        if host in self.cosmetic_scripts:
+            self.cosmetic_scripts.move_to_end(host)
+            return self.cosmetic_scripts[host]
+
+        compiled = self.style_script(host, self.index.selectors(host))
+        self.cosmetic_scripts[host] = compiled
+        if len(self.cosmetic_scripts) > COSMETIC_CACHE_SIZE:
+            self.cosmetic_scripts.popitem(last=False)
+        return compiled
+
+    def install(self, browser):
+        """在标签页的每次主框架导航之前更换脚本"""
+        browser.user_scripts = []
+        browser.page().navigation_requested.connect(lambda url, navigation_type: self.attach(browser, url))
+        browser.loadFinished.connect(lambda ok: self.collect_timings(browser))
+
+    def attach(self, browser, url):
+        """把匹配网址的脚本放进页面的脚本集合，和当前的脚本相同时不做改动"""
+        self.collect_timings(browser)
+        scripts = []
+        if self.enabled:
+            url_text = url.toString()
+            cosmetic = [self.generic_cosmetic, self.cosmetic_script(url.host().lower())]
+            scripts = [script for script in cosmetic if script is not None]
+            scripts += [self.compile(script) for script in self.index.match(url_text)]
+
+        if [s.name() for s in scripts] == [s.name() for s in browser.user_scripts]:
+            return
+        collection = browser.page().scripts()
+        for script in browser.user_scripts:
+            collection.remove(script)
+        for script in scripts:
+            collection.insert(script)
+        browser.user_scripts = scripts
+
+    def collect_timings(self, browser):
+        """取回页面中累计的脚本耗时"""
+        worlds = {script.worldId() for script in browser.user_scripts
+                  if script.name().startswith("safan-userscript-")}
+        for world in worlds:
+            browser.page().runJavaScript(COLLECT_TIMINGS_JS, world, self.timings_collected)
+
+    def timings_collected(self, timings):
+        if not isinstance(timings, dict):
+            return
+        for name, elapsed in timings.items():
+            if not isinstance(elapsed, (int, float)):
+                continue
+            record = self.timings.setdefault(name, [0, 0.0, 0.0])
+            record[0] += 1
+            record[1] += elapsed
+            record[2] = max(record[2], elapsed)
+
+    def stats(self):
+        """每个脚本的执行次数和耗时(毫秒)"""
+        scripts = []
+        for script in self.index.scripts:
+            name = os.path.basename(script.path)
+            runs, total, longest = self.timings.get(name, (0, 0.0, 0.0))
+            scripts.append({
+                "name": script.name,
+                "file": name,
+                "run_at": script.run_at,
+                "runs": runs,
+                "total_ms": round(total, 3),
+                "mean_ms": round(total / runs, 3) if runs else 0.0,
+                "max_ms": round(longest, 3),
+            })
+        return {
+            "enabled": self.enabled,
+            "scripts": scripts,
+            "cosmetic_rules": self.index.cosmetic_count,
+            "errors": [f"{path}: {error}" for path, error in self.index.errors],
+        }
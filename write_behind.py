@@ -0,0 +1,404 @@
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from tracing import tracer
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+# 每个写入者(进程)一个日志，各自记录已提交的序号
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS write_behind_slots (
+    slot INTEGER PRIMARY KEY,
+    applied_seq INTEGER NOT NULL
+);
+"""
+
+ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+# 界面线程等待提交的默认超时(秒)
+FLUSH_TIMEOUT = 5
+
+# 提交失败后重试的间隔(秒)，每次失败加倍
+MIN_RETRY_SECONDS = 0.1
+MAX_RETRY_SECONDS = 5
+
+
+def journal_path(path, slot):
+    return path + "-pending" if slot == 0 else f"{path}-pending-{slot}"
+
+
+def journal_slots(path):
+    """数据库已有的全部日志的编号"""
+    prefix = os.path.basename(path) + "-pending"
+    slots = set()
+    try:
+        names = os.listdir(os.path.dirname(path) or ".")
+    except OSError:
+        return slots
+    for name in names:
+        if name == prefix:
+            slots.add(0)
+        elif name.startswith(prefix + "-") and name[len(prefix) + 1:].isdigit():
+            slots.add(int(name[len(prefix) + 1:]))
+    return slots
+
+
+def lock_exclusive(path):
+    """不等待地独占锁定文件，返回打开的文件，已被其他进程锁定时返回 None
+
+    进程退出(包括崩溃)时锁自动释放。平台不支持文件锁时总是成功。
+    """
+    f = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def entry_size(entry):
+    """一条日志记录包含的语句数"""
+    return len(entry["rows"]) if "rows" in entry else 1
+
+
+def is_transient(error):
+    """数据库被其他连接锁住等暂时性的错误，稍后重试可能成功"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class WriteBehind:
+    """在后台线程中批量执行数据库写入
+
+    execute() 只把语句放入队列并追加到日志文件，立即返回；后台线程每隔
+    interval_ms 毫秒或积累 batch_size 条语句时在一个事务中执行，
+    executemany() 放入的一组语句总是在同一个事务中执行。
+    日志记录了尚未提交的语句，进程崩溃后下次打开同一数据库时先重放，
+    已提交的序号记录在数据库中，不会重复执行。数据库暂时无法写入时整批
+    回滚，间隔逐渐加长地重试，提交成功之前不清空日志。
+
+    多个进程(--new-instance)可以同时打开同一数据库: 每个写入者锁定一个
+    编号的日志(<db>-pending、<db>-pending-1 ...)，序号和已提交的序号按
+    编号分开记录。打开时顺便重放锁已经释放、即所属进程已经退出的其他日志。
+    """
+
+    def __init__(self, path, interval_ms=500, batch_size=200):
+        self.path = path
+        self.slot, self.slot_lock = self._claim_slot()
+        self.journal_path = journal_path(path, self.slot)
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+
+        # 计数器，由 stats() 读取
+        self.max_depth = 0
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = ""
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.applied_seq, pending = self._recover()
+        self.seq = pending[-1]["seq"] if pending else self.applied_seq
+        # 启动时没能重放的记录交给后台线程重试
+        for entry in pending:
+            self.queue.put(entry)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+
+        self.thread = threading.Thread(target=self._run, name=f"write-behind {os.path.basename(path)}", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _claim_slot(self):
+        """锁定第一个没有被其他写入者占用的日志编号"""
+        slot = 0
+        while True:
+            lock = lock_exclusive(journal_path(self.path, slot) + ".lock")
+            if lock is not None:
+                return slot, lock
+            slot += 1
+
+    def _recover(self):
+        """重放上次退出时没有提交的语句
+
+        返回 (本日志已提交的最大序号, 没能重放的记录)；重放失败时日志保持不变。
+        """
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            # 其他进程崩溃后留下的日志，所属进程仍在运行时锁定失败，跳过
+            for slot in sorted(journal_slots(self.path) - {self.slot}):
+                lock = lock_exclusive(journal_path(self.path, slot) + ".lock")
+                if lock is not None:
+                    try:
+                        self._replay(conn, slot)
+                    finally:
+                        lock.close()
+            return self._replay(conn, self.slot)
+        finally:
+            conn.close()
+
+    def _applied(self, conn, slot):
+        """某个日志已提交的最大序号"""
+        try:
+            # 只读查询在其他连接写入时也能进行
+            row = conn.execute("SELECT applied_seq FROM write_behind_slots WHERE slot = ?", (slot,)).fetchone()
+        except sqlite3.OperationalError:
+            conn.executescript(STATE_SCHEMA)
+            row = None
+        return row[0] if row else 0
+
+    def _replay(self, conn, slot):
+        """重放一个日志中尚未提交的记录，返回 (已提交的最大序号, 没能重放的记录)"""
+        path = journal_path(self.path, slot)
+        applied = self._applied(conn, slot)
+        entries = []
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # 崩溃时只写了一半的最后一行
+                        break
+        except OSError:
+            pass
+
+        pending = [entry for entry in entries if entry["seq"] > applied]
+        try:
+            for entry in pending:
+                self._apply(conn, entry)
+            if pending:
+                conn.execute("INSERT OR REPLACE INTO write_behind_slots (slot, applied_seq) VALUES (?, ?)",
+                             (slot, pending[-1]["seq"]))
+            conn.commit()
+            applied = pending[-1]["seq"] if pending else applied
+            pending = []
+        except sqlite3.Error as e:
+            self._error(e)
+            conn.rollback()
+
+        # 日志只保留没能重放的记录，同时去掉崩溃时写了一半的行
+        if entries or slot == self.slot:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(ENCODER.encode(entry) + "\n" for entry in pending)
+        return applied, pending
+
+    def _error(self, error):
+        self.errors += 1
+        self.last_error = str(error)
+        print(f"写入 {self.path} 失败: {error}", file=sys.stderr)
+
+    def _execute(self, conn, sql, params):
+        """执行一条语句，跳过违反约束等无法重试的语句，暂时性的错误交给调用者重试整批"""
+        try:
+            conn.execute(sql, params)
+        except sqlite3.Error as e:
+            if is_transient(e):
+                raise
+            self._error(e)
+
+    def _apply(self, conn, entry):
+        """执行一条日志记录；一组语句出错时逐条重试，只跳过出错的语句"""
+        if "params" in entry:
+            self._execute(conn, entry["sql"], entry["params"])
+            return
+        # 保存点必须在事务之内，否则释放时会直接提交
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT write_group")
+        try:
+            conn.executemany(entry["sql"], entry["rows"])
+        except sqlite3.Error as e:
+            if is_transient(e):
+                raise
+            conn.execute("ROLLBACK TO write_group")
+            for params in entry["rows"]:
+                self._execute(conn, entry["sql"], params)
+        conn.execute("RELEASE write_group")
+
+    def _append(self, entry):
+        """把一条记录放入队列并追加到日志，需持有 self.lock"""
+        # 写到操作系统的缓存即可，进程崩溃不会丢失
+        self.journal.write(ENCODER.encode(entry) + "\n")
+        self.journal.flush()
+        self.queue.put(entry)
+
+    def execute(self, sql, params=()):
+        """把一条写入语句放入队列"""
+        with self.lock:
+            self.seq += 1
+            self._append({"seq": self.seq, "sql": sql, "params": list(params)})
+        self.max_depth = max(self.max_depth, self.depth())
+
+    def executemany(self, sql, rows):
+        """把一组写入语句作为一条记录放入队列，在同一个事务中执行"""
+        rows = [list(params) for params in rows]
+        if not rows:
+            return
+        with self.lock:
+            # 一组语句只记录最后一条的序号，整组与序号一起提交
+            self.seq += len(rows)
+            self._append({"seq": self.seq, "sql": sql, "rows": rows})
+        self.max_depth = max(self.max_depth, self.depth())
+
+    def flush(self, timeout=None):
+        """立即提交队列中的全部语句并等待完成
+
+        返回是否在超时之前提交成功；提交失败时立即返回 False，语句留在队列和日志中稍后重试。
+        """
+        done = threading.Event()
+        done.ok = False
+        self.queue.put(done)
+        with tracer.span(f"等待写入 {os.path.basename(self.path)}"):
+            return done.wait(timeout) and done.ok
+
+    def close(self):
+        """提交剩余的语句并结束后台线程
+
+        只尝试提交一次(最多等待 5 秒的数据库锁)，没有提交的语句留在日志中，下次打开时重放。
+        """
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.journal.close()
+        self.slot_lock.close()
+
+    def depth(self):
+        """队列中尚未提交的语句数"""
+        return self.seq - self.applied_seq
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth(),
+            "max_queue_depth": self.max_depth,
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+        }
+
+    def _collect(self, batch, waiters, timeout):
+        """从队列中取出一批记录，timeout 秒内没有新记录时返回；返回是否要求退出"""
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        size = sum(entry_size(entry) for entry in batch)
+        deadline = time.monotonic() + self.interval
+        # 凑满一批、到达间隔、有人等待提交或要求退出时写入
+        while True:
+            if item is None:
+                return True
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                batch.append(item)
+                size += entry_size(item)
+            if waiters or size >= self.batch_size:
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                return False
+
+    def _run(self):
+        conn = None
+        batch = []
+        # 上次提交失败后等待重试的秒数，成功时为 None
+        retry = None
+        stopping = False
+        while True:
+            waiters = []
+            if not stopping:
+                stopping = self._collect(batch, waiters, retry)
+            ok = False
+            try:
+                if conn is None:
+                    conn = self._connect()
+                if batch:
+                    self._commit(conn, batch)
+                    batch = []
+                ok = True
+                retry = None
+            except sqlite3.Error as e:
+                self._error(e)
+                retry = min(MAX_RETRY_SECONDS, retry * 2) if retry else MIN_RETRY_SECONDS
+            finally:
+                for waiter in waiters:
+                    waiter.ok = ok
+                    waiter.set()
+
+            if stopping:
+                if batch:
+                    print(f"{self.path}: {sum(entry_size(entry) for entry in batch)} 条语句没有提交，"
+                          f"下次启动时重放", file=sys.stderr)
+                break
+        if conn is not None:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        """在一个事务中执行一批记录，失败时回滚并抛出异常，已提交的序号和日志不变"""
+        start = time.perf_counter()
+        seq = batch[-1]["seq"]
+        try:
+            for entry in batch:
+                self._apply(conn, entry)
+            conn.execute("INSERT OR REPLACE INTO write_behind_slots (slot, applied_seq) VALUES (?, ?)",
+                         (self.slot, seq))
+            conn.commit()
+        except sqlite3.Error:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            raise
+        self.applied_seq = seq
+
+        # 全部提交后清空日志
+        with self.lock:
+            if self.seq == self.applied_seq:
+                self.journal.truncate(0)
+                self.journal.seek(0)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.written += sum(entry_size(entry) for entry in batch)
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.total_flush_ms += elapsed